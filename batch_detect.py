@@ -0,0 +1,221 @@
+"""
+Runs a trained leprechaun model over image directories, globs and video files without a display, writing the
+detections for each frame as JSON Lines
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+import cv2
+from visual_object import Leprechaun
+from data_sample import set_tiles
+from frame_capture import VideoReader
+import metrics
+
+VIDEO_EXTENSIONS = {'.avi', '.mp4', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv', '.webm'}
+
+worker_model = None  # Model loaded once in each worker process
+worker_size = None  # Working resolution of each worker process
+worker_levels = 0  # Pyramid levels of each worker process
+
+
+def init_worker(model_file, size, levels=0, tiles=1, metrics_interval=None):
+    """
+    Loads the model in a worker process
+    :param model_file: Model file to load
+    :param size: Width and height to process frames at, None to keep their own resolution
+    :param levels: Pyramid levels to find candidate regions at, 0 to process frames in full
+    :param tiles: Horizontal strips to binarize frames in, each on its own thread
+    :param metrics_interval: Seconds between log lines of per-stage metrics, None to not record them
+    :return: None
+    """
+    global worker_model, worker_size, worker_levels
+    set_tiles(tiles)
+    if metrics_interval is not None:
+        logging.basicConfig(format=f"%(asctime)s worker {os.getpid()} %(message)s", level=logging.INFO)
+        metrics.enable(log_interval=metrics_interval)
+    worker_model = Leprechaun(model_file)
+    worker_size = size
+    worker_levels = levels
+
+
+def is_video(filename):
+    """
+    Checks if a file is a video by its extension
+    :param filename: File to check
+    :return: True for video files
+    """
+    return os.path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+
+def find_inputs(inputs):
+    """
+    Expands directories and globs into a sorted list of files
+    :param inputs: Directories, glob patterns or files
+    :return: List of files
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += sorted(os.path.join(item, name) for name in os.listdir(item)
+                            if os.path.isfile(os.path.join(item, name)))
+        elif glob.has_magic(item):
+            files += sorted(glob.glob(item))
+        else:
+            files.append(item)
+    return files
+
+
+def generate_tasks(files, step=1):
+    """
+    Generates a task for every image and every step-th video frame. Images are read by the workers, video
+    frames are decoded here, ahead of the workers on a background thread
+    :param files: Files to process
+    :param step: Process every step-th frame of videos
+    :return: Generator of source, frame number, frame (None for images) and error (None if there is none)
+    """
+    for filename in files:
+        if not is_video(filename):
+            yield filename, 0, None, None
+            continue
+        try:
+            reader = VideoReader(filename, step)
+        except IOError:
+            yield filename, 0, None, "Could not open video"
+            continue
+        for frame_number, frame in reader.frames():
+            yield filename, frame_number, frame, None
+        reader.release()
+
+
+def describe_contour(contour):
+    """
+    Converts a found contour to JSON types
+    :param contour: Found contour from ComponentSample
+    :return: Dictionary of centroid, orientation and size
+    """
+    return {'centroid': [int(v) for v in contour['centroid']], 'orientation': float(contour['orientation']),
+            'size': float(contour['size'])}
+
+
+def detect_frame(model, frame, size, levels=0):
+    """
+    Runs detection on a frame
+    :param model: Leprechaun model
+    :param frame: BGR frame
+    :param size: Width and height to process the frame at, None to keep its own resolution
+    :param levels: Pyramid levels to find candidate regions at, 0 to process the frame in full
+    :return: Dictionary of found components and leprechauns
+    """
+    frame_started = metrics.start()
+    bgr_frame = frame if size is None else cv2.resize(frame, size)
+    hsv_frame = cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2HSV)
+    metrics.stop(frame_started, 'convert', hsv_frame)
+    if levels > 0:
+        model.find_components_in_regions(hsv_frame, model.find_candidate_regions(hsv_frame, levels))
+    else:
+        model.find_components(hsv_frame)
+    components = {name: [describe_contour(contour) for contour in component.found_contours]
+                  for name, component in model.components.items()}
+    leprechauns = []
+    for detection in model.find_leprechauns():
+        matches = dict()
+        for component, contour in detection['matches']:
+            matches.setdefault(component.component_name, []).append(describe_contour(contour))
+        leprechauns.append({'shirt': describe_contour(detection['shirt']),
+                            'beard': describe_contour(detection['beard']), 'matches': matches})
+    metrics.stop(frame_started, 'frame')
+    metrics.frame_done()
+    return {'components': components, 'leprechauns': leprechauns}
+
+
+def process_task(task):
+    """
+    Processes a task in a worker process
+    :param task: Source, frame number, frame (None to read the source as an image) and error (None if there is
+    none)
+    :return: Dictionary to write as a JSON line
+    """
+    source, frame_number, frame, error = task
+    record = {'source': source, 'frame': frame_number}
+    if error is not None:
+        record['error'] = error
+        return record
+    if frame is None:
+        frame = cv2.imread(source)
+    if frame is None:
+        record['error'] = "Could not read image"
+        return record
+    record.update(detect_frame(worker_model, frame, worker_size, worker_levels))
+    return record
+
+
+def run_batch(inputs, model_file, output, workers=None, step=1, size=(640, 360), levels=0, tiles=1,
+              metrics_interval=None):
+    """
+    Runs detection over all inputs in a process pool, streaming results in input order
+    :param inputs: Directories, glob patterns, images or videos
+    :param model_file: Model file to load
+    :param output: File object to write JSON lines to
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param step: Process every step-th frame of videos
+    :param size: Width and height to process frames at, None to keep their own resolution
+    :param levels: Pyramid levels to find candidate regions at, 0 to process frames in full
+    :param tiles: Horizontal strips each worker binarizes frames in, each on its own thread
+    :param metrics_interval: Seconds between each worker's log lines of per-stage metrics, None to not record them
+    :return: Number of frames processed and seconds taken
+    """
+    files = find_inputs(inputs)
+    start = time.perf_counter()
+    frames = 0
+    with Pool(workers, initializer=init_worker, initargs=(model_file, size, levels, tiles, metrics_interval)) as pool:
+        for record in pool.imap(process_task, generate_tasks(files, step), chunksize=4):
+            output.write(json.dumps(record) + "\n")
+            frames += 1
+    return frames, time.perf_counter() - start
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('inputs', nargs='+', help="Image directories, globs, images or video files")
+    parser.add_argument('-m', '--model', default="leprechaun.model", help="Model file to load")
+    parser.add_argument('-o', '--output', help="File to write JSON lines to, defaults to stdout")
+    parser.add_argument('-j', '--workers', type=int, help="Number of worker processes")
+    parser.add_argument('--step', type=int, default=1, help="Process every Nth video frame")
+    parser.add_argument('--size', type=int, nargs=2, default=(640, 360), metavar=('WIDTH', 'HEIGHT'),
+                        help="Resolution to process frames at")
+    parser.add_argument('--native', action='store_true', help="Process frames at their own resolution")
+    parser.add_argument('--levels', type=int, default=0,
+                        help="Pyramid levels to find candidate regions at before processing them in full")
+    parser.add_argument('--tiles', type=int, default=1,
+                        help="Horizontal strips to binarize frames in on separate threads, for large frames")
+    parser.add_argument('--metrics', type=float, metavar='SECONDS',
+                        help="Log per-stage timings from each worker every SECONDS")
+    args = parser.parse_args(args)
+
+    if not os.path.isfile(args.model):
+        parser.error(f"Model file {args.model} not found")
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        frames, seconds = run_batch(args.inputs, args.model, output, args.workers, args.step,
+                                   None if args.native else tuple(args.size), args.levels, args.tiles,
+                                   args.metrics)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Processed {frames} frames in {seconds:.1f}s ({frames / max(seconds, 1e-9):.1f} frames/sec)",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
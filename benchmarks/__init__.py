@@ -0,0 +1,3 @@
+"""
+Benchmarks for the detection pipeline. Run each module from the repository root, eg python -m benchmarks.score_paths
+"""
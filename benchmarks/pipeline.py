@@ -0,0 +1,165 @@
+"""
+Times each stage of the detection pipeline in isolation on synthetic scenes of varying resolution, leprechaun
+count and noise: binarizing colors, finding contours, processing a component image, finding leprechauns and
+processing a whole frame through the controller. Results are written as JSON, and can be compared against a saved
+baseline to catch regressions
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+import cv2
+from data_sample import LUT_MIN_USES
+from detection_controller import DetectionController
+from benchmarks.scenes import make_scene, build_model
+
+
+def parse_size(text):
+    """
+    Parses a resolution given as WIDTHxHEIGHT
+    :param text: Resolution, eg 1280x720
+    :return: Width and height
+    """
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def measure(function, repeat, warmup=LUT_MIN_USES + 1):
+    """
+    Times each call of a function
+    :param function: Function to call
+    :param repeat: Number of calls to time
+    :param warmup: Calls made first, eg so every color model has built its score table
+    :return: Dictionary of the median, min and mean milliseconds per call
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'mean_ms': statistics.mean(times),
+            'repeat': repeat}
+
+
+def benchmark_scene(size, count, noise, repeat, seed=0):
+    """
+    Times every stage on one scene
+    :param size: Width and height
+    :param count: Number of leprechauns
+    :param noise: Standard deviation of the noise
+    :param repeat: Number of calls to time each stage over
+    :param seed: Random seed of the scene and model
+    :return: Dictionary describing the scene, with the timings of each stage
+    """
+    bgr, leprechauns = make_scene(size, count, noise, seed=seed)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    model = build_model(size, noise, seed)
+    components = [component for component in model.components.values() if component.color.has_model()]
+
+    stages = dict()
+    stages['binarize_image'] = measure(lambda: [component.color.binarize_image(hsv) for component in components],
+                                       repeat)
+    binaries = [component.color.binarize_image(hsv) for component in components]
+    stages['get_contours'] = measure(lambda: [component.get_contours(binary)
+                                              for component, binary in zip(components, binaries)], repeat)
+    stages['process_image'] = measure(lambda: [component.process_image(hsv) for component in components], repeat)
+    model.find_components(hsv)
+    detections = len(model.find_leprechauns())
+    stages['find_leprechaun'] = measure(lambda: model.find_leprechaun(bgr), repeat)
+
+    # Every call is a new frame to the controller, so it can not reuse the last result
+    controller = DetectionController(frame_size=None)
+    controller.model = model
+    controller.select_component("Shirt")
+    stages['process_frame'] = measure(lambda: controller.process_frame(bgr), repeat)
+
+    return {'name': f"{size[0]}x{size[1]}-n{count}-noise{noise:g}", 'size': list(size),
+            'leprechauns': len(leprechauns), 'noise': noise, 'detections': detections, 'stages': stages}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares median times against a baseline
+    :param results: Results from run
+    :param baseline: Results from an earlier run
+    :param tolerance: Fraction a median may grow by before it counts as a regression
+    :return: List of rows with the scene, stage, baseline and current medians, ratio and whether it regressed
+    """
+    previous = {scene['name']: scene['stages'] for scene in baseline['scenes']}
+    rows = []
+    for scene in results['scenes']:
+        for stage, timing in scene['stages'].items():
+            before = previous.get(scene['name'], dict()).get(stage)
+            if before is None:
+                continue
+            ratio = timing['median_ms'] / before['median_ms']
+            rows.append((scene['name'], stage, before['median_ms'], timing['median_ms'], ratio,
+                         ratio > 1 + tolerance))
+    return rows
+
+
+def run(sizes, counts, noises, repeat, seed=0):
+    """
+    Times every stage on every combination of scene parameters
+    :param sizes: List of widths and heights
+    :param counts: List of leprechaun counts
+    :param noises: List of noise standard deviations
+    :param repeat: Number of calls to time each stage over
+    :param seed: Random seed of the scenes and models
+    :return: Dictionary of the environment, the parameters and the results of each scene
+    """
+    environment = {'python': platform.python_version(), 'numpy': np.__version__, 'opencv': cv2.__version__,
+                   'machine': platform.machine(), 'threads': cv2.getNumThreads()}
+    scenes = [benchmark_scene(size, count, noise, repeat, seed)
+              for size in sizes for count in counts for noise in noises]
+    return {'environment': environment, 'repeat': repeat, 'seed': seed, 'scenes': scenes}
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: Exit status, 1 if a stage regressed against the baseline
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(640, 360), (1280, 720)],
+                        metavar='WIDTHxHEIGHT', help="Resolutions of the scenes")
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 4], help="Leprechauns in each scene")
+    parser.add_argument('--noise', type=float, nargs='+', default=[4., 12.], help="Noise standard deviations")
+    parser.add_argument('--repeat', type=int, default=20, help="Calls to time each stage over")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the scenes and models")
+    parser.add_argument('--output', help="File to write the JSON results to, defaults to standard output")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Fraction a median time may grow by before it counts as a regression")
+    args = parser.parse_args(args)
+
+    results = run(args.sizes, args.counts, args.noise, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        rows = compare(results, json.load(file), args.tolerance)
+    print(f"{'scene':<24}{'stage':<18}{'base ms':>10}{'ms':>10}{'ratio':>8}", file=sys.stderr)
+    for name, stage, before, after, ratio, regressed in rows:
+        print(f"{name:<24}{stage:<18}{before:>10.2f}{after:>10.2f}{ratio:>8.2f}{'  REGRESSED' if regressed else ''}",
+              file=sys.stderr)
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} of {len(rows)} stages regressed by more than {args.tolerance:.0%}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Builds deterministic synthetic scenes of leprechauns among colored clutter, and Leprechaun models taught from them
+without the UI. Scenes are scaled to the frame height, so the same model matches at every resolution
+"""
+
+import numpy as np
+import cv2
+from visual_object import Leprechaun
+
+# Color of each component in BGR
+COLORS = {'Beard': (0, 140, 255), 'Hat': (30, 120, 20), 'Shirt': (40, 160, 40), 'Clover': (200, 200, 40),
+          'Skin': (150, 180, 230)}
+
+# Offset from the leprechaun's center, radius and rotation of each component at a frame height of 360, in the
+# order they are drawn
+LAYOUT = {'Shirt': ((0, 70), 55, 0.3), 'Clover': ((20, 80), 18, 0.9), 'Beard': ((0, -30), 35, 1.5),
+          'Skin': ((0, -70), 20, 2.5), 'Hat': ((0, -110), 30, -1.2)}
+LEPRECHAUN_WIDTH = 130  # Width each leprechaun needs at a frame height of 360
+
+# Slider values the components are taught with
+SLIDERS = {'threshold': 40, 'open': 3, 'close': 5, 'blur': 0, 'contour threshold': 50}
+
+
+def notched_polygon(center, radius, rotation, corners=12):
+    """
+    Builds a regular polygon with one corner pulled in, so it has a clear convexity defect and orientation
+    :param center: Center x and y
+    :param radius: Radius in pixels
+    :param rotation: Angle of the notch in radians
+    :param corners: Number of corners
+    :return: Polygon as an N x 2 int32 array
+    """
+    angles = rotation + np.arange(corners) * 2 * np.pi / corners
+    radii = np.full(corners, float(radius))
+    radii[0] *= 0.45
+    return np.stack((center[0] + radii * np.cos(angles), center[1] + radii * np.sin(angles)), axis=1).astype(np.int32)
+
+
+def make_scene(size, count=1, noise=6., clutter=10, seed=0):
+    """
+    Draws leprechauns side by side among random colored circles, with gaussian noise
+    :param size: Width and height
+    :param count: Number of leprechauns, as many as fit the width at most
+    :param noise: Standard deviation of the noise
+    :param clutter: Number of random circles drawn behind the leprechauns
+    :param seed: Random seed
+    :return: BGR frame and a list with the center of each component of each leprechaun
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scale = height / 360
+    count = max(1, min(count, int(width // (LEPRECHAUN_WIDTH * scale))))
+    bgr = np.full((height, width, 3), 90, dtype=np.uint8)
+
+    # Clutter in dull colors, so it rarely matches a component
+    for _ in range(clutter):
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        color = [int(v) for v in rng.integers(60, 130, 3)]
+        cv2.circle(bgr, center, int(rng.integers(5, 40) * scale), color, -1)
+
+    leprechauns = []
+    for i in range(count):
+        x = (i + 0.5) * width / count + rng.uniform(-10, 10) * scale
+        y = height / 2 + rng.uniform(-10, 10) * scale
+        centers = dict()
+        for name, ((dx, dy), radius, rotation) in LAYOUT.items():
+            centers[name] = (int(x + dx * scale), int(y + dy * scale))
+            cv2.fillPoly(bgr, [notched_polygon(centers[name], radius * scale, rotation)], COLORS[name])
+        leprechauns.append(centers)
+
+    bgr = np.clip(bgr + rng.normal(0, noise, bgr.shape), 0, 255).astype(np.uint8)
+    return bgr, leprechauns
+
+
+def build_model(size=(640, 360), noise=6., seed=0):
+    """
+    Teaches a Leprechaun model from a scene of a single leprechaun: the color around each component's center,
+    its shape and its pose relative to the shirt and beard, the same way clicks in the UI do
+    :param size: Width and height of the scene to teach from
+    :param noise: Standard deviation of the scene's noise
+    :param seed: Random seed of the scene
+    :return: Leprechaun model, not tied to a file
+    """
+    bgr, (centers,) = make_scene(size, 1, noise, clutter=0, seed=seed)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    model = Leprechaun(None)
+    for name, (x, y) in centers.items():
+        component = model.components[name]
+        component.color.add_data_batch(hsv[y - 4:y + 5, x - 6:x + 7].reshape(-1, 3))
+        component.color.calculate_stats()
+        component.color.slider_stats.update(SLIDERS)
+        component.define_contour(hsv, x, y)
+
+    # Each pose is taught from the pairing of the first shirt and beard found
+    for name, point in centers.items():
+        model.find_components(hsv)
+        model.add_contour(*point, name)
+        model.find_leprechauns()
+    model.save_size_flag = False
+    return model
@@ -0,0 +1,123 @@
+"""
+Compares the ways a color model can score and threshold a frame: the original float64 evaluation of the model,
+the float32 in place evaluation used while a model keeps changing and the score table used once it is stable.
+Reports time and traced memory allocated per frame
+"""
+
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import cv2
+from data_sample import ColorSample, angle_wrap
+from benchmarks.scenes import make_scene, COLORS
+
+
+def float64_threshold(color, image):
+    """
+    Scores and thresholds an image the way models were originally evaluated, with float64 temporaries
+    :param color: Color model
+    :param image: HSV image
+    :return: Binary grayscale image
+    """
+    coef = 1 / (2 * np.pi * np.square(color.sd))
+    diff_x_mu = image - color.mean
+    diff_x_mu[:, :, 0] = np.abs(angle_wrap(diff_x_mu[:, :, 0]))
+    pdf_exp = -np.square(diff_x_mu / color.sd) / 2
+    pdf = np.exp(pdf_exp) * coef
+    pdf = np.prod(pdf, axis=2) * np.power(10, 4 + color.slider_stats['threshold'] / 5)
+    pdf = np.array(np.minimum(pdf, 255), dtype=np.uint8)
+    _, thresholded = cv2.threshold(pdf, 127, 255, cv2.THRESH_BINARY)
+    return thresholded
+
+
+def lut_threshold(color, image):
+    """
+    Scores an image with the score table and thresholds it
+    :param color: Color model
+    :param image: HSV image
+    :return: Binary grayscale image
+    """
+    _, thresholded = cv2.threshold(color.get_lut().lookup(image), 127, 255, cv2.THRESH_BINARY)
+    return thresholded
+
+
+def make_color(image, center):
+    """
+    Builds a color model from pixels around a point of an image, the way a click teaches a component's color
+    :param image: HSV image
+    :param center: Point x and y
+    :return: Color model
+    """
+    x, y = center
+    color = ColorSample()
+    color.add_data_batch(image[max(0, y - 3):y + 4, max(0, x - 3):x + 4].reshape(-1, 3))
+    color.calculate_stats()
+    return color
+
+
+def make_frame(size, seed=0):
+    """
+    Builds an HSV frame of leprechauns among colored clutter, and a model taught from one of their components
+    :param size: Width and height
+    :param seed: Seed for the scene and the component the model is taught from
+    :return: HSV image and color model
+    """
+    bgr, leprechauns = make_scene(size, count=8, clutter=40, seed=seed)
+    image = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    names = list(COLORS)
+    return image, make_color(image, leprechauns[0][names[seed % len(names)]])
+
+
+def measure(function, repeat):
+    """
+    Times a function and traces the memory it allocates
+    :param function: Function to call
+    :param repeat: Number of calls to average over
+    :return: Seconds per call and the most memory in bytes allocated at once during a call
+    """
+    function()  # Warm up, eg to allocate buffers or build tables
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    seconds = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, nargs=2, default=(1280, 720), metavar=('WIDTH', 'HEIGHT'),
+                        help="Resolution of the frames")
+    parser.add_argument('--repeat', type=int, default=10, help="Frames to average over")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the scene and the component the model is taught from")
+    args = parser.parse_args(args)
+
+    image, color = make_frame(tuple(args.size), args.seed)
+    reference = float64_threshold(color, image)
+
+    paths = {'float64': lambda: float64_threshold(color, image),
+             'float32 in place': lambda: color.threshold_direct(image),
+             'score table': lambda: lut_threshold(color, image)}
+    print(f"{'path':<18}{'ms/frame':>10}{'MB/frame':>10}{'mismatch':>10}")
+    for name, function in paths.items():
+        seconds, peak = measure(function, args.repeat)
+        mismatch = np.count_nonzero(function() != reference)
+        print(f"{name:<18}{seconds * 1000:>10.2f}{peak / 1e6:>10.2f}{mismatch:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures startup time: importing the controller, constructing it and loading the model on first use. Each run
+is a fresh interpreter, so imports are not cached between runs
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in each fresh interpreter, printing the seconds taken by each step
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import detection_controller
+imported = time.perf_counter()
+controller = detection_controller.DetectionController()
+constructed = time.perf_counter()
+controller.object
+loaded = time.perf_counter()
+print(imported - start, constructed - imported, loaded - constructed)
+"""
+
+
+def run_once(work_dir):
+    """
+    Starts a fresh interpreter and times its startup
+    :param work_dir: Directory to run in, where the model file is looked for
+    :return: Seconds to import, construct and load the model
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=work_dir, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return [float(value) for value in output.split()[-3:]]
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5, help="Interpreters to start")
+    parser.add_argument('--model', help="Model file to load, defaults to an empty model")
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.model:
+            os.symlink(os.path.abspath(args.model), os.path.join(work_dir, "leprechaun.model"))
+        runs = [run_once(work_dir) for _ in range(args.repeat)]
+
+    print(f"{'step':<12}{'median ms':>10}{'max ms':>10}")
+    for step, times in zip(("import", "construct", "load model"), zip(*runs)):
+        print(f"{step:<12}{statistics.median(times) * 1000:>10.1f}{max(times) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,19 @@
 import numpy as np
 import cv2
 import os
-import pickle
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import debug_capture
+
+MIN_CONTOUR_AREA = 300  # Smallest contour area in pixels at the working resolution
+HU_EPS = 1e-5  # Smallest Hu moment magnitude compared when matching shapes, as in cv2.matchShapes
+BLOB_DENSITY = 0.004  # Blobs per pixel above which connected components find large blobs faster than tracing
+MIN_TILE_ROWS = 64  # Fewest rows worth processing as a separate strip
+LUT_MIN_USES = 3  # Frames a color model must score unchanged before its score table is built
+
+tile_count = 1  # Horizontal strips to binarize images in, 1 to binarize them whole
+tile_pool = None  # Threads that process the strips
 
 
 def angle_wrap(a1, full_wrap=180):
@@ -22,30 +34,133 @@ class DataSample:
     def __init__(self, input_data=None):
         """
         Builds a sample
-        :param input_data: File to get data from
+        :param input_data: .npy file to get data from
         """
-        print("Initializing!!!")
-        self.data = []
-        if input_data is not None:
-            self.data = input_data
+        self.buffer = None  # One row per data point, rows past count are spare capacity
+        self.count = 0
+        self.stats_count = 0  # Running statistics, updated as data is added
+        self.running_mean = None
+        self.running_m2 = None  # Sum of squared differences from the running mean
         self.sd = None
         self.mean = None
         self.data_file = input_data
+        self.stage_cache = dict()  # Last output of each pipeline stage, with the key it was computed for
 
         if input_data is not None and os.path.isfile(input_data):
-            self.data = pickle.load(open(input_data, "rb"))
+            self.add_data_batch(np.load(input_data, mmap_mode='r'))
             self.calculate_stats()
 
+    def __getstate__(self):
+        """
+        Leaves cached results and spare capacity out of pickled models
+        :return: State to pickle
+        """
+        state = self.__dict__.copy()
+        state['stage_cache'] = dict()
+        if self.buffer is not None:
+            state['buffer'] = self.data.copy()
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled model, including ones saved before results were cached or data was buffered
+        :param state: Pickled state
+        :return: None
+        """
+        data = state.pop('data', None)
+        self.__dict__.update(state)
+        if 'buffer' not in state:  # Saved with a list of data points
+            self.buffer = None
+            self.count = 0
+            self.stats_count = 0
+            self.running_mean = None
+            self.running_m2 = None
+            if data is not None and len(data) > 0:
+                self.add_data_batch(np.asarray(data))
+        self.clear_cache()
+
+    @property
+    def data(self):
+        """
+        Data points of the sample, one per row
+        :return: Array view of the data
+        """
+        if self.buffer is None:
+            return np.empty((0, 0))
+        return self.buffer[:self.count]
+
+    def clear(self):
+        """
+        Removes all data points and their statistics, keeping every other setting
+        :return: None
+        """
+        self.buffer = None
+        self.count = 0
+        self.stats_count = 0
+        self.running_mean = None
+        self.running_m2 = None
+        self.sd = None
+        self.mean = None
+        self.clear_cache()
+
+    def clear_cache(self):
+        """
+        Drops all cached results
+        :return: None
+        """
+        self.stage_cache = dict()
+
+    def is_cached(self, stage, key):
+        """
+        Checks if the output of a stage is cached for a key
+        :param stage: Name of the stage
+        :param key: Key the output should have been computed for
+        :return: True if cached_stage would reuse the output
+        """
+        cached = self.stage_cache.get(stage)
+        return key is not None and cached is not None and cached[0] == key
+
+    def cached_stage(self, stage, key, compute):
+        """
+        Runs a pipeline stage, reusing its last output if it was computed for the same key
+        :param stage: Name of the stage
+        :param key: Frame id and parameters the output depends on, None to always compute
+        :param compute: Function computing the output of the stage
+        :return: Output of the stage
+        """
+        if self.is_cached(stage, key):
+            return self.stage_cache[stage][1]
+        output = compute()
+        if key is not None:
+            self.stage_cache[stage] = (key, output)
+        return output
+
     def calculate_stats(self):
         """
-        Calculates mean and deviation of model
+        Updates the mean and deviation of model from the running statistics
         :return: None
         """
-        if self.data is None:
+        if self.stats_count == 0:
             return
-        data_array = np.array(self.data)
-        self.mean = np.mean(data_array, axis=0)
-        self.sd = np.std(data_array, axis=0)
+        self.mean = self.running_mean.copy()
+        self.sd = np.sqrt(self.running_m2 / self.stats_count)
+
+    def reserve(self, new_count, dtype):
+        """
+        Makes room in the buffer for more data, growing it geometrically
+        :param new_count: Number of data points the buffer must hold
+        :param dtype: Type of the data being added
+        :return: None
+        """
+        dtype = np.result_type(self.buffer.dtype, dtype)
+        if new_count <= len(self.buffer) and dtype == self.buffer.dtype and self.buffer.flags.writeable:
+            return
+        capacity = len(self.buffer)
+        if new_count > capacity:
+            capacity = max(new_count, 2 * capacity, 16)
+        buffer = np.empty((capacity, self.buffer.shape[1]), dtype=dtype)
+        buffer[:self.count] = self.data
+        self.buffer = buffer
 
     def add_data(self, new_data_point):
         """
@@ -56,21 +171,135 @@ class DataSample:
         # Check data size
         if len(self.data) > 0 and len(self.data[0]) != len(new_data_point):
             raise Exception("Data point size does not match sample")
+        new_data_point = np.asarray(new_data_point)
+        if self.buffer is None:
+            self.add_data_batch(new_data_point[np.newaxis])
+            return
+
+        # Add to library
+        self.reserve(self.count + 1, new_data_point.dtype)
+        self.buffer[self.count] = new_data_point
+        self.count += 1
+
+        # Update running statistics (Welford)
+        self.stats_count += 1
+        delta = new_data_point - self.running_mean
+        self.running_mean += delta / self.stats_count
+        self.running_m2 += delta * (new_data_point - self.running_mean)
+
+    def add_data_batch(self, new_data, update_stats=True):
+        """
+        Adds several data points to the model
+        :param new_data: Array with one data point per row
+        :param update_stats: False to only store the data, eg if its statistics are merged separately
+        :return: None
+        """
+        new_data = np.asarray(new_data)
+        if new_data.ndim != 2:
+            raise Exception("Data batch must have one data point per row")
+        if len(self.data) > 0 and len(self.data[0]) != new_data.shape[1]:
+            raise Exception("Data point size does not match sample")
+        if len(new_data) == 0:
+            return
+
         # Add to library
-        self.data.append(new_data_point)
+        if self.buffer is None:
+            self.buffer = np.empty((0, new_data.shape[1]), dtype=new_data.dtype)
+        self.reserve(self.count + len(new_data), new_data.dtype)
+        self.buffer[self.count:self.count + len(new_data)] = new_data
+        self.count += len(new_data)
+
+        # Merge statistics of the batch into the running statistics
+        if not update_stats:
+            return
+        batch_mean = np.mean(new_data, axis=0, dtype=np.float64)
+        batch_m2 = np.sum(np.square(new_data - batch_mean), axis=0)
+        self.merge_stats(len(new_data), batch_mean, batch_m2)
+
+    def merge_stats(self, count, mean, m2):
+        """
+        Merges statistics of other data into the running statistics (Chan et al.). Does not add data points
+        :param count: Number of data points summarized
+        :param mean: Mean of the data
+        :param m2: Sum of squared differences from the mean
+        :return: None
+        """
+        if count == 0:
+            return
+        if self.stats_count == 0:
+            self.stats_count = count
+            self.running_mean = np.array(mean, dtype=np.float64)
+            self.running_m2 = np.array(m2, dtype=np.float64)
+            return
+        total = self.stats_count + count
+        delta = mean - self.running_mean
+        self.running_mean = self.running_mean + delta * count / total
+        self.running_m2 = self.running_m2 + m2 + np.square(delta) * self.stats_count * count / total
+        self.stats_count = total
+
+    def merge(self, other):
+        """
+        Adds the data points and statistics of another sample
+        :param other: DataSample to merge in
+        :return: None
+        """
+        if other.stats_count == 0:
+            return
+        if len(self.data) > 0 and len(self.data[0]) != other.buffer.shape[1]:
+            raise Exception("Data point size does not match sample")
+        if self.buffer is None:
+            self.buffer = np.empty((0, other.buffer.shape[1]), dtype=other.buffer.dtype)
+        self.reserve(self.count + other.count, other.buffer.dtype)
+        self.buffer[self.count:self.count + other.count] = other.data
+        self.count += other.count
+        self.merge_stats(other.stats_count, other.running_mean, other.running_m2)
+
+    def get_record(self, prefix):
+        """
+        Describes the sample for a model file
+        :param prefix: Prefix of the names of its arrays
+        :return: Dictionary of settings and dictionary of arrays by name
+        """
+        record = {'stats_count': int(self.stats_count)}
+        arrays = dict()
+        if self.buffer is not None:
+            arrays[prefix + 'data'] = self.data
+        for name in ('mean', 'sd', 'running_mean', 'running_m2'):
+            if getattr(self, name) is not None:
+                arrays[prefix + name] = np.asarray(getattr(self, name))
+        return record, arrays
+
+    def set_record(self, record, arrays, prefix):
+        """
+        Restores the sample from a model file. The data is used as given, eg memory mapped, and is only copied
+        once more data is added
+        :param record: Dictionary of settings from get_record
+        :param arrays: Dictionary of arrays by name
+        :param prefix: Prefix of the names of its arrays
+        :return: None
+        """
+        self.buffer = arrays.get(prefix + 'data')
+        self.count = 0 if self.buffer is None else len(self.buffer)
+        self.stats_count = record['stats_count']
+        for name in ('mean', 'sd', 'running_mean', 'running_m2'):
+            value = arrays.get(prefix + name)
+            setattr(self, name, None if value is None else np.array(value))  # Small and updated in place
+        self.clear_cache()
 
     def to_export(self):
         """
-        Exports data to pickle file
+        Exports data to a .npy file
         :return: None
         """
         if self.data_file is not None:
-            pickle.dump(self.data, open(self.data_file, "wb"))
+            with open(self.data_file, "wb") as file:
+                np.save(file, self.data)
 
 
+@lru_cache(maxsize=256)
 def make_kernel(k_size, kernel=True):
     """
-    Builds a kernel for morphology
+    Builds a kernel for morphology. Kernels are cached per size, so they must not be modified
     :param k_size: Size of kernel
     :param kernel: True for full kernel matrix, False for tuple of size
     :return: Kernel
@@ -83,6 +312,56 @@ def make_kernel(k_size, kernel=True):
         return k_dims
 
 
+def kernel_radius(k_size):
+    """
+    Finds how far a kernel from make_kernel reaches from its center
+    :param k_size: Size of kernel
+    :return: Radius in pixels
+    """
+    return (k_size | 1) // 2
+
+
+def set_tiles(count):
+    """
+    Sets how many horizontal strips images are binarized in, each on its own thread
+    :param count: Number of strips, 1 to binarize images whole
+    :return: None
+    """
+    global tile_count, tile_pool
+    if tile_pool is not None:
+        tile_pool.shutdown()
+        tile_pool = None
+    tile_count = max(1, count)
+    if tile_count > 1:
+        tile_pool = ThreadPoolExecutor(tile_count)
+
+
+def run_tiled(function, image, margin=0):
+    """
+    Applies a function to overlapping horizontal strips of an image on the tile threads and stitches the results.
+    NumPy and OpenCV release the GIL, so the strips run in parallel. The result is identical to applying the
+    function to the whole image as long as each output pixel only depends on input pixels within margin rows
+    :param function: Function of an image returning an image with the same rows
+    :param image: Image to process
+    :param margin: Rows each output pixel depends on above and below it
+    :return: Stitched result
+    """
+    height = image.shape[0]
+    tiles = min(tile_count, height // max(MIN_TILE_ROWS, 2 * margin))
+    if tiles <= 1:
+        return function(image)
+
+    bounds = np.linspace(0, height, tiles + 1).astype(int)
+
+    def run_strip(i):
+        # Process the strip with its margins and keep the rows it owns
+        top, bottom = bounds[i], bounds[i + 1]
+        start = max(0, top - margin)
+        return function(image[start:min(height, bottom + margin)])[top - start:bottom - start]
+
+    return np.concatenate(list(tile_pool.map(run_strip, range(tiles))))
+
+
 def find_centroid(contour):
     """
     Finds the centroid of a contour
@@ -95,6 +374,86 @@ def find_centroid(contour):
     return int(m['m10']/m['m00']), int(m['m01']/m['m00'])
 
 
+def find_large_blobs(binarized, min_area, offset=(0, 0)):
+    """
+    Finds the outer contours larger than an area without tracing every blob. Connected component statistics rule
+    out blobs whose bounding box is too small to enclose the area, so only the rest are traced. Returns the same
+    contours in the same order as cv2.findContours with RETR_EXTERNAL followed by filtering by area
+    :param binarized: Binarized image
+    :param min_area: Area contours must exceed
+    :param offset: Position of the binarized image in the frame, added to the contour points
+    :return: List of contours and the number of blobs in the image
+    """
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(binarized, connectivity=8)
+
+    # A contour runs through pixel centers, so it encloses at most (w - 1) * (h - 1)
+    large = np.nonzero((stats[1:, cv2.CC_STAT_WIDTH] - 1) * (stats[1:, cv2.CC_STAT_HEIGHT] - 1) > min_area)[0] + 1
+
+    blobs = []
+    for label in large:
+        x, y, w, h = (int(v) for v in stats[label, :4])
+        blob = (labels[y:y + h, x:x + w] == label).view(np.uint8)
+        contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE,
+                                       offset=(x + offset[0], y + offset[1]))
+        if cv2.contourArea(contours[0]) > min_area:
+            blobs.append((contours[0], (x, y, w, h)))
+
+    # Blobs inside the holes of other blobs have no outer contour
+    outer = []
+    for contour, (x, y, w, h) in blobs:
+        start = (float(contour[0, 0, 0]), float(contour[0, 0, 1]))
+        if not any(other is not contour and ox <= x and oy <= y and x + w <= ox + ow and y + h <= oy + oh and
+                   cv2.pointPolygonTest(other, start, False) > 0 for other, (ox, oy, ow, oh) in blobs):
+            outer.append(contour)
+
+    # Traced contours are listed from the last to the first in raster order
+    outer.sort(key=lambda contour: (contour[0, 0, 1], contour[0, 0, 0]), reverse=True)
+    return outer, n - 1
+
+
+def hu_moments(contours):
+    """
+    Finds the Hu moments of contours
+    :param contours: List of contours
+    :return: N x 7 array of Hu moments
+    """
+    return np.array([cv2.HuMoments(cv2.moments(contour))[:, 0] for contour in contours]).reshape(-1, 7)
+
+
+def log_hu_moments(hu):
+    """
+    Transforms Hu moments the way cv2.matchShapes compares them, so model shapes are only transformed once
+    :param hu: N x 7 array of Hu moments
+    :return: N x 7 array of the sign times the log of each moment, and N x 7 boolean array of the moments large
+    enough to compare
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log = np.sign(hu) * np.log10(np.abs(hu))
+    return log, np.abs(hu) > HU_EPS
+
+
+def shape_distances(model_index, hu):
+    """
+    Finds the distance between every pair of model and candidate shapes, the same as cv2.matchShapes with
+    CONTOURS_MATCH_I3 and a model shape as its first contour
+    :param model_index: Log Hu moments of the M model shapes and the moments to compare, from log_hu_moments
+    :param hu: N x 7 array of Hu moments of the candidate shapes
+    :return: M x N array of distances
+    """
+    model_log, model_valid = model_index
+    log, valid = log_hu_moments(hu)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.abs((model_log[:, np.newaxis] - log[np.newaxis]) / model_log[:, np.newaxis])
+
+    # Only moments that are large enough in both shapes are compared
+    ratios[~(model_valid[:, np.newaxis] & valid[np.newaxis])] = 0
+    distances = ratios.max(axis=2, initial=0)
+
+    # Shapes are as different as possible if only one of them has moments large enough to compare
+    distances[model_valid.any(axis=1)[:, np.newaxis] != valid.any(axis=1)[np.newaxis]] = np.finfo(np.float64).max
+    return distances
+
+
 def find_center(p1, p2):
     """
     Helper function to find the center between two points
@@ -107,6 +466,79 @@ def find_center(p1, p2):
     return x, y
 
 
+def hsv_index(image):
+    """
+    Packs each HSV pixel into a single index into a flattened lookup table
+    :param image: 8 bit HSV image
+    :return: Integer image of table indices
+    """
+    index = image[:, :, 0].astype(np.intp)
+    index <<= 8
+    index |= image[:, :, 1]
+    index <<= 8
+    index |= image[:, :, 2]
+    return index
+
+
+class ColorLUT:
+    """
+    Precomputed binarization scores for every possible 8 bit HSV value
+    """
+    hue_range = 180  # OpenCV stores 8 bit hue as 0-179
+    chunk_size = 16  # Hues to evaluate at once while building the table
+
+    def __init__(self, mean, sd, threshold):
+        """
+        Builds the score table for a gaussian color model
+        :param mean: Mean of the model
+        :param sd: Standard deviation of the model
+        :param threshold: Value of the threshold slider
+        """
+        self.key = ColorLUT.make_key(mean, sd, threshold)
+
+        # Evaluate each channel of the probability density function separately. These are the same
+        # operations as evaluating the model per pixel, so the table matches it exactly
+        coef = 1 / (2 * np.pi * np.square(sd))
+        diff_x_mu = np.arange(256, dtype=np.uint8)[:, np.newaxis] - mean
+        diff_x_mu[:, 0] = np.abs(angle_wrap(diff_x_mu[:, 0]))
+        pdf_exp = -np.square(diff_x_mu / sd) / 2
+        pdf = np.exp(pdf_exp) * coef
+        scale = np.power(10, 4 + threshold / 5)
+
+        # Combine the channels a few hues at a time to limit temporary memory
+        self.table = np.empty((ColorLUT.hue_range, 256, 256), dtype=np.uint8)
+        for start in range(0, ColorLUT.hue_range, ColorLUT.chunk_size):
+            stop = min(start + ColorLUT.chunk_size, ColorLUT.hue_range)
+            hue_sat = pdf[start:stop, 0, np.newaxis] * pdf[np.newaxis, :, 1]
+            chunk = hue_sat[:, :, np.newaxis] * pdf[np.newaxis, np.newaxis, :, 2]
+            chunk *= scale
+            np.minimum(chunk, 255, out=chunk)
+            self.table[start:stop] = chunk
+        self.flat_table = self.table.reshape(-1)
+
+    @staticmethod
+    def make_key(mean, sd, threshold):
+        """
+        Builds a key identifying the model a table was built for
+        :param mean: Mean of the model
+        :param sd: Standard deviation of the model
+        :param threshold: Value of the threshold slider
+        :return: Hashable key
+        """
+        return mean.tobytes(), sd.tobytes(), threshold
+
+    def lookup(self, image, index=None):
+        """
+        Scores every pixel of an image
+        :param image: 8 bit HSV image
+        :param index: Precomputed result of hsv_index for the image
+        :return: Grayscale score image
+        """
+        if index is None:
+            index = run_tiled(hsv_index, image)
+        return run_tiled(self.flat_table.take, index)
+
+
 class ColorSample(DataSample):
     """
     Stores data for a sample from a color
@@ -120,51 +552,370 @@ class ColorSample(DataSample):
         self.slider_stats = {'open': 0, 'close': 0, 'blur': 0, 'threshold': 50, 'contour threshold': 50}
         self.contour = None
         self.save_steps = False
+        self.lut = None  # Score table, rebuilt when the model or threshold changes
+        self.lut_uses = (None, 0, None, set())  # Model key, frames scored without a table, last frame, parts scored
+        self.workspace = None  # Float buffers for scoring without a table, as large as the largest image scored
+
+    def __getstate__(self):
+        """
+        Leaves the score table and buffers out of pickled models
+        :return: State to pickle
+        """
+        state = super().__getstate__()
+        state['lut'] = None
+        state['workspace'] = None
+        return state
+
+    def get_record(self, prefix):
+        """
+        Describes the color for a model file
+        :param prefix: Prefix of the names of its arrays
+        :return: Dictionary of settings and dictionary of arrays by name
+        """
+        record, arrays = super().get_record(prefix)
+        record['slider_stats'] = dict(self.slider_stats)
+        record['save_steps'] = bool(self.save_steps)
+        return record, arrays
+
+    def set_record(self, record, arrays, prefix):
+        """
+        Restores the color from a model file
+        :param record: Dictionary of settings from get_record
+        :param arrays: Dictionary of arrays by name
+        :param prefix: Prefix of the names of its arrays
+        :return: None
+        """
+        super().set_record(record, arrays, prefix)
+        self.slider_stats.update(record['slider_stats'])
+        self.save_steps = record['save_steps']
+
+    def clear_cache(self):
+        """
+        Drops all cached results, including the score table and buffers
+        :return: None
+        """
+        super().clear_cache()
+        self.lut = None
+        self.lut_uses = (None, 0, None, set())
+        self.workspace = None
+
+    def stage_key(self, frame_id, stage):
+        """
+        Builds the cache key of a stage of binarize_image. Each key extends the key of the stage before it
+        :param frame_id: Identifies the image being processed, None to skip the cache
+        :param stage: 'score', 'threshold' or 'morph'
+        :return: Key for cached_stage
+        """
+        if frame_id is None:
+            return None
+        key = (frame_id, ColorLUT.make_key(self.mean, self.sd, self.slider_stats['threshold']))
+        if stage == 'score':
+            return key
+        key += (self.slider_stats['blur'],)
+        if stage == 'threshold':
+            return key
+        return key + (self.slider_stats['open'], self.slider_stats['close'])
+
+    def get_lut(self):
+        """
+        Gets the score table for the current model, rebuilding it if the model or threshold changed
+        :return: Score table
+        """
+        key = ColorLUT.make_key(self.mean, self.sd, self.slider_stats['threshold'])
+        if self.lut is None or self.lut.key != key:
+            self.lut = ColorLUT(self.mean, self.sd, self.slider_stats['threshold'])
+        return self.lut
+
+    def has_current_lut(self):
+        """
+        Checks if the score table is built for the current model
+        :return: True if the score table is up to date
+        """
+        key = ColorLUT.make_key(self.mean, self.sd, self.slider_stats['threshold'])
+        return self.lut is not None and self.lut.key == key
 
-    def binarize_image(self, image):
+    def use_lut(self, frame_id=None):
         """
-        Binarizes the image by how well it matches the gaussian model
+        Counts a frame scored with the current model and decides whether to score it with the table. Building the
+        table only pays off once the model stops changing, eg not while colors are being taught. The regions of a
+        frame count once, while scoring a still frame again, eg after a blur change, counts as another use
+        :param frame_id: Identifies the image being scored, a tuple of the frame's id and a region for parts of
+        it. None counts every call as a new frame
+        :return: True to score with the table, False to score directly
+        """
+        if self.has_current_lut():
+            return True
+        key = ColorLUT.make_key(self.mean, self.sd, self.slider_stats['threshold'])
+        frame = frame_id[0] if isinstance(frame_id, tuple) else frame_id
+        last_key, uses, last_frame, scored = self.lut_uses
+        if last_key != key:
+            uses, scored = 1, {frame_id}
+        elif frame is None or frame != last_frame or frame_id in scored:
+            uses, scored = uses + 1, {frame_id}
+        else:  # Another region of the same frame
+            scored.add(frame_id)
+        self.lut_uses = (key, uses, frame, scored)
+        return uses >= LUT_MIN_USES
+
+    def log_scale(self):
+        """
+        Finds the log of the constant factor of every score, the gaussian coefficients times the threshold scale
+        :return: Log of the factor
+        """
+        log_coef = -np.sum(np.log(2 * np.pi * np.square(self.sd)))
+        return float(log_coef + (4 + self.slider_stats['threshold'] / 5) * np.log(10))
+
+    def log_score_direct(self, image):
+        """
+        Finds the log of each pixel's score without a score table. Computes in float32 in place in buffers kept
+        between calls, which are only reallocated when an image is larger than any scored before, so regions of
+        a frame reuse them
+        :param image: HSV image to score
+        :return: Float32 image of log scores, a view of a buffer overwritten by the next call
+        """
+        shape = image.shape[:2]
+        size = shape[0] * shape[1]
+        if self.workspace is None or self.workspace[0].size < size:
+            self.workspace = (np.empty(size, dtype=np.float32), np.empty(size, dtype=np.float32))
+        log_score, diff = (buffer[:size].reshape(shape) for buffer in self.workspace)
+
+        # Sum the squared distance of each channel from the mean, in standard deviations
+        for channel in range(3):
+            np.subtract(image[:, :, channel], self.mean[channel], out=diff, dtype=np.float32)
+            if channel == 0:  # Hue wraps around
+                diff -= 90
+                np.mod(diff, 180, out=diff)
+                diff -= 90
+            diff *= 1 / self.sd[channel]
+            if channel == 0:
+                np.square(diff, out=log_score)
+            else:
+                np.square(diff, out=diff)
+                log_score += diff
+
+        log_score *= -0.5
+        log_score += self.log_scale()
+        return log_score
+
+    def threshold_direct(self, image, frame_id=None):
+        """
+        Scores and thresholds an image without a score table. Without a blur, scores are compared to the
+        threshold in log space and never exponentiated
         :param image: HSV image to process
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :return: Binary grayscale image
+        """
+        if make_kernel(self.slider_stats['blur'], False) == (1, 1) and not self.saving_steps():
+            # Scores are truncated to 8 bits, so they pass the threshold of 127 from 128 up
+            binary = np.empty(image.shape[:2], dtype=np.uint8)
+            np.greater_equal(self.log_score_direct(image), np.log(128), out=binary.view(bool))
+            binary *= 255
+            return binary
+
+        def score():
+            log_score = self.log_score_direct(image)
+            np.minimum(log_score, np.log(255), out=log_score)
+            pdf = np.empty(image.shape[:2], dtype=np.uint8)
+            np.copyto(pdf, np.exp(log_score, out=log_score), casting='unsafe')
+            return pdf
+
+        # Cached apart from table scores, so a frame scored again once the table is built gets exact scores
+        pdf = self.cached_stage('direct_score', self.stage_key(frame_id, 'score'), score)
+        if self.saving_steps():
+            debug_capture.save('prob', pdf)
+        return run_tiled(self.blur_threshold, pdf, kernel_radius(self.slider_stats['blur']))
+
+    def saving_steps(self):
+        """
+        Checks if intermediate images are saved for the frame being processed
+        :return: True if save_steps is on and the frame is sampled
+        """
+        return self.save_steps and debug_capture.is_sampled()
+
+    def has_model(self):
+        """
+        Checks if there is enough data to binarize with
+        :return: True if the model can be used
+        """
+        return len(self.data) >= 10
+
+    def fusable(self):
+        """
+        Checks if the thresholded image only depends on each pixel's own score, so it can be read from a
+        table of component bitmasks built from up to date score tables
+        :return: True if the color can be labeled by ColorLabeler
+        """
+        return (self.has_model() and make_kernel(self.slider_stats['blur'], False) == (1, 1) and not self.saving_steps()
+                and self.has_current_lut())
+
+    def binarize_image(self, image, index=None, frame_id=None, thresholded=None):
+        """
+        Binarizes the image by how well it matches the gaussian model. Stages whose inputs have not changed
+        since the last call with the same frame id are reused
+        :param image: HSV image to process
+        :param index: Precomputed result of hsv_index for the image
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :param thresholded: Already thresholded image, eg from ColorLabeler
         :return: Binary grayscale image
         """
         # Skip processing if there is not enough data
-        if len(self.data) < 10:
+        if not self.has_model():
             return None
 
-        # Calculate probability density function
-        coef = 1 / (2 * np.pi * np.square(self.sd))
-        diff_x_mu = image - self.mean
-        diff_x_mu[:, :, 0] = np.abs(angle_wrap(diff_x_mu[:, :, 0]))
-        pdf_exp = -np.square(diff_x_mu / self.sd) / 2
-        pdf = np.exp(pdf_exp) * coef
-        pdf = np.prod(pdf, axis=2) * np.power(10, 4 + self.slider_stats['threshold'] / 5)
-        pdf = np.array(np.minimum(pdf, 255), dtype=np.uint8)
+        return self.cached_stage('morph', self.stage_key(frame_id, 'morph'),
+                                 lambda: self.morph(self.threshold_image(image, index, frame_id, thresholded)))
 
-        # For debugging / documentation
-        if self.save_steps:
-            cv2.imwrite("prob.jpg", pdf)
+    def threshold_image(self, image, index=None, frame_id=None, thresholded=None):
+        """
+        Scores, blurs and thresholds an image
+        :param image: HSV image to process
+        :param index: Precomputed result of hsv_index for the image
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :param thresholded: Already thresholded image to store in the cache
+        :return: Binary grayscale image
+        """
+        def compute():
+            if thresholded is not None:
+                return thresholded
 
-        # Blur image
-        blurred = cv2.GaussianBlur(pdf, make_kernel(self.slider_stats['blur'], False), 0)
+            # Score directly while the model keeps changing
+            if not self.use_lut(frame_id):
+                started = metrics.start()
+                binary = self.threshold_direct(image, frame_id)
+                metrics.stop(started, 'threshold_direct', binary)
+                if self.saving_steps():
+                    debug_capture.save('blur_thresh', binary)
+                return binary
+
+            # Look up probability density function
+            def score():
+                started = metrics.start()
+                scores = self.get_lut().lookup(image, index)
+                metrics.stop(started, 'score', scores)
+                return scores
+
+            pdf = self.cached_stage('score', self.stage_key(frame_id, 'score'), score)
+
+            # For debugging / documentation
+            if self.saving_steps():
+                debug_capture.save('prob', pdf)
+
+            # Blur and binarize, in strips that reach as far as the blur
+            started = metrics.start()
+            binary = run_tiled(self.blur_threshold, pdf, kernel_radius(self.slider_stats['blur']))
+            metrics.stop(started, 'threshold', binary)
 
-        # Binarize
-        _, thresholded = cv2.threshold(blurred, 127, 255, cv2.THRESH_BINARY)
+            # Save blurred image
+            if self.saving_steps():
+                debug_capture.save('blur_thresh', binary)
 
-        # Save blurred image
-        if self.save_steps:
-            cv2.imwrite("blur_thresh.jpg", thresholded)
+            return binary
 
-        # Open and close image
+        return self.cached_stage('threshold', self.stage_key(frame_id, 'threshold'), compute)
+
+    def blur_threshold(self, pdf):
+        """
+        Blurs and thresholds a score image
+        :param pdf: Grayscale score image
+        :return: Binary grayscale image
+        """
+        blurred = cv2.GaussianBlur(pdf, make_kernel(self.slider_stats['blur'], False), 0)
+        _, binary = cv2.threshold(blurred, 127, 255, cv2.THRESH_BINARY)
+        return binary
+
+    def open_close(self, thresholded):
+        """
+        Opens and closes a binary image
+        :param thresholded: Binary image
+        :return: Binary grayscale image
+        """
         opened = cv2.morphologyEx(thresholded, cv2.MORPH_OPEN, make_kernel(self.slider_stats['open']))
-        closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, make_kernel(self.slider_stats['close']))
+        return cv2.morphologyEx(opened, cv2.MORPH_CLOSE, make_kernel(self.slider_stats['close']))
 
-        if self.save_steps:
-            cv2.imwrite("morphed.jpg", closed)
+    def morph(self, thresholded):
+        """
+        Opens and closes a thresholded image
+        :param thresholded: Binary image to clean up
+        :return: Binary grayscale image
+        """
+        # Opening and closing each erode and dilate once, so strips need margins of twice each radius
+        margin = 2 * (kernel_radius(self.slider_stats['open']) + kernel_radius(self.slider_stats['close']))
+        started = metrics.start()
+        closed = run_tiled(self.open_close, thresholded, margin)
+        metrics.stop(started, 'morph', closed)
+
+        if self.saving_steps():
+            debug_capture.save('morphed', closed)
 
-        # Return processed image
         return closed
 
 
+class ColorLabeler:
+    """
+    Binarizes several color models in a single pass over an image using a table of component bitmasks
+    """
+    def __init__(self):
+        """
+        Constructor for ColorLabeler
+        """
+        self.key = None
+        self.flat_table = None
+
+    def get_table(self, colors):
+        """
+        Gets the bitmask table for a list of colors, rebuilding it if any of the models changed
+        :param colors: Color samples to label, bit i is set where color i passes its threshold
+        :return: Flattened bitmask table
+        """
+        luts = [color.get_lut() for color in colors]
+        key = tuple(lut.key for lut in luts)
+        if key != self.key:
+            dtype = np.min_scalar_type((1 << len(colors)) - 1)
+            table = np.zeros(luts[0].flat_table.shape, dtype=dtype)
+            for bit, lut in enumerate(luts):
+                table |= (lut.flat_table > 127).astype(dtype) << dtype.type(bit)
+            self.key = key
+            self.flat_table = table
+        return self.flat_table
+
+    def binarize_colors(self, colors, image, frame_id=None):
+        """
+        Binarizes an image for each color
+        :param colors: Dictionary of color samples by name
+        :param image: HSV image to process
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :return: Dictionary of binary images by name, None for colors without a model
+        """
+        # Only colors without a cached threshold stage need to read the image
+        pending = [name for name, color in colors.items() if color.has_model() and
+                   not color.is_cached('threshold', color.stage_key(frame_id, 'threshold'))]
+        started = metrics.start()
+        index = run_tiled(hsv_index, image) if pending else None
+        metrics.stop(started, 'hsv_index', index, 'all')
+
+        # Colors with per-pixel thresholds share one table lookup, the rest are looked up individually
+        fused = [name for name, color in colors.items() if color.fusable()][:64]
+        thresholded = dict()
+        if any(name in fused for name in pending):
+            started = metrics.start()
+            labels = run_tiled(self.get_table([colors[name] for name in fused]).take, index)
+            for name in pending:
+                if name in fused:
+                    binary = ((labels & labels.dtype.type(1 << fused.index(name))) != 0).view(np.uint8)
+                    binary *= 255
+                    thresholded[name] = binary
+            metrics.stop(started, 'label', labels, 'all')
+
+        binaries = dict()
+        for name, color in colors.items():
+            metrics.set_component(name)
+            debug_capture.set_component(name)
+            binaries[name] = color.binarize_image(image, index, frame_id, thresholded.get(name))
+        metrics.set_component(None)
+        debug_capture.set_component(None)
+        return binaries
+
+
 class ComponentSample(DataSample):
     """
     Handles data about a component from an object (eg beard, shirt)
@@ -178,135 +929,303 @@ class ComponentSample(DataSample):
         super().__init__(input_data)
         self.component_name = component_name
         self.color = ColorSample()
-        self.contour = None
+        self.contour = None  # Last model contour taught
+        self.shapes = np.empty((0, 7))  # Hu moments of every model contour taught, one per row
+        self.shape_index = log_hu_moments(self.shapes)  # Shapes transformed for shape_distances
         self.found_contours = []
+        self.overlay_shapes = []  # Hulls, centroids and defects of the last processed image
         self.expected_size = None
-        self.exp_poses = []
+        self.exp_poses = np.empty((0, 3))  # Expected poses relative to the object, one per row
+        self.blob_density = 0  # Blobs per pixel in the last binarized image
+
+    def __setstate__(self, state):
+        """
+        Restores a pickled component, including ones saved with a list of expected poses or a single model contour
+        :param state: Pickled state
+        :return: None
+        """
+        super().__setstate__(state)
+        self.exp_poses = np.array(self.exp_poses, dtype=np.float64).reshape(-1, 3)
+        if 'blob_density' not in state:
+            self.blob_density = 0
+        if 'shapes' not in state:
+            self.shapes = hu_moments([] if self.contour is None else [self.contour])
+        self.shape_index = log_hu_moments(self.shapes)
+
+    def get_record(self, prefix):
+        """
+        Describes the component and its color for a model file
+        :param prefix: Prefix of the names of its arrays
+        :return: Dictionary of settings and dictionary of arrays by name
+        """
+        record, arrays = super().get_record(prefix)
+        record['color'], color_arrays = self.color.get_record(prefix + 'color/')
+        arrays.update(color_arrays)
+        arrays[prefix + 'exp_poses'] = self.exp_poses
+        arrays[prefix + 'shapes'] = self.shapes
+        if self.contour is not None:
+            arrays[prefix + 'contour'] = self.contour
+        return record, arrays
+
+    def set_record(self, record, arrays, prefix):
+        """
+        Restores the component and its color from a model file
+        :param record: Dictionary of settings from get_record
+        :param arrays: Dictionary of arrays by name
+        :param prefix: Prefix of the names of its arrays
+        :return: None
+        """
+        super().set_record(record, arrays, prefix)
+        self.color.set_record(record['color'], arrays, prefix + 'color/')
+        self.exp_poses = arrays[prefix + 'exp_poses']
+        self.shapes = arrays[prefix + 'shapes']
+        self.shape_index = log_hu_moments(self.shapes)
+        self.contour = arrays.get(prefix + 'contour')
 
-    def get_contours(self, binarized):
+    def add_pose(self, pose):
+        """
+        Adds an expected pose relative to the object
+        :param pose: Pose from VisualObject.get_contour_pose
+        :return: None
+        """
+        self.exp_poses = np.vstack((self.exp_poses, pose))
+
+    def clear_poses(self):
+        """
+        Removes all expected poses
+        :return: None
+        """
+        self.exp_poses = np.empty((0, 3))
+
+    def add_shape(self, contour):
+        """
+        Adds a contour to the model shapes
+        :param contour: Contour to add
+        :return: None
+        """
+        self.contour = contour
+        self.shapes = np.concatenate((self.shapes, hu_moments([contour])))
+        self.shape_index = log_hu_moments(self.shapes)
+
+    def clear_shapes(self):
+        """
+        Removes all model shapes
+        :return: None
+        """
+        self.contour = None
+        self.shapes = np.empty((0, 7))
+        self.shape_index = log_hu_moments(self.shapes)
+
+    def get_contours(self, binarized, offset=(0, 0), match_shapes=True):
         """
         Find all matching contours
         :param binarized: Binarized image to find contours in
+        :param offset: Position of the binarized image in the frame, added to the contour points
+        :param match_shapes: False to keep contours that do not match any model shape
         :return: List of matching contours
         """
-        # Find all contours
-        contours, h = cv2.findContours(binarized, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Find large contours, only tracing the large blobs if the last image was too noisy to trace them all
+        if self.blob_density > BLOB_DENSITY:
+            contours, blob_count = find_large_blobs(binarized, MIN_CONTOUR_AREA, offset)
+        else:
+            # Find all contours
+            contours, h = cv2.findContours(binarized, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+            blob_count = len(contours)
 
-        # Save image with progress
-        if self.color.save_steps:
-            bgr_binary = cv2.cvtColor(binarized, cv2.COLOR_GRAY2BGR)
-            with_contours = cv2.drawContours(bgr_binary, contours, -1, (255, 0, 0), 3)
-            cv2.imwrite("all_contours.jpg", with_contours)
+            # Save image with progress
+            if self.color.saving_steps():
+                bgr_binary = cv2.cvtColor(binarized, cv2.COLOR_GRAY2BGR)
+                with_contours = cv2.drawContours(bgr_binary, contours, -1, (255, 0, 0), 3,
+                                                 offset=(-offset[0], -offset[1]))
+                debug_capture.save('all_contours', with_contours, self.component_name)
 
-        # Filter out small contours
-        contours = [contour for contour in contours if cv2.contourArea(contour) > 300]
+            # Filter out small contours
+            contours = [contour for contour in contours if cv2.contourArea(contour) > MIN_CONTOUR_AREA]
+        self.blob_density = blob_count / binarized.size
+        metrics.count('blobs', blob_count, self.component_name)
 
-        # If there is a model, filter out contours that don't match
-        if self.contour is not None:
-            new_contours = []
-            for contour in contours:
-                # Check if each contour matches
-                match = cv2.matchShapes(self.contour, contour, cv2.CONTOURS_MATCH_I3, 0)
-                if match < self.color.slider_stats['contour threshold'] / 100:
-                    new_contours.append(contour)
-            contours = new_contours
+        # If there is a model, filter out contours that don't match any of its shapes
+        if match_shapes and len(self.shapes) > 0 and contours:
+            distances = shape_distances(self.shape_index, hu_moments(contours)).min(axis=0)
+            matches = distances < self.color.slider_stats['contour threshold'] / 100
+            contours = [contour for contour, match in zip(contours, matches) if match]
 
         # Return matching contours
         return contours
 
+    def find_candidates(self, thresholded, scale):
+        """
+        Finds the regions of a downsampled image that could hold the component at full resolution
+        :param thresholded: Thresholded downsampled image
+        :param scale: Factor the image was downsampled by
+        :return: List of regions as x0, y0, x1, y1 in full resolution coordinates
+        """
+        # Keep every blob whose bounding box could enclose a large enough contour. A blob sampled as w x h pixels
+        # can span up to (w + 1) x (h + 1) times the scale at full resolution
+        _, _, stats, _ = cv2.connectedComponentsWithStats(thresholded, connectivity=8)
+        x, y, w, h = stats[1:, :4].T
+        large = (w + 1) * (h + 1) * scale ** 2 > MIN_CONTOUR_AREA
+        return [(int(x0) * scale, int(y0) * scale, int(x1) * scale, int(y1) * scale)
+                for x0, y0, x1, y1 in zip(x[large], y[large], (x + w)[large], (y + h)[large])]
+
     def define_contour(self, image, x, y):
         """
-        Sets the contour enclosing the clicked pixel as the model contour
+        Adds the contour enclosing the clicked pixel to the model shapes
         :param image: Image with contour
         :param x: Clicked x coordinate
         :param y: Clicked y coordinate
         :return: Contour matched
         """
         # Binarize image from color model
+        debug_capture.set_component(self.component_name)
         color_binary = self.color.binarize_image(image)
         if color_binary is None:  # No color model
             return None
 
-        # Get contours
-        contours = self.get_contours(color_binary)
+        # Get contours, including ones unlike the shapes taught so far
+        contours = self.get_contours(color_binary, match_shapes=False)
 
         # Find enclosing contours
         for contour in contours:
             dist = cv2.pointPolygonTest(contour, (x, y), False)
             if dist >= 0:  # Point clicked is in contour
-                # Set as contour and return it
-                self.contour = contour
+                # Add to the model shapes and return it
+                self.add_shape(contour)
                 return contour
         # No match found
-        self.contour = None
+        return None
 
-    def process_image(self, image):
+    def find_components(self, image, color_binary=None, frame_id=None, offset=(0, 0)):
         """
-        Finds and overlays contours for an input image
+        Finds contours matching the component and analyzes their shape
         :param image: HSV image to analyze
-        :return: Image with overlay
+        :param color_binary: Already binarized image, eg from ColorLabeler
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :param offset: Position of the image in the frame, for images cropped to a region of interest
+        :return: Binarized image, None if there is no color model
         """
         # Clear list of matching contours
         self.found_contours = []
+        self.overlay_shapes = []
 
         # Binarize color
-        color_binary = self.color.binarize_image(image)
+        if color_binary is None:
+            debug_capture.set_component(self.component_name)
+            color_binary = self.color.binarize_image(image, frame_id=frame_id)
         if color_binary is None:  # No color model
-            return np.zeros(image.shape, dtype=np.uint8)
+            return None
 
-        # Find contours
-        contours = self.get_contours(color_binary)
+        # Find and analyze contours, unless only earlier stages changed
+        key = self.color.stage_key(frame_id, 'morph')
+        if key is not None:
+            key += (self.color.slider_stats['contour threshold'], self.shapes.tobytes(), offset)
+        found_contours, overlay_shapes = self.cached_stage('contours', key,
+                                                           lambda: self.analyze_contours(color_binary, offset))
+        self.found_contours = list(found_contours)
+        self.overlay_shapes = list(overlay_shapes)
+        return color_binary
 
-        # BGR color image from grayscale for overlay
-        bgr_binary = cv2.cvtColor(color_binary, cv2.COLOR_GRAY2BGR)
+    def analyze_contours(self, color_binary, offset=(0, 0)):
+        """
+        Finds matching contours and their hulls, centroids and biggest defects
+        :param color_binary: Binarized image
+        :param offset: Position of the binarized image in the frame
+        :return: List of found contours and list of shapes to overlay
+        """
+        found_contours = []
+        overlay_shapes = []
+
+        # Find contours
+        started = metrics.start()
+        contours = self.get_contours(color_binary, offset)
+        metrics.stop(started, 'contours', component=self.component_name)
+        metrics.count('contours', len(contours), self.component_name)
 
         # Output images for debugging
-        if self.color.save_steps:
-            with_contours = cv2.drawContours(bgr_binary.copy(), contours, -1, (255, 0, 0), 3)
-            cv2.imwrite("filtered_contours.jpg", with_contours)
+        if self.color.saving_steps():
+            bgr_binary = cv2.cvtColor(color_binary, cv2.COLOR_GRAY2BGR)
+            with_contours = cv2.drawContours(bgr_binary, contours, -1, (255, 0, 0), 3,
+                                             offset=(-offset[0], -offset[1]))
+            debug_capture.save('filtered_contours', with_contours, self.component_name)
 
         # Check each contour for defects
+        started = metrics.start()
         for contour in contours:
-            # Find convex hull
+            # Find convex hull once, as indices for the defects and as points to draw
             hull = cv2.convexHull(contour, returnPoints=False)
-            hull_points = cv2.convexHull(contour, returnPoints=True)
+            hull_points = contour[hull[:, 0]]
 
             # Find convexity defects
             defects = cv2.convexityDefects(contour, hull)
-            bgr_binary = cv2.drawContours(bgr_binary, [hull_points], -1, (255, 0, 0), 3)
-
-            # Save progress
-            if self.color.save_steps:
-                cv2.imwrite("hull.jpg", bgr_binary)
 
             # Find object centroid
             centroid = find_centroid(contour)
 
-            # Show on overlay
-            cv2.circle(bgr_binary, centroid, 5, [255, 0, 0], -1)
-
             # Process defects
+            defect = None
             if defects is not None:
                 # Find biggest defect
                 d, s, e = max((d, s, e) for s, e, f, d in defects[:, 0])
                 start = tuple(contour[s][0])
                 end = tuple(contour[e][0])
                 gap_center = find_center(start, end)
-                cv2.line(bgr_binary, centroid, gap_center, [0, 255, 0], 2)
-
-                if self.color.save_steps:
-                    cv2.line(bgr_binary, start, end, [0, 0, 255], 2)
-                    cv2.imwrite("with_defect.jpg", bgr_binary)
+                defect = (start, end, gap_center)
 
                 # Find orientation
                 orientation = np.arctan2(centroid[0] - gap_center[0], centroid[1] - gap_center[1])
 
                 # Get radius
                 _, radius = cv2.minEnclosingCircle(contour)
-                centroid = np.array(centroid)
 
                 # Save matching contours
-                self.found_contours.append({'orientation': orientation, 'centroid': centroid,
-                                            'size': radius, 'contour': contour})
+                found_contours.append({'orientation': orientation, 'centroid': np.array(centroid),
+                                       'size': radius, 'contour': contour})
+
+            # Keep shapes to draw if this component is displayed
+            overlay_shapes.append((hull_points, centroid, defect))
+        metrics.stop(started, 'hull_defects', component=self.component_name)
+
+        return found_contours, overlay_shapes
+
+    def draw_overlay(self, color_binary, shape):
+        """
+        Overlays the hulls, centroids and defects from the last call to find_components
+        :param color_binary: Binarized image returned by find_components
+        :param shape: Shape of the image to return if there is no binarized image
+        :return: Image with overlay
+        """
+        if color_binary is None:  # No color model
+            return np.zeros(shape, dtype=np.uint8)
+
+        # BGR color image from grayscale for overlay
+        bgr_binary = cv2.cvtColor(color_binary, cv2.COLOR_GRAY2BGR)
+
+        for hull_points, centroid, defect in self.overlay_shapes:
+            bgr_binary = cv2.drawContours(bgr_binary, [hull_points], -1, (255, 0, 0), 3)
+
+            # Show on overlay
+            cv2.circle(bgr_binary, centroid, 5, [255, 0, 0], -1)
+
+            if defect is not None:
+                start, end, gap_center = defect
+                cv2.line(bgr_binary, centroid, gap_center, [0, 255, 0], 2)
+
+                if self.color.saving_steps():
+                    cv2.line(bgr_binary, start, end, [0, 0, 255], 2)
+
+        # Save the hulls and defects of every contour at once
+        if self.color.saving_steps():
+            debug_capture.save('with_defect', bgr_binary, self.component_name)
+
         # Return overlay
         return bgr_binary
+
+    def process_image(self, image, color_binary=None):
+        """
+        Finds and overlays contours for an input image
+        :param image: HSV image to analyze
+        :param color_binary: Already binarized image, eg from ColorLabeler
+        :return: Image with overlay
+        """
+        color_binary = self.find_components(image, color_binary)
+        return self.draw_overlay(color_binary, image.shape)
@@ -0,0 +1,228 @@
+"""
+Writes the intermediate images saved while a color's save_steps is on. Images are queued to a background thread
+instead of written in the pipeline, and dropped if the writer falls behind. Files are named by frame number,
+component, stage and pyramid level, with a numbered suffix for a stage saved again in the same frame, eg for each
+region searched. Only every Nth frame is kept if sampling is set
+"""
+
+import os
+import queue
+import threading
+import cv2
+
+DEFAULT_DIRECTORY = "debug_steps"
+
+writer = None  # DebugWriter, started on the first image saved if not configured before
+current = threading.local()  # Frame, component and pyramid level each thread is processing
+
+
+class DebugWriter:
+    """
+    Writes queued images to a directory on a background thread. When the queue is full, either the oldest
+    queued image or the new one is dropped
+    """
+    def __init__(self, directory=DEFAULT_DIRECTORY, every=1, queue_size=32, drop_oldest=True, extension="jpg"):
+        """
+        Builds a writer and starts its thread
+        :param directory: Directory to write to, created if needed
+        :param every: Only frames whose number is a multiple of this are saved
+        :param queue_size: Most images waiting to be written
+        :param drop_oldest: True to drop the oldest queued image when the queue is full, False to drop the new one
+        :param extension: Image format to write, eg jpg or png
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.every = max(1, every)
+        self.drop_oldest = drop_oldest
+        self.extension = extension
+        self.queue = queue.Queue(queue_size)
+        self.running = True
+        self.thread = threading.Thread(target=self.write_loop, name="DebugWriter", daemon=True)
+        self.thread.start()
+
+        # Statistics
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, name, image):
+        """
+        Queues an image to write. The image must not be changed afterwards
+        :param name: File name without the extension
+        :param image: Image to write
+        :return: True if the image was queued
+        """
+        item = (os.path.join(self.directory, f"{name}.{self.extension}"), image)
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                self.queued += 1
+                return True
+            except queue.Full:
+                if not self.drop_oldest:
+                    self.dropped += 1
+                    return False
+            try:  # Make room by dropping the oldest image, unless the writer just took it
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+
+    def write_loop(self):
+        """
+        Writes images until stopped
+        :return: None
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            filename, image = item
+            try:
+                if cv2.imwrite(filename, image):
+                    self.written += 1
+                else:
+                    self.failures += 1
+            except cv2.error:
+                self.failures += 1
+            self.queue.task_done()
+
+    def flush(self):
+        """
+        Waits until every queued image is written
+        :return: None
+        """
+        self.queue.join()
+
+    def stop(self):
+        """
+        Writes the images still queued and stops the thread
+        :return: None
+        """
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+    def get_stats(self):
+        """
+        Returns writer statistics
+        :return: Dictionary of images queued, written, dropped and failed, and images waiting
+        """
+        return {'queued': self.queued, 'written': self.written, 'dropped': self.dropped,
+                'failures': self.failures, 'pending': self.queue.qsize()}
+
+
+def configure(directory=DEFAULT_DIRECTORY, every=1, queue_size=32, drop_oldest=True, extension="jpg"):
+    """
+    Replaces the writer, finishing the images queued to the old one
+    :param directory: Directory to write to
+    :param every: Only frames whose number is a multiple of this are saved
+    :param queue_size: Most images waiting to be written
+    :param drop_oldest: True to drop the oldest queued image when the queue is full, False to drop the new one
+    :param extension: Image format to write
+    :return: New DebugWriter
+    """
+    global writer
+    close()
+    writer = DebugWriter(directory, every, queue_size, drop_oldest, extension)
+    return writer
+
+
+def close():
+    """
+    Writes the images still queued and stops the writer
+    :return: None
+    """
+    global writer
+    if writer is not None:
+        writer.stop()
+        writer = None
+
+
+def begin_frame(number):
+    """
+    Sets the frame the calling thread is processing. Images saved again for the same frame get a numbered suffix
+    instead of replacing the earlier ones. Threads that never call this number their frames themselves, starting
+    a new frame whenever a stage is saved again for the same component
+    :param number: Frame number
+    :return: None
+    """
+    if getattr(current, 'frame', None) != number or not getattr(current, 'numbered', False):
+        current.frame = number
+        current.names = dict()
+    current.numbered = True
+
+
+def is_sampled():
+    """
+    Checks if the images of the calling thread's current frame are kept, so callers can skip building them.
+    Frames not numbered with begin_frame are always reported as kept, and sampled when saved
+    :return: True if images saved for the current frame are written
+    """
+    if not getattr(current, 'numbered', False):
+        return True
+    return current.frame % (1 if writer is None else writer.every) == 0
+
+
+def set_pyramid_level(level):
+    """
+    Sets the pyramid level of the images the calling thread is processing, so downsampled images are named
+    apart from full resolution ones
+    :param level: Levels the images are downsampled by, 0 for full resolution
+    :return: None
+    """
+    current.level = level
+
+
+def set_component(name):
+    """
+    Sets the component the calling thread is processing, used for images saved by its color
+    :param name: Component name, None for the whole frame
+    :return: None
+    """
+    current.component = name
+
+
+def save(stage, image, component=None):
+    """
+    Queues a copy of a stage's image if the current frame is sampled
+    :param stage: Name of the stage, eg prob or morphed
+    :param image: Image to save
+    :param component: Component name, defaults to the one set with set_component
+    :return: True if the image was queued
+    """
+    global writer
+    if writer is None:
+        writer = DebugWriter()
+    if component is None:
+        component = getattr(current, 'component', None) or "frame"
+
+    # Count the saves of each stage in the frame, starting the next frame if it is not numbered by begin_frame
+    level = getattr(current, 'level', 0)
+    key = f"{component}_{stage}" + (f"_level{level}" if level else "")
+    names = current.__dict__.setdefault('names', dict())
+    repeat = names.get(key, 0)
+    if repeat and not getattr(current, 'numbered', False):
+        current.frame = getattr(current, 'frame', 0) + 1
+        names.clear()
+        repeat = 0
+    names[key] = repeat + 1
+
+    frame = getattr(current, 'frame', 0)
+    if frame % writer.every:
+        return False
+    name = f"{frame:06d}_{key}" + (f"_{repeat}" if repeat else "")
+    return writer.submit(name, image.copy())
+
+
+def get_stats():
+    """
+    Returns statistics of the writer
+    :return: Dictionary from DebugWriter.get_stats, None if nothing was saved yet
+    """
+    return None if writer is None else writer.get_stats()
@@ -2,7 +2,13 @@ import cv2
 import numpy as np
 from enum import Enum
 from visual_object import Leprechaun
+from data_sample import set_tiles
+from frame_capture import FrameGrabber, VideoReader
+from tracker import LeprechaunTracker
+import metrics
+import debug_capture
 import time
+import zlib
 
 
 class InteractionMode(Enum):
@@ -17,26 +23,128 @@ class InputMode(Enum):
     CAMERA = 2
     FILE = 3
     STATIC = 4
+    VIDEO = 5
+
+
+def frame_fingerprint(frame):
+    """
+    Cheaply identifies a frame by its identity, shape and a sparse sample of its pixels
+    :param frame: Frame to identify
+    :return: Hashable fingerprint
+    """
+    if frame is None:
+        return None
+    return id(frame), frame.shape, zlib.crc32(np.ascontiguousarray(frame[::16, ::16]).tobytes())
 
 
 class DetectionController:
-    def __init__(self):
+    def __init__(self, frame_size=(640, 360), pyramid_levels=0, tiles=None, camera=0, camera_backend=cv2.CAP_ANY,
+                 model_file="leprechaun.model", rgb_output=True):
         """
-        Builds detection controller to handle detection between the models and the UI
+        Builds detection controller to handle detection between the models and the UI. The camera is only opened
+        when switching to camera input and the model is only loaded when first used
+        :param frame_size: Width and height to process frames at, None to keep their own resolution
+        :param pyramid_levels: Levels to downsample by when searching for candidate regions, 0 to search
+        every frame in full
+        :param tiles: Horizontal strips to binarize frames in, each on its own thread. Tiling is shared by every
+        controller, so None keeps the current setting
+        :param camera: Camera index, or video file or stream URL, to open
+        :param camera_backend: OpenCV capture backend, eg cv2.CAP_V4L2
+        :param model_file: Model file to load and save
+        :param rgb_output: False to return processed frames in BGR, skipping the conversion, eg for displays
+        that take BGR directly
         """
+        if tiles is not None:
+            set_tiles(tiles)
+        self.frame_size = frame_size
+        self.rgb_output = rgb_output
+        self.pyramid_levels = pyramid_levels
         self.bgr_frame = None  # Raw blue, green, and red
         self.hsv_frame = None  # Raw hue, saturation, and value
         self.processed_frame = None  # Processed output frame
-        self.vc = cv2.VideoCapture(0)  # Camera
+        self.component_binaries = dict()  # Binarized frame of each component, by name
+        self.detections = []  # Leprechauns found in the last frame
+        self.tracker = None  # Searches only around the last detection when tracking
+        self.frame_id = 0  # Counts new frames so unchanged frames can reuse cached stages
+        self.model_version = 0  # Counts changes to the models and sliders
+        self.result_key = None  # Frame and model the last result was computed for
+        self.last_result = None  # Last raw and processed frames
+        self.result_hits = 0  # Still frames served from the last result
+        self.result_misses = 0  # Still frames that had to be processed
+        self.camera = camera
+        self.camera_backend = camera_backend
+        self.vc = None  # Camera, opened on first use
+        self.grabber = None  # Reads the camera in the background
+        self.video = None  # Decodes the open video file or stream in the background
+        self.video_paused = False
         self.input_mode = InputMode.NONE
         self.interaction_mode = InteractionMode.TEACH_CONTOUR
 
-        self.object = Leprechaun()
+        self.model_file = model_file
+        self.model = None  # Loaded on first use
         self.mode = InteractionMode.COMPOSITE  # Track how the user is interacting
         self.selected_component = None  # Track the current
 
-        self.vc.set(3, 640)  # set width
-        self.vc.set(4, 360)  # set height
+    @property
+    def object(self):
+        """
+        Leprechaun model, loaded from the model file on first use
+        :return: Leprechaun model
+        """
+        if self.model is None:
+            self.model = Leprechaun(self.model_file)
+        return self.model
+
+    def open_camera(self):
+        """
+        Opens the camera if it is not open yet
+        :return: None
+        """
+        if self.vc is not None:
+            return
+        vc = cv2.VideoCapture(self.camera, self.camera_backend)
+        if not vc.isOpened():
+            vc.release()
+            raise IOError(f"Could not open camera {self.camera}")
+        if self.frame_size is not None:
+            vc.set(cv2.CAP_PROP_FRAME_WIDTH, self.frame_size[0])
+            vc.set(cv2.CAP_PROP_FRAME_HEIGHT, self.frame_size[1])
+        self.vc = vc
+        self.grabber = FrameGrabber(self.vc)
+
+    def release_camera(self):
+        """
+        Stops capturing and closes the camera
+        :return: None
+        """
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+        if self.vc is not None:
+            self.vc.release()
+            self.vc = None
+
+    def open_video(self, source, step=1, fps=None):
+        """
+        Opens a video file or stream to process, closing the one open before
+        :param source: Video file or stream URL
+        :param step: Only process every step-th frame
+        :param fps: Most frames per second to process, None to process them as fast as they are decoded
+        :return: Dictionary from VideoReader.get_stats
+        """
+        self.close_video()
+        self.video = VideoReader(source, step, fps, backend=self.camera_backend)
+        self.video_paused = False
+        return self.video.get_stats()
+
+    def close_video(self):
+        """
+        Stops decoding and closes the video
+        :return: None
+        """
+        if self.video is not None:
+            self.video.release()
+            self.video = None
 
     def handle_click(self, x, y):
         """
@@ -47,6 +155,7 @@ class DetectionController:
         """
         self.object.components[self.selected_component].color.add_data(self.hsv_frame[y, x])
         self.object.components[self.selected_component].color.calculate_stats()
+        self.model_changed()
         return f"Click at {(y, x)} with hsv value {self.hsv_frame[y, x]}, " \
                f"bgr {self.bgr_frame[y, x]} and processed value {self.processed_frame[y, x]}"
 
@@ -60,6 +169,7 @@ class DetectionController:
         elif self.interaction_mode == InteractionMode.TEACH_OBJECT:
             self.object.add_contour(x, y, self.selected_component)
             self.interaction_mode = InteractionMode.TEACH_CONTOUR
+        self.model_changed()
 
     def save_sizes(self):
         """
@@ -70,11 +180,12 @@ class DetectionController:
 
     def clear_sizes(self):
         """
-        Clears all the poses of the given component
+        Clears all the poses and shapes of the given component
         :return: None
         """
-        self.object.components[self.selected_component].exp_poses = []
-        self.object.components[self.selected_component].contour = None
+        self.object.components[self.selected_component].clear_poses()
+        self.object.components[self.selected_component].clear_shapes()
+        self.model_changed()
 
     def set_slider(self, slider_name, new_size):
         """
@@ -84,13 +195,127 @@ class DetectionController:
         :return: None
         """
         self.object.components[self.selected_component].color.slider_stats[slider_name] = new_size
+        self.model_changed()
+
+    def model_changed(self):
+        """
+        Marks the last result as out of date after a change to a model or slider
+        :return: None
+        """
+        self.model_version += 1
+
+    def get_result_stats(self):
+        """
+        Returns how often still frames were served from the last result
+        :return: Dictionary of hit and miss counts
+        """
+        return {'hits': self.result_hits, 'misses': self.result_misses}
+
+    def set_frame_size(self, frame_size):
+        """
+        Changes the resolution new frames are processed at
+        :param frame_size: Width and height, None to keep the resolution of each frame
+        :return: None
+        """
+        self.frame_size = frame_size
+        self.model_changed()
+
+    def set_pyramid_levels(self, levels):
+        """
+        Changes how far frames are downsampled to find candidate regions before processing them in full
+        :param levels: Pyramid levels, each halving the resolution, 0 to process every frame in full
+        :return: None
+        """
+        self.pyramid_levels = levels
+        self.model_changed()
+
+    def set_tracking(self, enabled):
+        """
+        Turns tracking on or off. While tracking, frames are only searched around the last detection
+        :param enabled: True to track
+        :return: None
+        """
+        self.tracker = LeprechaunTracker() if enabled else None
+        self.model_changed()
+
+    def get_tracking_stats(self):
+        """
+        Returns statistics of the tracker
+        :return: Dictionary of tracking statistics, None if not tracking
+        """
+        return None if self.tracker is None else self.tracker.get_stats()
+
+    def enable_metrics(self, log_interval=None, port=None):
+        """
+        Starts recording per-stage metrics of every frame
+        :param log_interval: Seconds between log lines summarizing the metrics, None to not log
+        :param port: Local port to serve Prometheus text on at /metrics, None to not serve
+        :return: None
+        """
+        metrics.enable(log_interval=log_interval, port=port)
+
+    def get_metrics(self):
+        """
+        Returns the per-stage metrics recorded so far
+        :return: Dictionary from metrics.get_snapshot, None if metrics are disabled
+        """
+        return metrics.get_snapshot()
+
+    def set_save_steps(self, enabled, directory=debug_capture.DEFAULT_DIRECTORY, every=1):
+        """
+        Turns saving the intermediate images of every component on or off. Images are written in the background
+        :param enabled: True to save images
+        :param directory: Directory to write the images to
+        :param every: Only save every Nth frame
+        :return: None
+        """
+        if enabled:
+            debug_capture.configure(directory, every)
+        else:
+            debug_capture.close()
+        for component in self.object.components.values():
+            component.color.save_steps = enabled
+        self.model_changed()
 
-    def get_slider_values(self):
+    def get_video_stats(self):
+        """
+        Returns statistics of the video being decoded
+        :return: Dictionary from VideoReader.get_stats, None if no video is open
+        """
+        video = self.video  # Can be closed by the worker thread meanwhile
+        return None if video is None else video.get_stats()
+
+    def get_capture_stats(self):
+        """
+        Returns statistics of the camera capture thread
+        :return: Dictionary of capture rate, frame counts and frame age, None if the camera was never opened
+        """
+        return None if self.grabber is None else self.grabber.get_stats()
+
+    def get_slider_values(self, component_name=None):
         """
         Returns the size of the opening kernel for the selected kernel
+        :param component_name: Component to get the sliders of, defaults to the selected component
         :return: size of the opening kernel for the selected kernel
         """
-        return self.object.components[self.selected_component].color.slider_stats
+        if component_name is None:
+            component_name = self.selected_component
+        return self.object.components[component_name].color.slider_stats
+
+    def select_component(self, component_name):
+        """
+        Changes the component to display and teach
+        :param component_name: Name of the component
+        :return: None
+        """
+        self.selected_component = component_name
+
+    def save_model(self):
+        """
+        Saves the model to its file
+        :return: None
+        """
+        self.object.save()
 
     def update_image(self):
         """
@@ -98,27 +323,104 @@ class DetectionController:
         :return: Raw and processed frames
         """
         if self.input_mode == InputMode.CAMERA:
-            ret, raw = self.vc.read()  # Read frame
-            return self.process_frame(raw)
-        elif self.input_mode == InputMode.FILE or self.input_mode == InputMode.STATIC:
-            return self.process_frame(self.bgr_frame)
+            ret, raw = self.grabber.read()  # Take newest frame
+            if not ret:  # No new frame since the last one
+                return self.last_result
+            self.last_result = self.process_frame(raw)
+            return self.last_result
+        if self.input_mode == InputMode.VIDEO and not self.video_paused:
+            ret, raw = self.video.read()  # Take the next frame if it is decoded and due
+            if ret:
+                self.last_result = self.process_frame(raw)
+                return self.last_result
+        if self.input_mode in (InputMode.FILE, InputMode.STATIC, InputMode.VIDEO):
+            if self.bgr_frame is None:  # No frame yet, eg before the first video frame is decoded
+                return self.last_result
+
+            # Nothing to do unless the frame, the models or the display changed
+            key = (frame_fingerprint(self.bgr_frame), self.model_version, self.selected_component,
+                   self.object.save_size_flag)
+            if key == self.result_key:
+                self.result_hits += 1
+                return self.last_result
+            self.result_misses += 1
+            self.result_key = key
+            self.last_result = self.process_frame(self.bgr_frame, new_frame=False)
+            return self.last_result
 
     def process_from_file(self, filename):
         """
-        Reads an image from file and processes it
+        Reads an image from file and processes it, or starts playing the file if it is not an image
         :param filename: Filename to read
-        :return: raw and processed frames
+        :return: raw and processed frames, or the video's statistics for videos
         """
+        if not cv2.haveImageReader(filename):
+            return self.process_from_video(filename)
         frame = cv2.imread(filename)
+        if self.grabber is not None:
+            self.grabber.stop()
+        self.close_video()
         self.input_mode = InputMode.FILE
         return self.process_frame(frame)
 
+    def process_from_video(self, source, step=1, fps=None):
+        """
+        Switches the input to a video file or stream, processing its frames as they are decoded
+        :param source: Video file or stream URL
+        :param step: Only process every step-th frame
+        :param fps: Most frames per second to process, None to process them as fast as they are decoded
+        :return: Dictionary from VideoReader.get_stats
+        """
+        if self.grabber is not None:
+            self.grabber.stop()
+        stats = self.open_video(source, step, fps)
+        self.input_mode = InputMode.VIDEO
+        return stats
+
+    def set_video_paused(self, paused):
+        """
+        Pauses or resumes the video. While paused, the current frame is processed again when the models change
+        :param paused: True to pause
+        :return: None
+        """
+        self.video_paused = paused
+
+    def step_video(self, count=1):
+        """
+        Pauses the video and processes the frame count frames ahead
+        :param count: Number of processed frames to move ahead by
+        :return: Raw and processed frames, None if the video is over
+        """
+        self.video_paused = True
+        for _ in range(count):
+            ret, raw = self.video.read(timeout=2, paced=False)
+            if not ret:
+                return None
+        self.last_result = self.process_frame(raw)
+        return self.last_result
+
+    def seek_video(self, position):
+        """
+        Moves the video to a frame and processes it
+        :param position: Frame number to move to
+        :return: Raw and processed frames, None if the frame could not be decoded
+        """
+        self.video.seek(position)
+        ret, raw = self.video.read(timeout=2, paced=False)
+        if not ret:
+            return None
+        self.last_result = self.process_frame(raw)
+        return self.last_result
+
     def set_input_to_camera(self):
         """
-        Switches the input mode to camera
+        Switches the input mode to camera, opening it if needed
         :return: None
         """
+        self.open_camera()
+        self.close_video()
         self.input_mode = InputMode.CAMERA
+        self.grabber.start()
 
     def set_input_to_static(self):
         """
@@ -126,6 +428,8 @@ class DetectionController:
         :return: None
         """
         self.input_mode = InputMode.STATIC
+        if self.grabber is not None:
+            self.grabber.stop()
 
     def clear_color(self):
         """
@@ -133,21 +437,58 @@ class DetectionController:
         :return: None
         """
         self.object.clear_component(self.selected_component)
+        self.model_changed()
 
-    def process_frame(self, frame):
+    def process_frame(self, frame, new_frame=True):
         """
         Pulls and processes the next frame
-        :return: raw and processed frames
+        :param frame: BGR frame to process
+        :param new_frame: False if frame is the current frame being processed again
+        :return: raw and processed frames, in RGB unless rgb_output is off
         """
-        self.bgr_frame = cv2.resize(frame, (640, 360))
-        self.hsv_frame = cv2.cvtColor(self.bgr_frame, cv2.COLOR_BGR2HSV)  # Convert to HSV
-        self.processed_frame = self.object.components[self.selected_component].process_image(self.hsv_frame)
+        frame_started = metrics.start()
+        if new_frame or self.hsv_frame is None:
+            started = metrics.start()
+            self.frame_id += 1
+            self.bgr_frame = frame if self.frame_size is None else cv2.resize(frame, self.frame_size)
+            self.hsv_frame = cv2.cvtColor(self.bgr_frame, cv2.COLOR_BGR2HSV)  # Convert to HSV
+            metrics.stop(started, 'convert', self.hsv_frame)
+        debug_capture.begin_frame(self.frame_id)
+
+        # Find every component once, only around the last detection when tracking, or only in candidate regions
+        # of a downsampled frame when using a pyramid
+        started = metrics.start()
+        roi = None if self.tracker is None else self.tracker.next_roi(self.hsv_frame.shape)
+        if roi is not None:
+            self.component_binaries = self.object.find_components_in_regions(self.hsv_frame, [roi], self.frame_id)
+        elif self.pyramid_levels > 0:
+            regions = self.object.find_candidate_regions(self.hsv_frame, self.pyramid_levels, frame_id=self.frame_id)
+            metrics.stop(started, 'candidates')
+            self.component_binaries = self.object.find_components_in_regions(self.hsv_frame, regions, self.frame_id)
+        else:
+            self.component_binaries = self.object.find_components(self.hsv_frame, self.frame_id)
+        metrics.stop(started, 'find_components')
+
+        # Overlay only the component being displayed
+        started = metrics.start()
+        self.processed_frame = self.object.components[self.selected_component].draw_overlay(
+            self.component_binaries[self.selected_component], self.hsv_frame.shape)
+        metrics.stop(started, 'overlay')
 
         # Find leprechaun
-        for component in self.object.components.values():
-            component.process_image(self.hsv_frame)
-        with_leprechaun = self.object.find_leprechaun(self.bgr_frame)
+        self.detections = self.object.find_leprechauns()
+        if self.tracker is not None:
+            self.tracker.update(self.detections)
+        started = metrics.start()
+        with_leprechaun = self.object.draw_detections(self.bgr_frame, self.detections)
 
-        rgb_frame = cv2.cvtColor(with_leprechaun, cv2.COLOR_BGR2RGB)
-        rgb_processed = cv2.cvtColor(self.processed_frame, cv2.COLOR_BGR2RGB)
-        return rgb_frame, rgb_processed
+        # Both frames are new arrays, so they can be handed out without copying
+        if self.rgb_output:
+            output = (cv2.cvtColor(with_leprechaun, cv2.COLOR_BGR2RGB),
+                      cv2.cvtColor(self.processed_frame, cv2.COLOR_BGR2RGB))
+        else:
+            output = with_leprechaun, self.processed_frame
+        metrics.stop(started, 'draw')
+        metrics.stop(frame_started, 'frame')
+        metrics.frame_done()
+        return output
@@ -0,0 +1,127 @@
+import threading
+import time
+import traceback
+from queue import Queue, Empty
+from PyQt5.QtCore import QThread, pyqtSignal
+
+
+class LatestValue:
+    """
+    Mailbox that only keeps the most recently published value
+    """
+    def __init__(self):
+        """
+        Builds an empty mailbox
+        """
+        self.lock = threading.Lock()
+        self.value = None
+        self.version = 0
+
+    def publish(self, value):
+        """
+        Replaces the value in the mailbox
+        :param value: New value
+        :return: None
+        """
+        with self.lock:
+            self.value = value
+            self.version += 1
+
+    def get(self):
+        """
+        Reads the newest value
+        :return: Version number, increasing with each publish, and value
+        """
+        with self.lock:
+            return self.version, self.value
+
+
+class DetectionWorker(QThread):
+    """
+    Runs a DetectionController on its own thread. Frames are processed continuously and published to a
+    mailbox, and calls from the UI are queued as commands that run between frames
+    """
+    command_done = pyqtSignal(str, object)  # Name of the command and what it returned
+
+    def __init__(self, controller, rate=24):
+        """
+        Builds a worker for a controller
+        :param controller: DetectionController to run
+        :param rate: Maximum frames per second to process
+        """
+        super().__init__()
+        self.controller = controller
+        self.period = 1 / rate
+        self.commands = Queue()
+        self.results = LatestValue()  # Newest raw and processed frames
+        self.running = False
+
+    def send(self, name, *args):
+        """
+        Queues a call to a DetectionController method
+        :param name: Name of the method
+        :param args: Arguments to call it with
+        :return: None
+        """
+        self.commands.put((name, args))
+
+    def run_command(self, command):
+        """
+        Runs a queued command and reports the result
+        :param command: Method name and arguments
+        :return: None
+        """
+        name, args = command
+        try:
+            result = getattr(self.controller, name)(*args)
+        except Exception:
+            # Keep processing frames if a command fails, eg clicking before there is a frame
+            traceback.print_exc()
+            return
+        self.command_done.emit(name, result)
+
+    def run(self):
+        """
+        Processes frames and commands until stopped
+        :return: None
+        """
+        self.running = True
+        while self.running:
+            start = time.perf_counter()
+
+            # Apply everything the UI asked for before the next frame
+            while True:
+                try:
+                    command = self.commands.get_nowait()
+                except Empty:
+                    break
+                if command is not None:
+                    self.run_command(command)
+
+            try:
+                frames = self.controller.update_image()
+            except Exception:
+                traceback.print_exc()
+                frames = None
+            if frames is not None and frames is not self.results.value:  # Skip results reused for still frames
+                self.results.publish(frames)
+
+            # Wait for the next frame, running commands as they arrive
+            remaining = self.period - (time.perf_counter() - start)
+            while self.running and remaining > 0:
+                try:
+                    command = self.commands.get(timeout=remaining)
+                except Empty:
+                    break
+                if command is not None:
+                    self.run_command(command)
+                remaining = self.period - (time.perf_counter() - start)
+
+    def stop(self):
+        """
+        Stops the worker and waits for it to finish
+        :return: None
+        """
+        self.running = False
+        self.commands.put(None)  # Wake the worker if it is waiting
+        self.wait()
@@ -0,0 +1,440 @@
+import glob
+import os
+import queue
+import threading
+import time
+import numpy as np
+import cv2
+
+MAX_STREAM_FAILURES = 50  # Failed reads in a row before a live stream counts as ended
+
+
+def is_stream(source):
+    """
+    Checks if a capture source is a network stream rather than a camera or file
+    :param source: Camera index, file name or URL
+    :return: True for URLs such as rtsp:// or http://
+    """
+    return isinstance(source, str) and "://" in source and not source.startswith("file://")
+
+
+class ImageFolderSource:
+    """
+    Stands in for cv2.VideoCapture by replaying images from disk, so capture can be tested without a camera
+    """
+    def __init__(self, images, fps=None, loop=True):
+        """
+        Builds a source from image files
+        :param images: Directory, glob pattern or list of image files
+        :param fps: Rate to replay frames at, None to replay as fast as they are read
+        :param loop: True to start over after the last image
+        """
+        if isinstance(images, str):
+            if os.path.isdir(images):
+                images = os.path.join(images, "*")
+            images = sorted(glob.glob(images))
+        self.files = list(images)
+        self.fps = fps
+        self.loop = loop
+        self.index = 0
+        self.next_time = None
+        self.opened = len(self.files) > 0
+
+    def isOpened(self):
+        """
+        Matches cv2.VideoCapture.isOpened
+        :return: True while there are frames left to read
+        """
+        return self.opened
+
+    def set(self, prop_id, value):
+        """
+        Matches cv2.VideoCapture.set. Properties can not be changed
+        :return: False
+        """
+        return False
+
+    def read(self, image=None):
+        """
+        Matches cv2.VideoCapture.read, reading the next image at the replay rate
+        :param image: Array to read the frame into if it has the right shape
+        :return: Success flag and frame
+        """
+        if not self.opened:
+            return False, None
+        if self.index >= len(self.files):
+            if not self.loop:
+                self.opened = False
+                return False, None
+            self.index = 0
+
+        # Wait until the frame is due
+        if self.fps:
+            now = time.perf_counter()
+            if self.next_time is not None and self.next_time > now:
+                time.sleep(self.next_time - now)
+            self.next_time = max(now, self.next_time or now) + 1 / self.fps
+
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def release(self):
+        """
+        Matches cv2.VideoCapture.release
+        :return: None
+        """
+        self.opened = False
+
+
+class FrameGrabber:
+    """
+    Reads frames from a capture source on a background thread into a fixed-size ring buffer. Readers always
+    get the newest frame, and frames that were replaced before being read are counted as dropped
+    """
+    def __init__(self, source, buffer_size=3):
+        """
+        Builds a grabber for a source
+        :param source: cv2.VideoCapture or anything with the same read method
+        :param buffer_size: Number of frames in the ring buffer, at least 2
+        """
+        if buffer_size < 2:
+            raise ValueError("Ring buffer needs at least 2 frames")
+        self.source = source
+        self.buffer_size = buffer_size
+        self.buffer = None  # Allocated once the frame size is known
+        self.sequence = [0] * buffer_size  # Frame number in each slot, 0 if empty or being written
+        self.timestamps = [0.0] * buffer_size  # Capture time of each slot
+        self.held_slot = None  # Slot of the frame last handed to the reader
+        self.lock = threading.Lock()
+        self.frame_ready = threading.Condition(self.lock)
+        self.thread = None
+        self.running = False
+
+        # Statistics
+        self.captured = 0
+        self.dropped = 0
+        self.failures = 0
+        self.last_read = 0
+        self.fps = 0.0
+        self.frame_age = 0.0
+
+    def start(self):
+        """
+        Starts capturing on a background thread. Fails if the thread of an earlier capture is still reading, as
+        two threads can not read from the same source
+        :return: None
+        """
+        if self.running:
+            return
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            if self.thread.is_alive():
+                raise RuntimeError("Capture thread is still blocked reading from the source")
+        self.running = True
+        self.thread = threading.Thread(target=self.capture_loop, name="FrameGrabber", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops capturing and waits for the capture thread to finish. A thread blocked reading is kept until it
+        finishes, so capture can not be restarted next to it
+        :return: None
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            if not self.thread.is_alive():
+                self.thread = None
+
+    def is_running(self):
+        """
+        Checks if frames are being captured
+        :return: True while the capture thread is running
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+    def next_slot(self):
+        """
+        Picks the oldest slot that is not held by the reader and marks it as being written. Must hold the lock
+        :return: Slot index
+        """
+        slot = min((i for i in range(self.buffer_size) if i != self.held_slot), key=lambda i: self.sequence[i])
+        self.sequence[slot] = 0
+        return slot
+
+    def capture_loop(self):
+        """
+        Reads frames until stopped
+        :return: None
+        """
+        last_time = None
+        while self.running:
+            with self.lock:
+                slot = self.next_slot()
+                target = None if self.buffer is None else self.buffer[slot]
+
+            # Read outside the lock, directly into the buffer when possible
+            ret, frame = self.source.read() if target is None else self.source.read(target)
+            now = time.perf_counter()
+            if not ret or frame is None:
+                self.failures += 1
+                if not self.source.isOpened():
+                    break
+                time.sleep(0.005)
+                continue
+
+            with self.lock:
+                # (Re)allocate the ring buffer on the first frame or if the frame size changes
+                if self.buffer is None or self.buffer.shape[1:] != frame.shape or self.buffer.dtype != frame.dtype:
+                    self.buffer = np.empty((self.buffer_size,) + frame.shape, dtype=frame.dtype)
+                    self.sequence = [0] * self.buffer_size
+                    self.held_slot = None
+                    target = None
+                if frame is not target:
+                    np.copyto(self.buffer[slot], frame)
+
+                self.captured += 1
+                self.sequence[slot] = self.captured
+                self.timestamps[slot] = now
+                if last_time is not None and now > last_time:
+                    rate = 1 / (now - last_time)
+                    self.fps = rate if self.fps == 0 else 0.9 * self.fps + 0.1 * rate
+                last_time = now
+                self.frame_ready.notify_all()
+        self.running = False
+
+    def read(self, timeout=None):
+        """
+        Takes the newest frame. The frame stays valid until the next call to read
+        :param timeout: Seconds to wait for a new frame, None to return immediately
+        :return: Success flag and frame, False if there is no frame newer than the last one read
+        """
+        with self.lock:
+            if timeout is not None:
+                self.frame_ready.wait_for(lambda: max(self.sequence) > self.last_read, timeout)
+            newest = int(np.argmax(self.sequence))
+            sequence = self.sequence[newest]
+            if sequence <= self.last_read:
+                return False, None
+
+            # Frames between the last one read and the newest one were never seen
+            self.dropped += sequence - self.last_read - 1
+            self.last_read = sequence
+            self.held_slot = newest
+            self.frame_age = time.perf_counter() - self.timestamps[newest]
+            return True, self.buffer[newest]
+
+    def get_stats(self):
+        """
+        Returns capture statistics
+        :return: Dictionary of capture rate, frame counts and age of the last frame read in seconds
+        """
+        return {'fps': self.fps, 'captured': self.captured, 'dropped': self.dropped,
+                'failures': self.failures, 'age': self.frame_age}
+
+
+class VideoReader:
+    """
+    Decodes a video file or stream on a background thread into a bounded queue, ahead of the frames being taken.
+    Files are only decoded as far ahead as the queue holds, so long recordings never fill memory. Live streams
+    drop the oldest decoded frame instead, so they never fall behind
+    """
+    def __init__(self, source, step=1, fps=None, queue_size=8, live=None, backend=cv2.CAP_ANY):
+        """
+        Opens a video and starts decoding it
+        :param source: Video file or stream URL
+        :param step: Only decode every step-th frame, skipping the others without decoding them
+        :param fps: Most frames per second to hand out, None to hand them out as fast as they are read
+        :param queue_size: Most decoded frames waiting to be read
+        :param live: True if the source is a live stream, defaults to True for URLs
+        :param backend: OpenCV capture backend
+        """
+        capture = cv2.VideoCapture(source, backend)
+        if not capture.isOpened():
+            capture.release()
+            raise IOError(f"Could not open video {source}")
+        self.source = source
+        self.capture = capture
+        self.step = max(1, step)
+        self.fps = fps
+        self.live = is_stream(source) if live is None else live
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_count = frame_count if frame_count > 0 and not self.live else None  # Unknown for streams
+        self.source_fps = capture.get(cv2.CAP_PROP_FPS) or None
+        self.queue = queue.Queue(queue_size)
+        self.position = 0  # Frame number of the next frame to decode
+        self.last_position = None  # Frame number of the last frame read
+        self.finished = False
+        self.next_time = None  # When the next frame is due if pacing
+        self.thread = None
+        self.running = False
+
+        # Statistics
+        self.decoded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.start()
+
+    def start(self):
+        """
+        Starts decoding on a background thread. Fails if the thread of an earlier start is still decoding
+        :return: None
+        """
+        if self.running:
+            return
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            if self.thread.is_alive():
+                raise RuntimeError("Decoding thread is still blocked reading from the video")
+        self.running = True
+        self.thread = threading.Thread(target=self.decode_loop, name="VideoReader", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops decoding, waits for the decoding thread to finish and discards the frames decoded ahead. A thread
+        blocked reading is kept until it finishes, so decoding can not be restarted next to it
+        :return: None
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            if not self.thread.is_alive():
+                self.thread = None
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def release(self):
+        """
+        Stops decoding and closes the video
+        :return: None
+        """
+        self.stop()
+        self.capture.release()
+
+    def put(self, item):
+        """
+        Queues a decoded frame, waiting for room in files and dropping the oldest frame in live streams
+        :param item: Frame number and frame, or None at the end of the video
+        :return: False if stopped before the frame was queued
+        """
+        while self.running:
+            try:
+                if self.live:
+                    self.queue.put_nowait(item)
+                else:
+                    self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if self.live:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        return False
+
+    def decode_loop(self):
+        """
+        Decodes frames until the end of the video or until stopped
+        :return: None
+        """
+        failures = 0
+        while self.running:
+            ret, frame = self.capture.read()
+            if not ret:
+                # Streams can stall for a moment, files are over
+                failures += 1
+                if self.live and failures < MAX_STREAM_FAILURES and self.capture.isOpened():
+                    time.sleep(0.01)
+                    continue
+                self.put(None)
+                break
+            failures = 0
+            self.decoded += 1
+            if not self.put((self.position, frame)):
+                break
+            self.position += 1
+
+            # Skip frames without decoding them
+            for _ in range(self.step - 1):
+                if not self.running or not self.capture.grab():
+                    break
+                self.skipped += 1
+                self.position += 1
+        self.running = False
+
+    def read(self, timeout=None, paced=True):
+        """
+        Takes the next decoded frame
+        :param timeout: Seconds to wait for a frame to be decoded, None to return immediately
+        :param paced: False to ignore the target rate, eg to step through a paused video
+        :return: Success flag and frame, False if no frame is due or decoded yet, or the video is over
+        """
+        if self.finished:
+            return False, None
+        now = time.perf_counter()
+        if paced and self.fps and self.next_time is not None and now < self.next_time:
+            return False, None
+        try:
+            item = self.queue.get(timeout=timeout) if timeout is not None else self.queue.get_nowait()
+        except queue.Empty:
+            return False, None
+        if item is None:
+            self.finished = True
+            return False, None
+
+        if paced and self.fps:
+            self.next_time = max(now, self.next_time or now) + 1 / self.fps
+        self.last_position, frame = item
+        return True, frame
+
+    def frames(self):
+        """
+        Reads every remaining frame, waiting for each to be decoded and ignoring the target rate
+        :return: Generator of frame number and frame
+        """
+        while True:
+            ret, frame = self.read(timeout=1, paced=False)
+            if ret:
+                yield self.last_position, frame
+            elif self.finished or (not self.running and self.queue.empty()):
+                return
+
+    def seek(self, position):
+        """
+        Moves to a frame. Frames decoded ahead are discarded and decoding restarts from there
+        :param position: Frame number to move to
+        :return: Frame number moved to
+        """
+        if self.live:
+            raise ValueError("Can not seek in a live stream")
+        self.stop()
+        if self.thread is not None:
+            raise RuntimeError("Decoding thread is still blocked reading from the video")
+        position = max(0, position if self.frame_count is None else min(position, self.frame_count - 1))
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+        self.position = position
+        self.finished = False
+        self.next_time = None
+        self.start()
+        return position
+
+    def get_stats(self):
+        """
+        Returns decoding statistics
+        :return: Dictionary of the last frame number read, frame count and rate of the video, frames decoded,
+        skipped and dropped, frames waiting and whether the video is over
+        """
+        return {'position': self.last_position, 'frame_count': self.frame_count, 'fps': self.source_fps,
+                'decoded': self.decoded, 'skipped': self.skipped, 'dropped': self.dropped,
+                'queued': self.queue.qsize(), 'finished': self.finished}
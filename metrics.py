@@ -0,0 +1,289 @@
+"""
+Records per-stage timings, counts and output sizes of the detection pipeline into rolling histograms. Metrics are
+off by default, and while off every hook returns immediately. Once enabled they can be read with get_snapshot,
+logged periodically and served as Prometheus text over HTTP
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+enabled = False
+registry = None  # MetricsRegistry while enabled
+server = None  # HTTP server while serving
+current = threading.local()  # Component each thread is processing
+
+
+class RollingHistogram:
+    """
+    Keeps the most recent values of a metric for quantiles, and totals over all values
+    """
+    def __init__(self, window):
+        """
+        Builds an empty histogram
+        :param window: Number of recent values to keep
+        """
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        """
+        Adds a value
+        :param value: Value to add
+        :return: None
+        """
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        """
+        Summarizes the histogram
+        :return: Dictionary of total count and sum, and mean, quantiles and max of the recent values
+        """
+        recent = np.array(self.values, dtype=np.float64)
+        summary = {'count': self.count, 'sum': self.total, 'mean': float(recent.mean()), 'max': float(recent.max())}
+        for quantile, value in zip(QUANTILES, np.quantile(recent, QUANTILES)):
+            summary[f"p{int(quantile * 100)}"] = float(value)
+        return summary
+
+
+class MetricsRegistry:
+    """
+    Holds a rolling histogram for every metric, stage and component seen
+    """
+    def __init__(self, window=300, log_interval=None):
+        """
+        Builds an empty registry
+        :param window: Number of recent values each histogram keeps
+        :param log_interval: Seconds between log lines, None to not log
+        """
+        self.window = window
+        self.log_interval = log_interval
+        self.histograms = dict()  # By metric name, stage and component
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.last_log = time.perf_counter()
+
+    def observe(self, metric, stage, component, value):
+        """
+        Adds a value to a histogram
+        :param metric: Name of the metric, eg 'seconds'
+        :param stage: Pipeline stage
+        :param component: Component name, None for the whole frame
+        :param value: Value to add
+        :return: None
+        """
+        key = (metric, stage, component)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = RollingHistogram(self.window)
+            histogram.observe(value)
+
+    def snapshot(self):
+        """
+        Summarizes every histogram
+        :return: Dictionary of summaries by metric, stage and component ('frame' for the whole frame)
+        """
+        with self.lock:
+            items = [(key, histogram.summary()) for key, histogram in self.histograms.items()]
+        snapshot = {'frames': self.frames}
+        for (metric, stage, component), summary in sorted(items, key=lambda item: str(item[0])):
+            snapshot.setdefault(metric, dict()).setdefault(stage, dict())[component or 'frame'] = summary
+        return snapshot
+
+    def prometheus_text(self):
+        """
+        Formats every histogram as a Prometheus summary
+        :return: Text in the Prometheus exposition format
+        """
+        with self.lock:
+            items = sorted(((key, histogram.summary()) for key, histogram in self.histograms.items()),
+                           key=lambda item: str(item[0]))
+        lines = ["# TYPE leprechaun_frames_total counter", f"leprechaun_frames_total {self.frames}"]
+        typed = set()
+        for (metric, stage, component), summary in items:
+            name = f"leprechaun_stage_{metric}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} summary")
+                typed.add(name)
+            labels = f'stage="{stage}",component="{component or "frame"}"'
+            for quantile in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{quantile}"}} {summary[f"p{int(quantile * 100)}"]}')
+            lines.append(f"{name}_sum{{{labels}}} {summary['sum']}")
+            lines.append(f"{name}_count{{{labels}}} {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def log_line(self):
+        """
+        Summarizes the mean time of each stage, summed over components, on one line
+        :return: Text to log
+        """
+        with self.lock:
+            items = [(key, histogram.summary()) for key, histogram in self.histograms.items()]
+        stages = dict()
+        for (metric, stage, component), summary in items:
+            if metric == 'seconds':
+                stages[stage] = stages.get(stage, 0) + summary['mean']
+        times = " ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in sorted(stages.items()))
+        return f"frames={self.frames} {times}"
+
+    def frame_done(self):
+        """
+        Counts a processed frame and logs a summary if the log interval passed
+        :return: None
+        """
+        self.frames += 1
+        if self.log_interval is not None:
+            now = time.perf_counter()
+            if now - self.last_log >= self.log_interval:
+                self.last_log = now
+                logger.info(self.log_line())
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics as Prometheus text at /metrics
+    """
+    def do_GET(self):
+        """
+        Handles a request
+        :return: None
+        """
+        if self.path.split("?")[0] != "/metrics" or registry is None:
+            self.send_error(404)
+            return
+        body = registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Keeps requests out of the console
+        :return: None
+        """
+
+
+def enable(window=300, log_interval=None, port=None, host="127.0.0.1"):
+    """
+    Starts recording metrics, discarding any recorded before
+    :param window: Number of recent values each histogram keeps
+    :param log_interval: Seconds between log lines, None to not log
+    :param port: Port to serve Prometheus text on, None to not serve
+    :param host: Address to serve on, local only by default
+    :return: None
+    """
+    global enabled, registry
+    registry = MetricsRegistry(window, log_interval)
+    enabled = True
+    if port is not None:
+        serve(port, host)
+
+
+def disable():
+    """
+    Stops recording and serving metrics
+    :return: None
+    """
+    global enabled, registry, server
+    enabled = False
+    registry = None
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
+
+
+def serve(port, host="127.0.0.1"):
+    """
+    Serves Prometheus text at http://host:port/metrics on a background thread
+    :param port: Port to serve on, 0 to pick a free one
+    :param host: Address to serve on
+    :return: Port served on
+    """
+    global server
+    if server is None:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    return server.server_address[1]
+
+
+def get_snapshot():
+    """
+    Summarizes the recorded metrics
+    :return: Dictionary from MetricsRegistry.snapshot, None if metrics are disabled
+    """
+    return None if registry is None else registry.snapshot()
+
+
+def set_component(name):
+    """
+    Sets the component the calling thread is processing, used for stages that do not know it
+    :param name: Component name, None for the whole frame
+    :return: None
+    """
+    if enabled:
+        current.component = name
+
+
+def start():
+    """
+    Starts timing a stage
+    :return: Start time, None if metrics are disabled
+    """
+    return time.perf_counter() if enabled else None
+
+
+def stop(started, stage, output=None, component=None):
+    """
+    Records the time since start and the size of the stage's output
+    :param started: Value returned by start
+    :param stage: Name of the stage
+    :param output: Array the stage produced, to record its size
+    :param component: Component name, defaults to the one set with set_component
+    :return: None
+    """
+    if started is None or registry is None:
+        return
+    seconds = time.perf_counter() - started
+    if component is None:
+        component = getattr(current, 'component', None)
+    registry.observe('seconds', stage, component, seconds)
+    if output is not None:
+        registry.observe('bytes', stage, component, output.nbytes)
+
+
+def count(stage, value, component=None):
+    """
+    Records a count, eg of contours found
+    :param stage: Name of what was counted
+    :param value: Count
+    :param component: Component name, defaults to the one set with set_component
+    :return: None
+    """
+    if not enabled or registry is None:
+        return
+    if component is None:
+        component = getattr(current, 'component', None)
+    registry.observe('count', stage, component, value)
+
+
+def frame_done():
+    """
+    Counts a processed frame, logging a summary if it is time to
+    :return: None
+    """
+    if enabled and registry is not None:
+        registry.frame_done()
@@ -0,0 +1,198 @@
+"""
+Reads and writes models in a versioned file format: a magic string, the length of a JSON header, the header and the
+raw arrays it describes. Arrays are memory mapped when a model is read, so loading only touches the data that is
+used. Running this module converts models pickled by earlier versions to the format
+"""
+
+import argparse
+import json
+import os
+import pickle
+import stat
+import tempfile
+import numpy as np
+from data_sample import ComponentSample
+
+MAGIC = b"LEPRECHAUN-MODEL"
+FORMAT_VERSION = 1
+ALIGNMENT = 64  # Bytes each array is aligned to
+
+
+def align(offset):
+    """
+    Rounds an offset up to the array alignment
+    :param offset: Offset in bytes
+    :return: Aligned offset
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def is_model_file(filename):
+    """
+    Checks if a file is in the model format
+    :param filename: File to check
+    :return: True if the file starts with the format's magic string
+    """
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def is_mapped_from(array, filename):
+    """
+    Checks if an array, or the array it is a view of, is memory mapped from a file
+    :param array: Array to check
+    :param filename: File to check for
+    :return: True if the array reads from the file
+    """
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap) and array.filename is not None:
+            return os.path.samefile(array.filename, filename)
+        array = array.base
+    return False
+
+
+def load_mapped(components, filename):
+    """
+    Copies the arrays of components that are memory mapped from a file into memory, so the file can be replaced.
+    Windows can not replace a file while it is mapped
+    :param components: Dictionary of ComponentSample by name
+    :param filename: Mapped file
+    :return: None
+    """
+    for name, component in components.items():
+        record, arrays = component.get_record(name + "/")
+        if any(is_mapped_from(array, filename) for array in arrays.values()):
+            component.set_record(record, {key: np.array(array) for key, array in arrays.items()}, name + "/")
+
+
+def write_components(file, components):
+    """
+    Writes the header and arrays of components to an open file
+    :param file: File opened for writing in binary
+    :param components: Dictionary of ComponentSample by name
+    :return: None
+    """
+    header = {'version': FORMAT_VERSION, 'components': dict(), 'arrays': dict()}
+    arrays = dict()
+    for name, component in components.items():
+        header['components'][name], component_arrays = component.get_record(name + "/")
+        arrays.update(component_arrays)
+
+    # Lay out the arrays one after another, relative to the end of the header
+    offset = 0
+    for key, array in arrays.items():
+        arrays[key] = array = np.ascontiguousarray(array)
+        header['arrays'][key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = align(offset + array.nbytes)
+    header_bytes = json.dumps(header, default=lambda value: value.item()).encode()
+    data_start = align(len(MAGIC) + 8 + len(header_bytes))
+
+    file.write(MAGIC)
+    file.write(len(header_bytes).to_bytes(8, "little"))
+    file.write(header_bytes)
+    for key, array in arrays.items():
+        file.seek(data_start + header['arrays'][key]['offset'])
+        file.write(array.tobytes())
+
+
+def file_mode(filename):
+    """
+    Finds the permissions a saved file should get: those of the file it replaces, or the ones open would give a
+    new file under the current umask
+    :param filename: File being saved
+    :return: Permission bits
+    """
+    if os.path.isfile(filename):
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_model(filename, components):
+    """
+    Writes components to a model file. The file is only replaced once the new one is completely written, and keeps
+    the permissions of the file it replaces. Components memory mapped from the file are loaded into memory first,
+    as a mapped file can not be replaced on Windows
+    :param filename: File to write
+    :param components: Dictionary of ComponentSample by name
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            write_components(file, components)
+        os.chmod(temp_name, file_mode(filename))  # Temporary files are only readable by their owner
+        if os.path.isfile(filename):
+            load_mapped(components, filename)
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def read_model(filename):
+    """
+    Reads components from a model file, memory mapping their arrays
+    :param filename: File to read
+    :return: Dictionary of ComponentSample by name
+    """
+    with open(filename, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{filename} is not a model file. Convert pickled models with python model_file.py")
+        header_length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_length))
+    if header['version'] > FORMAT_VERSION:
+        raise ValueError(f"{filename} has format version {header['version']}, only {FORMAT_VERSION} is supported")
+    data_start = align(len(MAGIC) + 8 + header_length)
+
+    arrays = dict()
+    for key, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if np.prod(shape) == 0:  # Empty arrays can not be mapped
+            arrays[key] = np.empty(shape, dtype=info['dtype'])
+        else:
+            arrays[key] = np.memmap(filename, dtype=info['dtype'], mode='r', offset=data_start + info['offset'],
+                                    shape=shape)
+
+    components = dict()
+    for name, record in header['components'].items():
+        components[name] = ComponentSample(None, name)
+        components[name].set_record(record, arrays, name + "/")
+    return components
+
+
+def convert_pickle(source, destination):
+    """
+    Converts a pickled model to a model file. Only convert pickles from trusted sources, loading them can run code
+    :param source: Pickled model
+    :param destination: Model file to write
+    :return: Dictionary of the converted ComponentSample by name
+    """
+    with open(source, "rb") as file:
+        components = pickle.load(file)
+    write_model(destination, components)
+    return components
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description="Converts a pickled model to the model file format")
+    parser.add_argument('source', help="Pickled model, eg leprechaun.npy")
+    parser.add_argument('destination', nargs='?', help="Model file to write, defaults to the source with .model")
+    args = parser.parse_args(args)
+
+    destination = args.destination or os.path.splitext(args.source)[0] + ".model"
+    if os.path.isfile(args.source) and is_model_file(args.source):
+        parser.error(f"{args.source} is already a model file")
+    components = convert_pickle(args.source, destination)
+    print(f"Converted {len(components)} components to {destination}")
+
+
+if __name__ == '__main__':
+    main()
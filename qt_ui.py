@@ -4,13 +4,63 @@ for CS549 group M
 """
 
 import sys
-from PyQt5.QtGui import QPixmap, QImage
+import numpy as np
+from PyQt5.QtGui import QPixmap, QImage, QPainter
 
 from PyQt5.QtWidgets import QApplication, QLabel, QPushButton, QVBoxLayout, QWidget, QFileDialog, QTextEdit, \
-    QSizePolicy, QMessageBox, QHBoxLayout, QRadioButton, QSlider
-from PyQt5.QtCore import Qt, QStringListModel, QSize, QTimer
+    QSizePolicy, QMessageBox, QHBoxLayout, QRadioButton, QSlider, QCheckBox, QInputDialog
+from PyQt5.QtCore import Qt, QStringListModel, QSize, QTimer, pyqtSignal
 
 from detection_controller import DetectionController
+from detection_worker import DetectionWorker
+
+FRAME_INTERVAL = 1000 // 24  # Milliseconds between checks for new frames
+
+
+class FrameView(QWidget):
+    """
+    Shows a BGR frame by painting a QImage that wraps the frame's own buffer, so frames are never copied to be
+    displayed. The frame is kept until the next one replaces it, as the image does not own its data
+    """
+    clicked = pyqtSignal(int, int)  # x and y of a click on the frame
+
+    def __init__(self):
+        """
+        Builds an empty view
+        """
+        QWidget.__init__(self)
+        self.frame = None  # Frame the image reads from
+        self.image = None
+
+    def set_frame(self, frame):
+        """
+        Shows a frame. It must not be changed while it is shown
+        :param frame: BGR frame
+        :return: None
+        """
+        self.frame = np.ascontiguousarray(frame)
+        self.image = QImage(self.frame.data, self.frame.shape[1], self.frame.shape[0], self.frame.strides[0],
+                            QImage.Format_BGR888)
+        self.update()
+
+    def paintEvent(self, event):
+        """
+        Paints the frame
+        :param event:
+        :return:
+        """
+        if self.image is not None:
+            painter = QPainter(self)
+            painter.drawImage(0, 0, self.image)
+            painter.end()
+
+    def mousePressEvent(self, event):
+        """
+        Reports clicks on the frame
+        :param event:
+        :return:
+        """
+        self.clicked.emit(event.pos().x(), event.pos().y())
 
 
 class UI_Window(QWidget):
@@ -49,27 +99,60 @@ class UI_Window(QWidget):
         btnCamera.clicked.connect(self.stopCamera)
         button_layout.addWidget(btnCamera)
 
+        # Add a checkbox for tracking
+        trackBox = QCheckBox("Track leprechaun")
+        trackBox.toggled.connect(self.trackingChanged)
+        button_layout.addWidget(trackBox)
+
         layout.addLayout(button_layout)
 
+        # Add video controls
+        video_layout = QHBoxLayout()
+
+        btnStream = QPushButton("Open stream")
+        btnStream.clicked.connect(self.openStream)
+        video_layout.addWidget(btnStream)
+
+        self.pauseBox = QCheckBox("Pause video")
+        self.pauseBox.toggled.connect(self.pauseChanged)
+        video_layout.addWidget(self.pauseBox)
+
+        btnStep = QPushButton("Step frame")
+        btnStep.clicked.connect(self.stepVideo)
+        video_layout.addWidget(btnStep)
+
+        # Seek by dragging, the position follows the video otherwise
+        self.seekSlider = QSlider(Qt.Horizontal)
+        self.seekSlider.setEnabled(False)
+        self.seekSlider.sliderReleased.connect(self.seekVideo)
+        video_layout.addWidget(self.seekSlider)
+
+        layout.addLayout(video_layout)
+
         center_layout = QHBoxLayout()
         left_layout = QVBoxLayout()
         right_layout = QVBoxLayout()
 
-        # Add a label to hold raw image
-        self.raw_frame = QLabel()
+        # Add a view to hold raw image
+        self.raw_frame = FrameView()
         self.raw_frame.setFixedSize(640, 360)
+        self.raw_frame.clicked.connect(self.getImgPos)
         left_layout.addWidget(self.raw_frame)
 
-        # Add a label to hold filtered image
-        self.filtered_frame = QLabel()
+        # Add a view to hold filtered image
+        self.filtered_frame = FrameView()
         self.filtered_frame.setFixedSize(640, 360)
+        self.filtered_frame.clicked.connect(self.getContourPos)
         left_layout.addWidget(self.filtered_frame)
 
         # Set last frame
         self.last_frame = None
 
-        # Create controller
-        self.det_controller = DetectionController()
+        # Create controller, run on a worker thread. Frames stay in BGR, which the views show directly
+        self.det_controller = DetectionController(rgb_output=False)
+        self.worker = DetectionWorker(self.det_controller)
+        self.worker.command_done.connect(self.commandDone)
+        self.last_version = 0  # Version of the last frames displayed
 
         # Create radio buttons
         for i, comp in enumerate(self.det_controller.object.components.keys()):
@@ -132,26 +215,46 @@ class UI_Window(QWidget):
         self.setWindowTitle("Leprechaun Detector")
         self.setFixedSize(1000, 900)
 
+        # Start processing
+        self.worker.start()
+
+    def commandDone(self, name, result):
+        """
+        Handle the result of a command run by the worker
+        :param name: Name of the command
+        :param result: What the command returned
+        :return:
+        """
+        if name == 'handle_click':
+            self.click_text.setText(result)
+        elif name in ('process_from_file', 'process_from_video') and isinstance(result, dict):
+            # Opened a video, only files with a known length can be seeked
+            self.pauseBox.setChecked(False)
+            frame_count = result['frame_count']
+            self.seekSlider.setEnabled(frame_count is not None)
+            self.seekSlider.setRange(0, max(0, (frame_count or 1) - 1))
+            self.seekSlider.setValue(0)
+
     def clearColor(self):
         """
         Clear data for a color
         :return:
         """
-        self.det_controller.clear_color()
+        self.worker.send('clear_color')
 
     def saveContour(self):
         """
         Save a contour to model
         :return:
         """
-        self.det_controller.save_sizes()
+        self.worker.send('save_sizes')
 
     def clearContour(self):
         """
         Clear contours for the selected component
         :return:
         """
-        self.det_controller.clear_sizes()
+        self.worker.send('clear_sizes')
 
     def sliderChanged(self, value):
         """
@@ -159,7 +262,38 @@ class UI_Window(QWidget):
         :param value: New value
         :return:
         """
-        self.det_controller.set_slider(self.sender().slider_name, value)
+        self.worker.send('set_slider', self.sender().slider_name, value)
+
+    def trackingChanged(self, checked):
+        """
+        Handle turning tracking on or off
+        :param checked: True to track
+        :return:
+        """
+        self.worker.send('set_tracking', checked)
+
+    def pauseChanged(self, checked):
+        """
+        Handle pausing or resuming the video
+        :param checked: True to pause
+        :return:
+        """
+        self.worker.send('set_video_paused', checked)
+
+    def stepVideo(self):
+        """
+        Handle stepping the video one frame ahead
+        :return:
+        """
+        self.pauseBox.setChecked(True)
+        self.worker.send('step_video')
+
+    def seekVideo(self):
+        """
+        Handle moving the video to the frame picked with the slider
+        :return:
+        """
+        self.worker.send('seek_video', self.seekSlider.value())
 
     def compChanged(self):
         """
@@ -169,8 +303,8 @@ class UI_Window(QWidget):
         radiobutton = self.sender()
         if radiobutton.isChecked():
             print(f"Changed to {radiobutton.component}")
-            self.det_controller.selected_component = radiobutton.component
-            slider_stats = self.det_controller.get_slider_values()
+            self.worker.send('select_component', radiobutton.component)
+            slider_stats = self.det_controller.get_slider_values(radiobutton.component)
             for slider_name in slider_stats.keys():
                 slider = self.sliders[slider_name]
                 slider.setFocusPolicy(Qt.StrongFocus)
@@ -193,6 +327,9 @@ class UI_Window(QWidget):
         if reply == QMessageBox.Yes:
             event.accept()
             self.stopCamera()
+            self.worker.stop()
+            self.det_controller.release_camera()
+            self.det_controller.close_video()
         else:
             event.ignore()
 
@@ -224,61 +361,71 @@ class UI_Window(QWidget):
 
     def pickFile(self):
         """
-        Handles selecting an image to process
+        Handles selecting an image or video to process
         :return:
         """
         self.stopCamera()
-        # Load an image file.
+        # Load an image or video file.
         filename = QFileDialog.getOpenFileName(self, 'Open file',
                                                'E:\\Program Files (x86)\\Dynamsoft\\Barcode Reader 7.1\\Images',
-                                               "Barcode images (*)")
+                                               "Images and videos (*)")
+        if not filename[0]:
+            return
         # Update
-        raw, filtered = self.det_controller.process_from_file(filename[0])
-        self.updateFrameDisplay(raw, filtered)
-        self.timer.start(1000. / 24)
+        self.worker.send('process_from_file', filename[0])
+        self.timer.start(FRAME_INTERVAL)
+
+    def openStream(self):
+        """
+        Handles opening a video stream by its URL
+        :return:
+        """
+        url, ok = QInputDialog.getText(self, 'Open stream', "Stream URL, eg rtsp://host/path")
+        if not ok or not url:
+            return
+        self.stopCamera()
+        self.worker.send('process_from_video', url)
+        self.timer.start(FRAME_INTERVAL)
 
     def openCamera(self):
         """
         Handle starting the camera
         :return:
         """
-        self.det_controller.set_input_to_camera()
-        self.timer.start(1000. / 24)
+        self.worker.send('set_input_to_camera')
+        self.timer.start(FRAME_INTERVAL)
 
     def stopCamera(self):
         """
         Handle pausing the camera
         :return:
         """
-        self.det_controller.set_input_to_static()
+        self.worker.send('set_input_to_static')
 
     def saveModel(self):
         """
         Handle saving the model
         :return:
         """
-        self.det_controller.object.save()
+        self.worker.send('save_model')
 
-    def getImgPos(self, event):
+    def getImgPos(self, x, y):
         """
         Handle clicking the image
-        :param event:
+        :param x: x coord of click
+        :param y: y coord of click
         :return:
         """
-        x = event.pos().x()
-        y = event.pos().y()
-        result = self.det_controller.handle_click(x, y)
-        self.click_text.setText(result)
+        self.worker.send('handle_click', x, y)
 
-    def getContourPos(self, event):
+    def getContourPos(self, x, y):
         """
         Handle clicking a contour
-        :param event:
+        :param x: x coord of click
+        :param y: y coord of click
         :return:
         """
-        x = event.pos().x()
-        y = event.pos().y()
-        self.det_controller.save_contour(x, y)
+        self.worker.send('save_contour', x, y)
 
         # https://stackoverflow.com/questions/41103148/capture-webcam-video-using-pyqt
     def nextFrameSlot(self):
@@ -286,31 +433,28 @@ class UI_Window(QWidget):
         Process next frame
         :return:
         """
-        # Get frames
-        raw, filtered = self.det_controller.update_image()
+        # Get the frames the worker finished most recently
+        version, frames = self.worker.results.get()
+        if frames is None or version == self.last_version:  # Nothing new
+            return
+        self.last_version = version
+        raw, filtered = frames
         self.updateFrameDisplay(raw, filtered)
 
+        # Follow the video's position unless the slider is being dragged
+        stats = self.det_controller.get_video_stats()
+        if stats is not None and stats['position'] is not None and not self.seekSlider.isSliderDown():
+            self.seekSlider.setValue(stats['position'])
+
     def updateFrameDisplay(self, raw, filtered):
         """
         Update displayed frame
-        :param raw: Raw frame to display
-        :param filtered: Processed frame to display
+        :param raw: Raw BGR frame to display
+        :param filtered: Processed BGR frame to display
         :return:
         """
-
-        # Convert to QImage
-        raw_image = QImage(raw, raw.shape[1], raw.shape[0], QImage.Format_RGB888)
-        filtered_image = QImage(filtered, filtered.shape[1], filtered.shape[0], QImage.Format_RGB888)
-
-        # Add to frame as pixmap
-        raw_pixmap = QPixmap.fromImage(raw_image)
-        filtered_pixmap = QPixmap.fromImage(filtered_image)
-        self.raw_frame.setPixmap(raw_pixmap)
-        self.filtered_frame.setPixmap(filtered_pixmap)
-
-        # Add click handlers
-        self.raw_frame.mousePressEvent = self.getImgPos
-        self.filtered_frame.mousePressEvent = self.getContourPos
+        self.raw_frame.set_frame(raw)
+        self.filtered_frame.set_frame(filtered)
 
 
 def main():
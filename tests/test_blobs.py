@@ -0,0 +1,47 @@
+import numpy as np
+import cv2
+import pytest
+from data_sample import find_large_blobs, MIN_CONTOUR_AREA
+from benchmarks.scenes import notched_polygon
+
+
+def make_binary(seed, speckle):
+    """
+    Draws filled shapes, shapes with holes holding smaller shapes, and random speckle
+    """
+    rng = np.random.default_rng(seed)
+    binary = np.zeros((360, 640), dtype=np.uint8)
+    for _ in range(12):
+        center = (int(rng.integers(40, 600)), int(rng.integers(40, 320)))
+        radius = int(rng.integers(6, 60))
+        cv2.fillPoly(binary, [notched_polygon(center, radius, rng.uniform(0, 6))], 255)
+        if radius > 30 and rng.random() < 0.5:
+            cv2.circle(binary, center, radius // 2, 0, -1)
+            cv2.circle(binary, center, radius // 4, 255, -1)
+    binary[rng.random(binary.shape) < speckle] = 255
+    return binary
+
+
+def traced(binary, min_area, offset=(0, 0)):
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset)
+    return [contour for contour in contours if cv2.contourArea(contour) > min_area]
+
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('speckle', [0, 0.01, 0.05])
+@pytest.mark.parametrize('min_area', [MIN_CONTOUR_AREA, 50])
+def test_large_blobs_match_traced_contours(seed, speckle, min_area):
+    binary = make_binary(seed, speckle)
+    expected = traced(binary, min_area)
+    contours, blobs = find_large_blobs(binary, min_area)
+    assert len(contours) == len(expected)
+    for contour, other in zip(contours, expected):
+        np.testing.assert_array_equal(contour, other)
+    assert blobs >= len(expected)
+
+
+def test_offset_moves_contours():
+    binary = make_binary(0, 0)
+    contours, _ = find_large_blobs(binary, MIN_CONTOUR_AREA, (30, 40))
+    expected = traced(binary, MIN_CONTOUR_AREA, (30, 40))
+    assert [contour.tolist() for contour in contours] == [contour.tolist() for contour in expected]
@@ -0,0 +1,75 @@
+import numpy as np
+import cv2
+import pytest
+import benchmarks.scenes
+from data_sample import hsv_index, LUT_MIN_USES
+from detection_controller import DetectionController
+from benchmarks.scenes import build_model
+from benchmarks.score_paths import float64_threshold, make_frame
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('threshold', [20, 40, 60])
+def test_lut_matches_float64(seed, threshold):
+    image, color = make_frame((320, 240), seed)
+    color.slider_stats.update({'threshold': threshold, 'blur': 0})
+    expected = float64_threshold(color, image)
+
+    lut = color.get_lut()
+    for scores in (lut.lookup(image), lut.lookup(image, hsv_index(image))):
+        np.testing.assert_array_equal(np.where(scores > 127, 255, 0), expected)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_direct_scores_match_float64(seed):
+    # Scoring in float32 may only flip pixels right at the threshold
+    image, color = make_frame((320, 240), seed)
+    color.slider_stats.update({'threshold': 40, 'blur': 0})
+    assert np.count_nonzero(color.threshold_direct(image) != float64_threshold(color, image)) <= image.size // 10000
+
+
+def test_score_table_follows_threshold():
+    image, color = make_frame((320, 240))
+    color.slider_stats['threshold'] = 20
+    table = color.get_lut()
+    assert color.get_lut() is table
+    color.slider_stats['threshold'] = 50
+    assert not color.has_current_lut()
+    np.testing.assert_array_equal(np.where(color.get_lut().lookup(image) > 127, 255, 0),
+                                  float64_threshold(color, image))
+
+
+def test_regions_of_a_frame_count_once():
+    _, color = make_frame((320, 240))
+    for region in ('coarse', (0, 0, 10, 10), (20, 0, 40, 10)):
+        assert not color.use_lut((1, region))
+    assert color.lut_uses[1] == 1
+
+    # Scoring the same frame again counts, once for all its regions
+    for region in ('coarse', (0, 0, 10, 10)):
+        color.use_lut((1, region))
+    assert color.lut_uses[1] == 2
+    assert color.use_lut((2, 'coarse'))
+
+
+def test_still_frame_moves_to_score_table(tmp_path):
+    model = build_model()
+    for component in model.components.values():
+        component.color.clear_cache()
+    filename = str(tmp_path / "still.png")
+    cv2.imwrite(filename, benchmarks.scenes.make_scene((640, 360), 2)[0])
+
+    controller = DetectionController(frame_size=None)
+    controller.model = model
+    controller.select_component("Shirt")
+    controller.process_from_file(filename)
+    shirt = model.components['Shirt'].color
+    assert not shirt.has_current_lut()
+
+    # Scoring the still again with the same model, eg while changing the blur, builds the table
+    for blur in range(1, LUT_MIN_USES):
+        assert not shirt.has_current_lut()
+        controller.set_slider('blur', 2 * blur + 1)
+        controller.update_image()
+    assert shirt.has_current_lut()
+    assert not model.components['Hat'].color.has_current_lut()
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from data_sample import DataSample
+
+
+def make_points(count, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (count, 3)).astype(np.uint8)
+
+
+def assert_stats(sample, points):
+    sample.calculate_stats()
+    assert sample.count == sample.stats_count == len(points)
+    np.testing.assert_array_equal(sample.data, points)
+    np.testing.assert_allclose(sample.mean, np.mean(points, axis=0, dtype=np.float64), rtol=1e-12)
+    np.testing.assert_allclose(sample.sd, np.std(points, axis=0, dtype=np.float64), rtol=1e-10)
+
+
+def test_single_adds():
+    points = make_points(50)
+    sample = DataSample()
+    for point in points:
+        sample.add_data(point)
+    assert_stats(sample, points)
+
+
+def test_batch_adds():
+    points = make_points(300)
+    sample = DataSample()
+    for batch in np.split(points, [7, 8, 120]):
+        sample.add_data_batch(batch)
+    assert_stats(sample, points)
+
+
+def test_mixed_adds():
+    points = make_points(200)
+    sample = DataSample()
+    sample.add_data(points[0])
+    sample.add_data_batch(points[1:60])
+    for point in points[60:70]:
+        sample.add_data(point)
+    sample.add_data_batch(points[70:])
+    assert_stats(sample, points)
+
+
+def test_merge():
+    points = make_points(120)
+    sample, other = DataSample(), DataSample()
+    sample.add_data_batch(points[:45])
+    for point in points[45:]:
+        other.add_data(point)
+    sample.merge(other)
+    assert_stats(sample, points)
+
+    # Merging into an empty sample copies the other one
+    empty = DataSample()
+    empty.merge(sample)
+    assert_stats(empty, points)
+
+
+def test_merge_stats_without_data():
+    points = make_points(80)
+    sample = DataSample()
+    sample.add_data_batch(points[:30])
+    rest = points[30:].astype(np.float64)
+    sample.merge_stats(len(rest), rest.mean(axis=0), np.sum(np.square(rest - rest.mean(axis=0)), axis=0))
+    sample.calculate_stats()
+    assert sample.count == 30 and sample.stats_count == 80
+    np.testing.assert_allclose(sample.mean, np.mean(points, axis=0, dtype=np.float64), rtol=1e-12)
+    np.testing.assert_allclose(sample.sd, np.std(points, axis=0, dtype=np.float64), rtol=1e-10)
+
+
+def test_buffer_grows_past_capacity():
+    points = make_points(1000)
+    sample = DataSample()
+    capacities = set()
+    for point in points:
+        sample.add_data(point)
+        capacities.add(len(sample.buffer))
+    assert len(capacities) > 3 and max(capacities) < 2 * len(points)
+    assert_stats(sample, points)
+
+
+def test_record_round_trip():
+    points = make_points(100)
+    sample = DataSample()
+    sample.add_data_batch(points[:60])
+    sample.calculate_stats()
+    record, arrays = sample.get_record('color_')
+
+    restored = DataSample()
+    restored.set_record(record, {name: array.copy() for name, array in arrays.items()}, 'color_')
+    assert_stats(restored, points[:60])
+
+    # Read only data, eg memory mapped, is copied once more is added
+    arrays['color_data'].flags.writeable = False
+    restored.set_record(record, arrays, 'color_')
+    for point in points[60:]:
+        restored.add_data(point)
+    assert_stats(restored, points)
+
+
+def test_size_mismatch():
+    sample = DataSample()
+    sample.add_data_batch(make_points(5))
+    with pytest.raises(Exception):
+        sample.add_data(np.zeros(4))
+    with pytest.raises(Exception):
+        sample.add_data_batch(np.zeros((2, 4)))
@@ -0,0 +1,130 @@
+import os
+import threading
+import numpy as np
+import cv2
+import pytest
+import debug_capture
+from debug_capture import DebugWriter
+from detection_controller import DetectionController
+from benchmarks.scenes import make_scene, build_model
+
+IMAGE = np.zeros((4, 4), dtype=np.uint8)
+
+
+@pytest.fixture
+def blocked_writes(monkeypatch):
+    """
+    Holds the writer thread in its first write until released, recording the files written
+    """
+    started, release, written = threading.Event(), threading.Event(), []
+    imwrite = cv2.imwrite
+
+    def write(filename, image):
+        started.set()
+        release.wait(5)
+        written.append(os.path.basename(filename))
+        return imwrite(filename, image)
+
+    monkeypatch.setattr(cv2, 'imwrite', write)
+    return started, release, written
+
+
+def run_in_thread(function):
+    # Frames and names are kept per thread, so each test starts from a fresh one
+    thread = threading.Thread(target=function)
+    thread.start()
+    thread.join()
+
+
+@pytest.fixture
+def capture(tmp_path):
+    yield lambda **kwargs: debug_capture.configure(str(tmp_path), extension="png", **kwargs)
+    debug_capture.close()
+
+
+@pytest.mark.parametrize('drop_oldest', [True, False])
+def test_full_queue_drops(tmp_path, blocked_writes, drop_oldest):
+    started, release, written = blocked_writes
+    writer = DebugWriter(str(tmp_path), queue_size=2, drop_oldest=drop_oldest, extension="png")
+    assert writer.submit("0", IMAGE)
+    assert started.wait(5)  # The writer holds the first image, so the next two fill the queue
+
+    results = [writer.submit(str(i), IMAGE) for i in range(1, 6)]
+    release.set()
+    writer.stop()
+    if drop_oldest:
+        assert all(results) and written == ["0.png", "4.png", "5.png"]
+    else:
+        assert results == [True, True, False, False, False] and written == ["0.png", "1.png", "2.png"]
+    assert writer.get_stats()['dropped'] == 3
+    assert sorted(os.listdir(tmp_path)) == sorted(written)
+
+
+def test_every_nth_frame_is_saved(tmp_path, capture):
+    capture(every=3)
+
+    def frames():
+        for frame in range(7):
+            debug_capture.begin_frame(frame)
+            assert debug_capture.is_sampled() == (frame % 3 == 0)
+            debug_capture.save('prob', IMAGE, 'Hat')
+
+    run_in_thread(frames)
+    debug_capture.close()
+    assert sorted(os.listdir(tmp_path)) == ["000000_Hat_prob.png", "000003_Hat_prob.png", "000006_Hat_prob.png"]
+
+
+def test_repeated_stages_are_numbered(tmp_path, capture):
+    capture()
+
+    def frames():
+        debug_capture.begin_frame(5)
+        debug_capture.set_component('Hat')
+        for _ in range(3):
+            debug_capture.save('prob', IMAGE)
+        debug_capture.save('morphed', IMAGE)
+        debug_capture.set_pyramid_level(2)
+        debug_capture.save('prob', IMAGE)
+        debug_capture.set_pyramid_level(0)
+        debug_capture.begin_frame(6)
+        debug_capture.save('prob', IMAGE)
+
+    run_in_thread(frames)
+    debug_capture.close()
+    assert sorted(os.listdir(tmp_path)) == ["000005_Hat_morphed.png", "000005_Hat_prob.png",
+                                            "000005_Hat_prob_1.png", "000005_Hat_prob_2.png",
+                                            "000005_Hat_prob_level2.png", "000006_Hat_prob.png"]
+
+
+def test_unnumbered_frames_advance(tmp_path, capture):
+    capture(every=2)
+
+    def frames():
+        for _ in range(4):
+            debug_capture.save('prob', IMAGE, 'Hat')
+            debug_capture.save('morphed', IMAGE, 'Hat')
+        assert len(debug_capture.current.names) == 2
+
+    run_in_thread(frames)
+    debug_capture.close()
+    assert sorted(os.listdir(tmp_path)) == ["000000_Hat_morphed.png", "000000_Hat_prob.png",
+                                            "000002_Hat_morphed.png", "000002_Hat_prob.png"]
+
+
+def test_pyramid_levels_are_named(tmp_path):
+    bgr, _ = make_scene((640, 360), 1, clutter=0)
+    controller = DetectionController(frame_size=None, pyramid_levels=1)
+    controller.model = build_model()
+    controller.select_component("Shirt")
+    controller.set_save_steps(True, str(tmp_path))
+    try:
+        controller.process_frame(bgr)
+    finally:
+        controller.set_save_steps(False)
+
+    files = os.listdir(tmp_path)
+    coarse = [name for name in files if "_level1" in name]
+    assert any(name.startswith("000001_Shirt_prob_level1") for name in coarse)
+    for name in files:
+        shape = cv2.imread(str(tmp_path / name)).shape[:2]
+        assert (shape == (180, 320)) == (name in coarse)
@@ -0,0 +1,130 @@
+import threading
+import time
+import numpy as np
+import cv2
+import pytest
+from frame_capture import ImageFolderSource, FrameGrabber
+
+
+def write_images(directory, count):
+    """
+    Writes uniform images whose value identifies them
+    """
+    files = []
+    for i in range(count):
+        files.append(str(directory / f"{i:03d}.png"))
+        cv2.imwrite(files[-1], np.full((8, 8, 3), 10 * i, dtype=np.uint8))
+    return files
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_source_replays_images(tmp_path):
+    source = ImageFolderSource(str(tmp_path / "*.png"), loop=False)
+    assert not source.isOpened()
+    write_images(tmp_path, 3)
+    source = ImageFolderSource(str(tmp_path), loop=False)
+    values = []
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        values.append(int(frame[0, 0, 0]))
+    assert values == [0, 10, 20]
+    assert not source.isOpened()
+
+
+def test_reader_gets_newest_frame(tmp_path):
+    grabber = FrameGrabber(ImageFolderSource(write_images(tmp_path, 12), loop=False))
+    grabber.start()
+    assert wait_until(lambda: not grabber.is_running())
+
+    ret, frame = grabber.read()
+    assert ret and frame[0, 0, 0] == 110
+    assert grabber.read() == (False, None)
+    stats = grabber.get_stats()
+    assert stats['captured'] == 12 and stats['dropped'] == 11
+
+
+def test_frames_are_read_in_order(tmp_path):
+    grabber = FrameGrabber(ImageFolderSource(write_images(tmp_path, 20), fps=200, loop=False))
+    grabber.start()
+    values = []
+    while grabber.is_running() or grabber.captured > grabber.last_read:
+        ret, frame = grabber.read(timeout=0.1)
+        if ret:
+            values.append(int(frame[0, 0, 0]))
+    grabber.stop()
+
+    assert values == sorted(set(values)) and values[-1] == 190
+    stats = grabber.get_stats()
+    assert stats['captured'] == 20 and stats['dropped'] == 20 - len(values)
+
+
+def test_held_frame_is_not_overwritten(tmp_path):
+    grabber = FrameGrabber(ImageFolderSource(write_images(tmp_path, 5), loop=True), buffer_size=2)
+    grabber.start()
+    ret, frame = grabber.read(timeout=2)
+    assert ret
+    value = int(frame[0, 0, 0])
+    assert wait_until(lambda: grabber.captured > grabber.last_read + 20)
+    assert np.all(frame == value)
+    grabber.stop()
+    assert not grabber.is_running()
+
+
+def test_buffer_needs_two_frames():
+    with pytest.raises(ValueError):
+        FrameGrabber(ImageFolderSource([]), buffer_size=1)
+
+
+class BlockingSource:
+    """
+    Source whose reads block until released
+    """
+    def __init__(self):
+        self.release_read = threading.Event()
+        self.readers = 0
+        self.most_readers = 0
+        self.lock = threading.Lock()
+
+    def isOpened(self):
+        return True
+
+    def read(self, image=None):
+        with self.lock:
+            self.readers += 1
+            self.most_readers = max(self.most_readers, self.readers)
+        self.release_read.wait()
+        with self.lock:
+            self.readers -= 1
+        return True, np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+def test_restart_waits_for_blocked_read(monkeypatch):
+    source = BlockingSource()
+    grabber = FrameGrabber(source)
+    grabber.start()
+    assert wait_until(lambda: source.readers == 1)
+
+    # Still blocked after stop, so it can not be restarted next to it
+    monkeypatch.setattr(grabber.thread, 'join', lambda timeout=None: None)
+    grabber.stop()
+    assert grabber.thread is not None and grabber.is_running()
+    with pytest.raises(RuntimeError):
+        grabber.start()
+    monkeypatch.undo()
+
+    # Once the read returns, the old thread ends and capture restarts with a single reader
+    source.release_read.set()
+    grabber.stop()
+    assert grabber.thread is None
+    grabber.start()
+    assert wait_until(lambda: grabber.captured > 0)
+    grabber.stop()
+    assert source.most_readers == 1
@@ -0,0 +1,113 @@
+import copy
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+import metrics
+from metrics import MetricsRegistry
+from detection_controller import DetectionController
+from benchmarks.scenes import make_scene, build_model
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+
+
+def filled_registry():
+    registry = MetricsRegistry(window=100)
+    for value in range(1, 101):
+        registry.observe('seconds', 'score', 'Hat', value / 1000)
+    registry.observe('count', 'contours', None, 4)
+    registry.observe('count', 'contours', None, 6)
+    registry.frames = 7
+    return registry
+
+
+def test_snapshot():
+    snapshot = filled_registry().snapshot()
+    assert snapshot['frames'] == 7
+    score = snapshot['seconds']['score']['Hat']
+    assert score['count'] == 100 and score['sum'] == pytest.approx(5.05)
+    assert score['p50'] == pytest.approx(np.quantile(np.arange(1, 101) / 1000, 0.5))
+    assert score['p99'] == pytest.approx(np.quantile(np.arange(1, 101) / 1000, 0.99))
+    assert score['max'] == pytest.approx(0.1)
+    assert snapshot['count']['contours']['frame'] == {'count': 2, 'sum': 10, 'mean': 5, 'max': 6, 'p50': 5,
+                                                      'p90': pytest.approx(5.8), 'p99': pytest.approx(5.98)}
+
+
+def test_window_keeps_totals():
+    registry = MetricsRegistry(window=3)
+    for value in (100, 1, 2, 3):
+        registry.observe('count', 'blobs', None, value)
+    summary = registry.snapshot()['count']['blobs']['frame']
+    assert summary['count'] == 4 and summary['sum'] == 106
+    assert summary['max'] == 3 and summary['p50'] == 2
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry(window=10)
+    registry.observe('count', 'contours', None, 4)
+    registry.observe('count', 'contours', None, 6)
+    registry.observe('seconds', 'score', 'Hat', 0.5)
+    registry.frames = 2
+    assert registry.prometheus_text().splitlines() == [
+        '# TYPE leprechaun_frames_total counter',
+        'leprechaun_frames_total 2',
+        '# TYPE leprechaun_stage_count summary',
+        'leprechaun_stage_count{stage="contours",component="frame",quantile="0.5"} 5.0',
+        'leprechaun_stage_count{stage="contours",component="frame",quantile="0.9"} 5.8',
+        'leprechaun_stage_count{stage="contours",component="frame",quantile="0.99"} 5.98',
+        'leprechaun_stage_count_sum{stage="contours",component="frame"} 10.0',
+        'leprechaun_stage_count_count{stage="contours",component="frame"} 2',
+        '# TYPE leprechaun_stage_seconds summary',
+        'leprechaun_stage_seconds{stage="score",component="Hat",quantile="0.5"} 0.5',
+        'leprechaun_stage_seconds{stage="score",component="Hat",quantile="0.9"} 0.5',
+        'leprechaun_stage_seconds{stage="score",component="Hat",quantile="0.99"} 0.5',
+        'leprechaun_stage_seconds_sum{stage="score",component="Hat"} 0.5',
+        'leprechaun_stage_seconds_count{stage="score",component="Hat"} 1',
+    ]
+
+
+def test_log_line_sums_components():
+    registry = MetricsRegistry()
+    registry.observe('seconds', 'score', 'Hat', 0.002)
+    registry.observe('seconds', 'score', 'Beard', 0.001)
+    registry.observe('seconds', 'frame', None, 0.010)
+    registry.observe('count', 'contours', None, 50)
+    registry.frames = 3
+    assert registry.log_line() == "frames=3 frame=10.00ms score=3.00ms"
+
+
+def test_serves_prometheus_text(enabled_metrics):
+    metrics.registry.observe('count', 'contours', None, 4)
+    port = metrics.serve(0)
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+        assert response.headers['Content-Type'].startswith("text/plain")
+        assert response.read().decode() == metrics.registry.prometheus_text()
+    with pytest.raises(urllib.error.HTTPError):
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+
+
+def test_pipeline_records_nothing_when_disabled(enabled_metrics):
+    bgr, _ = make_scene((640, 360), 1)
+    controller = DetectionController(frame_size=None)
+    controller.model = build_model()
+    controller.select_component("Shirt")
+
+    controller.process_frame(bgr)
+    registry = metrics.registry
+    snapshot = metrics.get_snapshot()
+    assert snapshot['frames'] == 1
+    assert 'Shirt' in snapshot['seconds']['morph'] and 'frame' in snapshot['seconds']['frame']
+
+    metrics.disable()
+    assert metrics.get_snapshot() is None and metrics.start() is None
+    before = copy.deepcopy(registry.snapshot())
+    controller.process_frame(bgr)
+    metrics.count('contours', 3)
+    metrics.set_component('Hat')
+    metrics.frame_done()
+    assert registry.snapshot() == before
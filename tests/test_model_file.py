@@ -0,0 +1,64 @@
+import os
+import stat
+import numpy as np
+import pytest
+from benchmarks.scenes import build_model
+from model_file import write_model, read_model, is_mapped_from
+from visual_object import Leprechaun
+
+
+def mapped_arrays(component, filename):
+    """
+    Counts the arrays of a component and its color that are memory mapped from a file
+    """
+    return sum(isinstance(value, np.ndarray) and is_mapped_from(value, filename)
+               for sample in (component, component.color) for value in vars(sample).values())
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / "leprechaun.model")
+    components = build_model().components
+    write_model(filename, components)
+    loaded = read_model(filename)
+    for name, component in components.items():
+        assert np.array_equal(loaded[name].color.data, component.color.data)
+        assert np.array_equal(loaded[name].color.mean, component.color.mean)
+        assert np.array_equal(loaded[name].shapes, component.shapes)
+        assert np.array_equal(loaded[name].exp_poses, component.exp_poses)
+        assert loaded[name].color.slider_stats == component.color.slider_stats
+
+
+def test_saving_over_mapped_file_unmaps_it(tmp_path):
+    # Windows can not replace a file that is still mapped, as when saving a model loaded from the same file
+    filename = str(tmp_path / "leprechaun.model")
+    write_model(filename, build_model().components)
+    components = read_model(filename)
+    assert sum(mapped_arrays(component, filename) for component in components.values()) > 0
+
+    components['Beard'].color.add_data(np.array([10, 200, 200], dtype=np.uint8))
+    write_model(filename, components)
+    assert sum(mapped_arrays(component, filename) for component in components.values()) == 0
+    assert read_model(filename)['Beard'].color.count == components['Beard'].color.count
+
+
+def test_pickled_model_is_not_silently_replaced(tmp_path):
+    (tmp_path / "leprechaun.npy").write_bytes(b"pickled model")
+    with pytest.raises(FileNotFoundError, match="model_file.py"):
+        Leprechaun(str(tmp_path / "leprechaun.model"))
+
+
+@pytest.mark.skipif(os.name != "posix", reason="Permission bits are only kept on POSIX")
+def test_saved_file_follows_umask_and_keeps_mode(tmp_path):
+    filename = str(tmp_path / "leprechaun.model")
+    components = build_model().components
+    umask = os.umask(0o022)
+    try:
+        write_model(filename, components)
+        assert stat.S_IMODE(os.stat(filename).st_mode) == 0o644
+
+        # Saving again keeps permissions set on the file since
+        os.chmod(filename, 0o640)
+        write_model(filename, components)
+        assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+    finally:
+        os.umask(umask)
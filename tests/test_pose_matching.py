@@ -0,0 +1,132 @@
+import numpy as np
+import cv2
+import pytest
+from visual_object import Leprechaun, POSE_TOLERANCE
+
+
+def make_contour(centroid, size):
+    x, y = (int(round(v)) for v in centroid)
+    square = np.array([[x - 3, y - 3], [x + 3, y - 3], [x + 3, y + 3], [x - 3, y + 3]], dtype=np.int32)
+    return {'centroid': np.array(centroid, dtype=np.float64), 'size': float(size), 'contour': square.reshape(-1, 1, 2),
+            'orientation': 0.}
+
+
+def make_model(seed, figures=2, clutter=4):
+    """
+    Builds a model with random taught poses and found contours: figures placed at the taught poses, with some
+    components missing or moved, among random contours
+    """
+    rng = np.random.default_rng(seed)
+    model = Leprechaun(None)
+    for component in model.components.values():
+        component.clear_poses()
+        for _ in range(rng.integers(1, 4)):
+            component.add_pose(np.array([rng.uniform(-2, 2), rng.uniform(-2, 2), rng.uniform(0.2, 1)]))
+        component.found_contours = []
+    model.components["Shirt"].exp_poses[0, :2] = 0  # The shirt is the origin of the object
+
+    for _ in range(figures):
+        beard = rng.uniform(100, 500, 2)
+        angle = rng.uniform(0, 2 * np.pi)
+        dist = rng.uniform(40, 120)
+        shirt = beard + dist * np.array([np.sin(angle), np.cos(angle)])
+        unit = (shirt - beard) / dist
+        for name, component in model.components.items():
+            # Poses near a taught one, some close enough to match
+            pose = component.exp_poses[rng.integers(len(component.exp_poses))] + \
+                rng.uniform(-1.2, 1.2, 3) * POSE_TOLERANCE
+            if name == "Shirt":
+                centroid = shirt
+            elif name == "Beard":
+                centroid = beard
+            elif rng.random() < 0.3:  # Missing, so the figure may only match partly
+                continue
+            else:
+                centroid = shirt + pose[:2] / unit * dist
+            component.found_contours.append(make_contour(centroid, abs(pose[2]) * dist))
+
+    for component in model.components.values():
+        for _ in range(rng.integers(0, clutter)):
+            component.found_contours.append(make_contour(rng.uniform(0, 600, 2), rng.uniform(5, 100)))
+        rng.shuffle(component.found_contours)
+    return model
+
+
+def reference_detections(model):
+    """
+    Matches every shirt and beard pairing one contour and one expected pose at a time, teaching a clicked
+    contour's pose the moment it is reached
+    """
+    exp_poses = {name: list(component.exp_poses) for name, component in model.components.items()}
+    save_size_flag = model.save_size_flag
+    results = []
+    for shirt in model.components["Shirt"].found_contours:
+        for beard in model.components["Beard"].found_contours:
+            obj_vect = shirt['centroid'] - beard['centroid']
+            obj_dist = np.linalg.norm(obj_vect)
+            unit_vector = obj_vect / obj_dist
+            matches = []
+            for name, component in model.components.items():
+                for contour in component.found_contours:
+                    position = (contour['centroid'] - shirt['centroid']) / obj_dist
+                    pose = np.concatenate((unit_vector * position, [contour['size'] / obj_dist]))
+                    if save_size_flag:
+                        point, save_component = save_size_flag
+                        if name == save_component and cv2.pointPolygonTest(contour['contour'], point, False) >= 0:
+                            exp_poses[name].append(pose)
+                            save_size_flag = None
+                    if any(max(np.abs(exp_pose - pose)) < POSE_TOLERANCE for exp_pose in exp_poses[name]):
+                        matches.append((name, id(contour)))
+            results.append((id(shirt), id(beard), matches))
+    return results, exp_poses
+
+
+def vectorized_detections(model):
+    model.min_components = 0
+    model.hypothesis_filters = []
+    results = [(id(detection['shirt']), id(detection['beard']),
+                [(component.component_name, id(contour)) for component, contour in detection['matches']])
+               for detection in model.find_leprechauns()]
+    return results, {name: list(component.exp_poses) for name, component in model.components.items()}
+
+
+def assert_same(model):
+    expected, expected_poses = reference_detections(model)
+    results, poses = vectorized_detections(model)
+    assert results == expected
+    for name in poses:
+        np.testing.assert_allclose(poses[name], expected_poses[name], rtol=1e-12)
+    return results
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_per_pair_reference(seed):
+    assert_same(make_model(seed))
+
+
+def test_scenes_match_fully_and_partly():
+    scores = {len({name for name, _ in matches})
+              for seed in range(20) for _, _, matches in reference_detections(make_model(seed))[0]}
+    assert {1, 2, 3}.issubset(scores)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('name', ["Hat", "Shirt", "Beard"])
+def test_teach_click_matches_per_pair_reference(seed, name):
+    model = make_model(seed)
+    contours = model.components[name].found_contours
+    clicked = contours[len(contours) // 2]
+    model.add_contour(float(clicked['centroid'][0]), float(clicked['centroid'][1]), name)
+    count = len(model.components[name].exp_poses)
+    assert_same(model)
+    assert len(model.components[name].exp_poses) == count + 1
+    assert not model.save_size_flag
+
+
+def test_partial_matches_are_not_detections():
+    model = make_model(3)
+    model.hypothesis_filters = []
+    expected, _ = reference_detections(model)
+    detected = {(id(detection['shirt']), id(detection['beard'])) for detection in model.find_leprechauns()}
+    assert detected == {(shirt, beard) for shirt, beard, matches in expected
+                        if len({name for name, _ in matches}) >= model.min_components}
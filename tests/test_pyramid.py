@@ -0,0 +1,65 @@
+import numpy as np
+import cv2
+import pytest
+from data_sample import MIN_CONTOUR_AREA
+from visual_object import Leprechaun
+from benchmarks.scenes import COLORS, notched_polygon
+
+SHIRT = COLORS['Shirt']
+
+
+def shirt_model(hsv, sample):
+    """
+    Builds a model that only knows the shirt color, sampled from a region of an image
+    """
+    model = Leprechaun(None)
+    x0, y0, x1, y1 = sample
+    color = model.components['Shirt'].color
+    color.add_data_batch(hsv[y0:y1, x0:x1].reshape(-1, 3))
+    color.calculate_stats()
+    color.slider_stats.update({'threshold': 40, 'open': 3, 'close': 5})
+    return model
+
+
+def noisy(bgr, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(bgr + rng.normal(0, 4, bgr.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('levels', [1, 2, 3])
+def test_candidate_regions_cover_small_blobs(levels):
+    # Squares just above the contour area threshold, placed off the sampling grid
+    bgr = np.full((360, 640, 3), 90, dtype=np.uint8)
+    squares = [(37, 45, 20), (141, 203, 22), (269, 77, 24), (405, 251, 30)]
+    for x, y, size in squares:
+        cv2.rectangle(bgr, (x, y), (x + size - 1, y + size - 1), SHIRT, -1)
+    bgr = noisy(bgr)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    model = shirt_model(hsv, (410, 256, 430, 276))
+
+    regions = model.find_candidate_regions(hsv, levels)
+    for x, y, size in squares:
+        assert (size - 1) ** 2 > MIN_CONTOUR_AREA
+        assert any(x0 <= x and y0 <= y and x + size <= x1 and y + size <= y1 for x0, y0, x1, y1 in regions)
+
+
+@pytest.mark.parametrize('levels', [1, 2, 3])
+def test_regions_find_same_contours_as_full_frame(levels):
+    # Notched shapes, which have a defect to analyze, from just above the area threshold up
+    bgr = np.full((360, 640, 3), 90, dtype=np.uint8)
+    for i, radius in enumerate([11, 12, 13, 15, 20, 30]):
+        center = (53 + i * 101, 97 + (i % 3) * 83)
+        cv2.fillPoly(bgr, [notched_polygon(center, radius, 0.5 * i)], SHIRT)
+    bgr = noisy(bgr, 1)
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    model = shirt_model(hsv, (550, 255, 566, 271))  # Inside the largest shape
+    shirt = model.components['Shirt']
+
+    def found():
+        return sorted((tuple(contour['centroid']), contour['size']) for contour in shirt.found_contours)
+
+    model.find_components(hsv)
+    full = found()
+    assert len(full) == 6
+    model.find_components_in_regions(hsv, model.find_candidate_regions(hsv, levels))
+    assert found() == full
@@ -0,0 +1,90 @@
+import cv2
+import pytest
+from detection_controller import DetectionController
+from benchmarks.scenes import make_scene, build_model
+
+
+@pytest.fixture
+def controller(tmp_path):
+    filename = str(tmp_path / "still.png")
+    cv2.imwrite(filename, make_scene((640, 360), 1)[0])
+    controller = DetectionController(frame_size=None)
+    controller.model = build_model()
+    controller.select_component("Shirt")
+    controller.process_from_file(filename)
+    controller.update_image()
+    return controller
+
+
+def assert_hit(controller):
+    stats = controller.get_result_stats()
+    result = controller.update_image()
+    assert controller.get_result_stats() == {'hits': stats['hits'] + 1, 'misses': stats['misses']}
+    return result
+
+
+def assert_miss(controller):
+    stats = controller.get_result_stats()
+    result = controller.update_image()
+    assert controller.get_result_stats() == {'hits': stats['hits'], 'misses': stats['misses'] + 1}
+    return result
+
+
+def test_unchanged_still_is_served_from_cache(controller):
+    first = controller.last_result
+    for _ in range(3):
+        result = assert_hit(controller)
+        assert result is first
+
+
+@pytest.mark.parametrize('slider, value', [('threshold', 30), ('blur', 5), ('open', 7), ('close', 1),
+                                           ('contour threshold', 80)])
+def test_slider_change_misses(controller, slider, value):
+    controller.set_slider(slider, value)
+    _, after = assert_miss(controller)
+    assert_hit(controller)
+
+    # The result matches processing the frame from scratch
+    for component in controller.model.components.values():
+        component.color.clear_cache()
+    fresh = DetectionController(frame_size=None)
+    fresh.model = controller.model
+    fresh.select_component("Shirt")
+    _, expected = fresh.process_frame(controller.bgr_frame)
+    assert (after == expected).all()
+
+
+def test_component_change_misses(controller):
+    _, before = controller.last_result
+    controller.select_component("Beard")
+    _, after = assert_miss(controller)
+    assert (before != after).any()
+    assert_hit(controller)
+    controller.select_component("Shirt")
+    assert_miss(controller)
+
+
+def test_tracking_toggle_misses(controller):
+    controller.set_tracking(True)
+    assert_miss(controller)
+    assert_hit(controller)
+    controller.set_tracking(False)
+    assert_miss(controller)
+
+
+def test_teach_click_misses(controller):
+    x, y = (int(v) for v in controller.model.components["Shirt"].found_contours[0]['centroid'])
+    controller.save_contour(x, y)
+    assert_miss(controller)
+
+
+def test_color_click_misses(controller):
+    controller.handle_click(10, 10)
+    assert_miss(controller)
+    assert_hit(controller)
+
+
+def test_new_frame_misses(controller):
+    controller.bgr_frame = make_scene((640, 360), 1, seed=5)[0]
+    assert_miss(controller)
+    assert_hit(controller)
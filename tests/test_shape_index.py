@@ -0,0 +1,66 @@
+import numpy as np
+import cv2
+import pytest
+from data_sample import ComponentSample, hu_moments, log_hu_moments, shape_distances
+from model_file import write_model, read_model
+from benchmarks.scenes import notched_polygon
+
+
+def make_shapes(seed):
+    """
+    Builds polygons, ellipses and rectangles of random sizes and rotations
+    """
+    rng = np.random.default_rng(seed)
+    shapes = []
+    for _ in range(8):
+        center = (int(rng.integers(100, 300)), int(rng.integers(100, 300)))
+        shapes.append(notched_polygon(center, rng.uniform(10, 80), rng.uniform(0, 6), int(rng.integers(3, 16))))
+        axes = (int(rng.integers(5, 80)), int(rng.integers(5, 80)))
+        shapes.append(cv2.ellipse2Poly(center, axes, int(rng.integers(360)), 0, 360, 10))
+        shapes.append(cv2.boxPoints((center, axes, rng.uniform(0, 90))).astype(np.int32))
+    return [shape.reshape(-1, 1, 2) for shape in shapes]
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_distances_match_match_shapes(seed):
+    models = make_shapes(seed)[:5]
+    candidates = make_shapes(seed + 100)
+    distances = shape_distances(log_hu_moments(hu_moments(models)), hu_moments(candidates))
+    assert distances.shape == (len(models), len(candidates))
+    for i, model in enumerate(models):
+        for j, candidate in enumerate(candidates):
+            expected = cv2.matchShapes(model, candidate, cv2.CONTOURS_MATCH_I3, 0)
+            assert distances[i, j] == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+
+def test_degenerate_shapes_match_match_shapes():
+    # Lines and points have no moments large enough to compare
+    line = np.array([[[0, 0]], [[50, 0]]], dtype=np.int32)
+    point = np.array([[[5, 5]]], dtype=np.int32)
+    square = np.array([[[0, 0]], [[40, 0]], [[40, 40]], [[0, 40]]], dtype=np.int32)
+    shapes = [line, point, square]
+    distances = shape_distances(log_hu_moments(hu_moments(shapes)), hu_moments(shapes))
+    for i, first in enumerate(shapes):
+        for j, second in enumerate(shapes):
+            assert distances[i, j] == cv2.matchShapes(first, second, cv2.CONTOURS_MATCH_I3, 0)
+
+
+def test_no_candidates():
+    assert shape_distances(log_hu_moments(hu_moments(make_shapes(0)[:2])), hu_moments([])).shape == (2, 0)
+
+
+def test_index_follows_shapes(tmp_path):
+    component = ComponentSample(None, "Hat")
+    for shape in make_shapes(1)[:3]:
+        component.add_shape(shape)
+    np.testing.assert_array_equal(component.shape_index[1], log_hu_moments(component.shapes)[1])
+    np.testing.assert_array_equal(component.shape_index[0], log_hu_moments(component.shapes)[0])
+
+    filename = str(tmp_path / "model.model")
+    write_model(filename, {"Hat": component})
+    loaded = read_model(filename)["Hat"]
+    for array, expected in zip(loaded.shape_index, component.shape_index):
+        np.testing.assert_array_equal(array, expected)
+
+    component.clear_shapes()
+    assert component.shape_index[0].shape == (0, 7)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import data_sample
+from data_sample import set_tiles
+from benchmarks.score_paths import make_frame
+
+
+@pytest.fixture
+def tiles():
+    yield set_tiles
+    set_tiles(1)
+
+
+def binarize(color, image, use_table):
+    if use_table:
+        color.get_lut()
+        return color.binarize_image(image)
+    return color.morph(color.threshold_direct(image))
+
+
+@pytest.mark.parametrize('use_table', [True, False])
+@pytest.mark.parametrize('sliders', [{'blur': 0, 'open': 3, 'close': 5}, {'blur': 7, 'open': 5, 'close': 9},
+                                     {'blur': 21, 'open': 11, 'close': 15}])
+@pytest.mark.parametrize('count', [2, 3, 8])
+def test_tiled_matches_untiled(tiles, use_table, sliders, count):
+    image, color = make_frame((1280, 720), seed=2)
+    color.slider_stats.update(sliders)
+    whole = binarize(color, image, use_table)
+
+    tiles(count)
+    tiled = binarize(color, image, use_table)
+    np.testing.assert_array_equal(tiled, whole)
+    assert np.count_nonzero(whole)
+
+
+def test_small_images_are_not_split(tiles):
+    tiles(4)
+    calls = []
+    data_sample.run_tiled(lambda strip: calls.append(strip.shape) or strip, np.zeros((100, 50), np.uint8), 10)
+    assert calls == [(100, 50)]
+
+
+def test_controllers_keep_tiling_unless_given(tiles):
+    from detection_controller import DetectionController
+    tiles(4)
+    pool = data_sample.tile_pool
+    DetectionController(frame_size=None)
+    assert data_sample.tile_count == 4 and data_sample.tile_pool is pool
+    DetectionController(frame_size=None, tiles=2)
+    assert data_sample.tile_count == 2
@@ -0,0 +1,120 @@
+import numpy as np
+import cv2
+import pytest
+from tracker import LeprechaunTracker, detections_box
+from detection_controller import DetectionController
+from benchmarks.scenes import make_scene, build_model
+
+SIZE = (640, 360)
+SHAPE = (SIZE[1], SIZE[0], 3)
+
+
+def detection_at(x0, y0, x1, y1):
+    contour = np.array([[x0, y0], [x1 - 1, y0], [x1 - 1, y1 - 1], [x0, y1 - 1]], dtype=np.int32).reshape(-1, 1, 2)
+    return [{'matches': [(None, {'contour': contour})]}]
+
+
+def test_roi_pads_box():
+    tracker = LeprechaunTracker(padding=0.5, min_padding=10)
+    assert tracker.next_roi(SHAPE) is None
+    tracker.update(detection_at(200, 100, 300, 140))
+    # Padded by half the width, and by the smallest padding where half the height is less
+    assert tracker.next_roi(SHAPE) == (150, 80, 350, 160)
+
+
+def test_roi_follows_velocity():
+    tracker = LeprechaunTracker(padding=0.5, min_padding=10)
+    tracker.update(detection_at(200, 100, 300, 140))
+    tracker.update(detection_at(220, 90, 320, 130))
+    dx, dy = tracker.velocity
+    assert (dx, dy) == (10, -5)
+    # Moved on by the velocity, and padded by the speed too
+    assert tracker.next_roi(SHAPE) == (int(230 - 50 - 10), int(85 - 20 - 5), int(330 + 50 + 10), int(125 + 20 + 5))
+
+
+def test_roi_is_clamped_to_frame():
+    tracker = LeprechaunTracker(padding=0.5, min_padding=10)
+    tracker.update(detection_at(0, 300, 60, 360))
+    tracker.update(detection_at(-20, 320, 40, 380))
+    x0, y0, x1, y1 = tracker.next_roi(SHAPE)
+    assert x0 == 0 and y1 == SIZE[1] and x1 <= SIZE[0]
+
+
+def test_predicted_off_frame_searches_whole_frame():
+    tracker = LeprechaunTracker(min_padding=1)
+    tracker.box = (700, 10, 720, 30)
+    assert tracker.next_roi(SHAPE) is None
+    assert tracker.box is None
+
+
+def test_redetect_interval_forces_whole_frame():
+    tracker = LeprechaunTracker(redetect_interval=3)
+    tracker.update(detection_at(200, 100, 300, 140))
+    rois = []
+    for _ in range(8):
+        rois.append(tracker.next_roi(SHAPE))
+        tracker.update(detection_at(200, 100, 300, 140))
+    assert [roi is None for roi in rois] == [False, False, False, True, False, False, False, True]
+    assert tracker.get_stats()['full_frames'] == 2
+
+
+@pytest.mark.parametrize('max_misses', [1, 3])
+def test_lost_after_misses_and_reacquired(max_misses):
+    tracker = LeprechaunTracker(max_misses=max_misses)
+    tracker.update(detection_at(200, 100, 300, 140))
+    for miss in range(max_misses):
+        assert tracker.next_roi(SHAPE) is not None
+        tracker.update([])
+    assert tracker.get_stats()['lost'] == 1
+    assert tracker.next_roi(SHAPE) is None
+
+    tracker.update(detection_at(400, 200, 450, 260))
+    assert tracker.next_roi(SHAPE) is not None
+    assert tracker.misses == 0
+
+
+def test_detections_box():
+    assert detections_box([]) is None
+    detections = detection_at(10, 20, 30, 40) + detection_at(50, 5, 60, 25)
+    assert detections_box(detections) == (10, 5, 60, 40)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return build_model(SIZE)
+
+
+def moved_scene(dx, dy, noise=4., seed=0):
+    """
+    Draws a leprechaun on a plain background, moved by an offset
+    """
+    bgr, _ = make_scene(SIZE, 1, noise, clutter=0, seed=seed)
+    shift = np.float32([[1, 0, dx], [0, 1, dy]])
+    return cv2.warpAffine(bgr, shift, SIZE, borderMode=cv2.BORDER_CONSTANT, borderValue=(90, 90, 90))
+
+
+def test_tracks_moving_leprechaun(model):
+    controller = DetectionController(frame_size=None)
+    controller.model = model
+    controller.select_component("Shirt")
+    controller.set_tracking(True)
+
+    for frame in range(8):
+        controller.process_frame(moved_scene(12 * frame - 40, 3 * frame))
+        assert controller.detections
+        box = detections_box(controller.detections)
+        roi = controller.get_tracking_stats()['roi']
+        if frame > 0:  # Found inside the region searched
+            assert roi is not None
+            assert roi[0] <= box[0] and roi[1] <= box[1] and box[2] <= roi[2] and box[3] <= roi[3]
+    stats = controller.get_tracking_stats()
+    assert stats['full_frames'] == 1 and stats['tracked_frames'] == 7
+    assert controller.tracker.velocity[0] > 0
+
+    # Lost while the leprechaun is gone, then found again in the whole frame
+    controller.process_frame(np.full(SHAPE, 90, dtype=np.uint8))
+    assert not controller.detections and controller.get_tracking_stats()['lost'] == 1
+    controller.process_frame(moved_scene(30, -10))
+    assert controller.detections and controller.get_tracking_stats()['roi'] is None
+    controller.process_frame(moved_scene(34, -10))
+    assert controller.detections and controller.get_tracking_stats()['roi'] is not None
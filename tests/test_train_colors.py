@@ -0,0 +1,92 @@
+import numpy as np
+import cv2
+import pytest
+from visual_object import Leprechaun
+from train_colors import find_pairs, train_model, merge_reservoir, main
+
+
+@pytest.fixture
+def training_set(tmp_path):
+    """
+    Writes noisy images with random masks for some components, returning every masked pixel by component
+    """
+    rng = np.random.default_rng(0)
+    pixels = {'Hat': [], 'Beard': []}
+    for i in range(4):
+        bgr = rng.integers(0, 256, (60, 80, 3)).astype(np.uint8)
+        cv2.imwrite(str(tmp_path / f"frame{i}.png"), bgr)
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        for name in pixels:
+            if name == 'Beard' and i == 2:  # Not every image has every mask
+                continue
+            mask = (rng.random((60, 80)) < 0.3).astype(np.uint8) * 255
+            cv2.imwrite(str(tmp_path / f"frame{i}_{name}.png"), mask)
+            pixels[name].append(hsv[mask > 0])
+    return tmp_path, {name: np.concatenate(values) for name, values in pixels.items()}
+
+
+def test_pairs(training_set):
+    directory, _ = training_set
+    pairs = find_pairs(str(directory), None, ['Hat', 'Beard', 'Shirt'])
+    assert len(pairs) == 4
+    assert all(set(masks) == ({'Hat'} if image.endswith("frame2.png") else {'Hat', 'Beard'})
+               for image, masks in pairs)
+
+
+def test_statistics_cover_every_masked_pixel(training_set):
+    directory, pixels = training_set
+    model = Leprechaun(None)
+    counts = train_model(model, find_pairs(str(directory), None, list(model.components)), workers=2)
+    for name, expected in pixels.items():
+        color = model.components[name].color
+        assert counts[name] == color.count == color.stats_count == len(expected)
+        np.testing.assert_allclose(color.mean, expected.mean(axis=0, dtype=np.float64), rtol=1e-12)
+        np.testing.assert_allclose(color.sd, expected.std(axis=0, dtype=np.float64), rtol=1e-10)
+        assert sorted(map(tuple, color.data)) == sorted(map(tuple, expected))
+    assert not model.components['Shirt'].color.has_model()
+
+
+@pytest.mark.parametrize('cap', [1, 50, 1000])
+def test_cap_bounds_stored_pixels(training_set, cap):
+    directory, pixels = training_set
+    model = Leprechaun(None)
+    counts = train_model(model, find_pairs(str(directory), None, list(model.components)), cap=cap, workers=2)
+    for name, expected in pixels.items():
+        color = model.components[name].color
+        assert color.count == min(cap, len(expected))
+        assert counts[name] == color.stats_count == len(expected)
+        np.testing.assert_allclose(color.mean, expected.mean(axis=0, dtype=np.float64), rtol=1e-12)
+
+        # Stored pixels are a subsample of the masked ones
+        masked = set(map(tuple, expected))
+        assert all(tuple(pixel) in masked for pixel in color.data)
+
+
+def test_reservoir_keeps_smallest_keys():
+    rng = np.random.default_rng(1)
+    reservoir = None
+    keys, pixels = [], []
+    for _ in range(5):
+        batch_keys = rng.random(30)
+        batch = rng.integers(0, 256, (30, 3))
+        keys.append(batch_keys)
+        pixels.append(batch)
+        reservoir = merge_reservoir(reservoir, batch_keys, batch, 20)
+        assert len(reservoir[0]) <= 20
+    keep = np.argsort(np.concatenate(keys))[:20]
+    assert sorted(reservoir[0]) == sorted(np.concatenate(keys)[keep])
+    assert sorted(map(tuple, reservoir[1])) == sorted(map(tuple, np.concatenate(pixels)[keep]))
+
+
+def test_replace_keeps_sliders(training_set, tmp_path_factory):
+    directory, pixels = training_set
+    model_file = str(tmp_path_factory.mktemp("model") / "leprechaun.model")
+    model = Leprechaun(model_file)
+    model.components['Hat'].color.add_data_batch(np.full((10, 3), 7, dtype=np.uint8))
+    model.components['Hat'].color.slider_stats['threshold'] = 12
+    model.save()
+
+    main([str(directory), '-m', model_file, '--replace', '-j', '2'])
+    color = Leprechaun(model_file).components['Hat'].color
+    assert color.count == len(pixels['Hat'])
+    assert color.slider_stats['threshold'] == 12
@@ -0,0 +1,93 @@
+import time
+import numpy as np
+import cv2
+import pytest
+from frame_capture import VideoReader
+
+FRAMES = 30
+LEVEL = 8  # Brightness step between frames, so each frame's number can be read back after compression
+
+
+@pytest.fixture
+def video(tmp_path):
+    """
+    Writes a video of uniform frames whose brightness gives their frame number
+    """
+    filename = str(tmp_path / "frames.avi")
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV can not write MJPG video")
+    for i in range(FRAMES):
+        writer.write(np.full((48, 64, 3), LEVEL * i, dtype=np.uint8))
+    writer.release()
+    return filename
+
+
+def frame_number(frame):
+    return int(round(frame.mean() / LEVEL))
+
+
+def read_all(reader):
+    positions = []
+    for position, frame in reader.frames():
+        assert frame_number(frame) == position
+        positions.append(position)
+    return positions
+
+
+def wait_for_queue(reader, timeout=2):
+    deadline = time.perf_counter() + timeout
+    while reader.queue.empty() and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return not reader.queue.empty()
+
+
+def test_reads_every_frame(video):
+    reader = VideoReader(video, queue_size=4)
+    assert reader.frame_count == FRAMES
+    assert read_all(reader) == list(range(FRAMES))
+    stats = reader.get_stats()
+    assert stats['finished'] and stats['decoded'] == FRAMES and stats['dropped'] == 0
+    assert reader.read() == (False, None)
+    reader.release()
+
+
+@pytest.mark.parametrize('step', [2, 3, 7])
+def test_step_skips_frames(video, step):
+    reader = VideoReader(video, step=step)
+    assert read_all(reader) == list(range(0, FRAMES, step))
+    stats = reader.get_stats()
+    assert stats['decoded'] + stats['skipped'] == FRAMES
+    reader.release()
+
+
+def test_seek(video):
+    reader = VideoReader(video, queue_size=2)
+    ret, frame = reader.read(timeout=2)
+    assert ret and frame_number(frame) == 0
+
+    assert reader.seek(20) == 20
+    assert read_all(reader) == list(range(20, FRAMES))
+
+    # Seeking back after the end starts over, and seeking past the end stops at the last frame
+    assert reader.seek(5) == 5
+    ret, frame = reader.read(timeout=2)
+    assert ret and frame_number(frame) == 5 and reader.last_position == 5
+    assert reader.seek(FRAMES + 10) == FRAMES - 1
+    assert read_all(reader) == [FRAMES - 1]
+    reader.release()
+
+
+def test_pacing(video):
+    reader = VideoReader(video, fps=2)
+    assert reader.read(timeout=2)[0]
+    assert wait_for_queue(reader)
+    assert reader.read() == (False, None)
+    ret, frame = reader.read(paced=False)
+    assert ret and frame_number(frame) == 1
+    reader.release()
+
+
+def test_missing_video(tmp_path):
+    with pytest.raises(IOError):
+        VideoReader(str(tmp_path / "missing.avi"))
@@ -0,0 +1,113 @@
+import numpy as np
+import cv2
+
+
+def detections_box(detections):
+    """
+    Finds the box around every matching contour of some detections
+    :param detections: Detections from Leprechaun.find_leprechauns
+    :return: Box as x0, y0, x1, y1, None if there are no contours
+    """
+    boxes = [cv2.boundingRect(contour['contour']) for detection in detections
+             for _, contour in detection['matches']]
+    if not boxes:
+        return None
+    boxes = np.array(boxes)
+    return (boxes[:, 0].min(), boxes[:, 1].min(),
+            (boxes[:, 0] + boxes[:, 2]).max(), (boxes[:, 1] + boxes[:, 3]).max())
+
+
+class LeprechaunTracker:
+    """
+    Follows detected leprechauns between frames so only a region around their predicted position is searched.
+    The whole frame is searched periodically and whenever the leprechaun is lost
+    """
+    def __init__(self, redetect_interval=30, padding=0.5, min_padding=24, max_misses=1):
+        """
+        Builds a tracker
+        :param redetect_interval: Frames between searches of the whole frame
+        :param padding: Padding around the predicted box, as a fraction of its size
+        :param min_padding: Smallest padding in pixels
+        :param max_misses: Frames in a row without a detection before the track is lost
+        """
+        self.redetect_interval = redetect_interval
+        self.padding = padding
+        self.min_padding = min_padding
+        self.max_misses = max_misses
+        self.box = None  # Box around the last detection
+        self.velocity = np.zeros(2)  # Movement of the box center in pixels per frame
+        self.misses = 0
+        self.frames_since_full = 0
+        self.last_roi = None
+
+        # Statistics
+        self.full_frames = 0
+        self.tracked_frames = 0
+        self.lost = 0
+
+    def reset(self):
+        """
+        Forgets the current track
+        :return: None
+        """
+        self.box = None
+        self.velocity = np.zeros(2)
+        self.misses = 0
+
+    def next_roi(self, frame_shape):
+        """
+        Picks the region to search in the next frame
+        :param frame_shape: Shape of the frame
+        :return: Region as x0, y0, x1, y1, None to search the whole frame
+        """
+        height, width = frame_shape[:2]
+        if self.box is None or self.frames_since_full >= self.redetect_interval:
+            self.frames_since_full = 0
+            self.full_frames += 1
+            self.last_roi = None
+            return None
+
+        # Predict where the box moved and pad it by its size and speed
+        x0, y0, x1, y1 = self.box
+        dx, dy = self.velocity
+        pad_x = max(self.min_padding, self.padding * (x1 - x0)) + abs(dx)
+        pad_y = max(self.min_padding, self.padding * (y1 - y0)) + abs(dy)
+        roi = (int(max(0, x0 + dx - pad_x)), int(max(0, y0 + dy - pad_y)),
+               int(min(width, x1 + dx + pad_x)), int(min(height, y1 + dy + pad_y)))
+        if roi[2] <= roi[0] or roi[3] <= roi[1]:  # Predicted off the frame
+            self.reset()
+            return self.next_roi(frame_shape)
+
+        self.frames_since_full += 1
+        self.tracked_frames += 1
+        self.last_roi = roi
+        return roi
+
+    def update(self, detections):
+        """
+        Updates the track with the detections of the frame searched
+        :param detections: Detections from Leprechaun.find_leprechauns
+        :return: None
+        """
+        box = detections_box(detections)
+        if box is None:
+            self.misses += 1
+            if self.box is not None and self.misses >= self.max_misses:
+                self.lost += 1
+                self.reset()
+            return
+
+        # Smooth the velocity of the box center
+        if self.box is not None:
+            movement = (np.add(box[:2], box[2:]) - np.add(self.box[:2], self.box[2:])) / 2
+            self.velocity = 0.5 * self.velocity + 0.5 * movement
+        self.box = box
+        self.misses = 0
+
+    def get_stats(self):
+        """
+        Returns tracking statistics
+        :return: Dictionary of frames searched in full and by region, tracks lost and the last region
+        """
+        return {'full_frames': self.full_frames, 'tracked_frames': self.tracked_frames, 'lost': self.lost,
+                'roi': self.last_roi}
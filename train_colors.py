@@ -0,0 +1,180 @@
+"""
+Trains the color model of each component from images and per-component mask images. The mask for component
+<Component> of image <name>.<ext> is <name>_<Component>.png in the mask directory, and every nonzero mask pixel is
+used as a sample of that component's color
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from multiprocessing import Pool
+import numpy as np
+import cv2
+from visual_object import Leprechaun
+
+
+def find_pairs(images, mask_dir, component_names):
+    """
+    Finds the masks available for each image
+    :param images: Directory, glob pattern or list of image files
+    :param mask_dir: Directory with the masks, None to look next to each image
+    :param component_names: Names of the components to find masks for
+    :return: List of image files and dictionaries of mask files by component name
+    """
+    if isinstance(images, str):
+        if os.path.isdir(images):
+            images = os.path.join(images, "*")
+        images = sorted(glob.glob(images))
+
+    pairs = []
+    for image in images:
+        stem = os.path.splitext(os.path.basename(image))[0]
+        if any(stem.endswith("_" + name) for name in component_names):  # A mask next to its image
+            continue
+        directory = os.path.dirname(image) if mask_dir is None else mask_dir
+        masks = {name: os.path.join(directory, f"{stem}_{name}.png") for name in component_names}
+        masks = {name: mask for name, mask in masks.items() if os.path.isfile(mask)}
+        if masks:
+            pairs.append((image, masks))
+    return pairs
+
+
+def masked_pixels(hsv_image, mask):
+    """
+    Extracts the pixels of an image under a mask
+    :param hsv_image: HSV image
+    :param mask: Grayscale mask, nonzero for pixels to extract
+    :return: N x 3 array of pixels
+    """
+    return hsv_image[mask > 0]
+
+
+def sample_pair(task):
+    """
+    Extracts statistics and a random subsample of pixels for each component of an image. Subsamples are kept by
+    the smallest random keys, so merging them keeps a uniform sample over all images
+    :param task: Image file, dictionary of mask files by component, sample cap (None to keep every pixel) and seed
+    :return: Dictionary of pixel count, mean, sum of squared differences, keys and pixels by component
+    """
+    image_file, masks, cap, seed = task
+    bgr_image = cv2.imread(image_file)
+    if bgr_image is None:
+        raise IOError(f"Could not read image {image_file}")
+    hsv_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2HSV)
+    rng = np.random.default_rng(seed)
+
+    samples = dict()
+    for name, mask_file in masks.items():
+        mask = cv2.imread(mask_file, cv2.IMREAD_GRAYSCALE)
+        if mask is None or mask.shape != hsv_image.shape[:2]:
+            raise IOError(f"Mask {mask_file} does not match image {image_file}")
+        pixels = masked_pixels(hsv_image, mask)
+        if len(pixels) == 0:
+            continue
+
+        count = len(pixels)
+        mean = np.mean(pixels, axis=0, dtype=np.float64)
+        m2 = np.sum(np.square(pixels - mean), axis=0)
+        keys = None
+        if cap is not None:
+            keys = rng.random(len(pixels))
+            if len(pixels) > cap:
+                keep = np.argpartition(keys, cap)[:cap]
+                keys = keys[keep]
+                pixels = pixels[keep]
+        samples[name] = (count, mean, m2, keys, pixels)
+    return samples
+
+
+def merge_reservoir(reservoir, keys, pixels, cap):
+    """
+    Merges a subsample into a reservoir, keeping the pixels with the smallest keys
+    :param reservoir: Keys and pixels kept so far, None if empty
+    :param keys: Keys of the new pixels
+    :param pixels: New pixels
+    :param cap: Maximum pixels to keep
+    :return: Merged keys and pixels
+    """
+    if reservoir is not None:
+        keys = np.concatenate((reservoir[0], keys))
+        pixels = np.concatenate((reservoir[1], pixels))
+    if len(keys) > cap:
+        keep = np.argpartition(keys, cap)[:cap]
+        keys = keys[keep]
+        pixels = pixels[keep]
+    return keys, pixels
+
+
+def train_model(model, pairs, cap=None, workers=None, seed=0):
+    """
+    Fits the color model of each component from masked pixels. Statistics use every masked pixel, while only up
+    to cap pixels per component are stored as data
+    :param model: VisualObject to train
+    :param pairs: Image files and dictionaries of mask files by component, from find_pairs
+    :param cap: Maximum pixels to store per component, None to store all of them
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :param seed: Seed for subsampling
+    :return: Dictionary of pixels used per component
+    """
+    tasks = [(image, masks, cap, seed + i) for i, (image, masks) in enumerate(pairs)]
+    counts = dict()  # Pixels used by component
+    stored = dict()  # Pixels or reservoir to store by component
+    with Pool(workers) as pool:
+        for samples in pool.imap_unordered(sample_pair, tasks):
+            for name, (count, mean, m2, keys, pixels) in samples.items():
+                color = model.components[name].color
+                if name not in counts:
+                    counts[name] = 0
+                    stored[name] = None if cap is not None else []
+                counts[name] += count
+                color.merge_stats(count, mean, m2)
+                if cap is None:
+                    stored[name].append(pixels)
+                else:
+                    stored[name] = merge_reservoir(stored[name], keys, pixels, cap)
+
+    for name, pixels in stored.items():
+        color = model.components[name].color
+        pixels = np.concatenate(pixels) if cap is None else pixels[1]
+        color.add_data_batch(pixels, update_stats=False)
+        color.calculate_stats()
+    return counts
+
+
+def main(args=None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('images', help="Directory or glob pattern of training images")
+    parser.add_argument('--masks', help="Directory of mask images, defaults to the image directory")
+    parser.add_argument('-m', '--model', default="leprechaun.model", help="Model file to train and save")
+    parser.add_argument('--cap', type=int, help="Maximum pixels to store per component")
+    parser.add_argument('--replace', action='store_true', help="Discard existing color samples before training, keeping the sliders")
+    parser.add_argument('-j', '--workers', type=int, help="Number of worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for subsampling")
+    args = parser.parse_args(args)
+
+    model = Leprechaun(args.model)
+    pairs = find_pairs(args.images, args.masks, list(model.components.keys()))
+    if not pairs:
+        parser.error("No images with masks found")
+    if args.replace:
+        for component in model.components.values():
+            component.color.clear()
+
+    start = time.perf_counter()
+    counts = train_model(model, pairs, args.cap, args.workers, args.seed)
+    model.save()
+    for name, count in counts.items():
+        color = model.components[name].color
+        print(f"{name}: {count} pixels, {color.count} stored, mean {color.mean}, sd {color.sd}", file=sys.stderr)
+    print(f"Trained from {len(pairs)} images in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
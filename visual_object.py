@@ -1,8 +1,41 @@
-import pickle
 from os import path
 import numpy as np
 import cv2
-from data_sample import ComponentSample, ColorSample
+from data_sample import ComponentSample, ColorSample, ColorLabeler, hsv_index
+from model_file import read_model, write_model
+import metrics
+import debug_capture
+
+POSE_TOLERANCE = .2  # Largest difference in each pose dimension for a contour to match an expected pose
+
+
+def merge_regions(regions, shape, padding):
+    """
+    Pads regions, clips them to an image and merges the ones that overlap
+    :param regions: List of regions as x0, y0, x1, y1
+    :param shape: Shape of the image
+    :param padding: Pixels to pad each side of the regions by
+    :return: List of regions that do not overlap
+    """
+    height, width = shape[:2]
+    merged = [(max(0, x0 - padding), max(0, y0 - padding), min(width, x1 + padding), min(height, y1 + padding))
+              for x0, y0, x1, y1 in regions]
+
+    # Merge pairs of overlapping regions until none overlap
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
 
 
 class VisualObject:
@@ -19,10 +52,17 @@ class VisualObject:
         self.obj_orientation = None
         self.obj_vect = None
         self.origin = None
+        self.labeler = ColorLabeler()  # Binarizes all component colors together
+
+        # A model pickled by an earlier version would be silently replaced by an empty one
+        legacy_file = None if data_file is None else path.splitext(data_file)[0] + ".npy"
+        if legacy_file is not None and not path.isfile(data_file) and path.isfile(legacy_file):
+            raise FileNotFoundError(f"{data_file} not found, but {legacy_file} is a model from an earlier version. "
+                                    f"Convert it with python model_file.py {legacy_file}")
 
         # Read model from file
         if data_file is not None and path.isfile(data_file):
-            self.components = pickle.load(open(data_file, "rb"))
+            self.components = read_model(data_file)
         else:  # Create empty model if needed
             raw_component_data = dict()
 
@@ -66,6 +106,79 @@ class VisualObject:
         # Return full pose
         return np.concatenate((self.obj_unit_vector * scaled_contour_position, [rel_contour_size]))
 
+    @staticmethod
+    def get_contour_poses(contours, origins, unit_vectors, dists):
+        """
+        Gets the poses of contours relative to several object poses at once, as in get_contour_pose
+        :param contours: List of found contours
+        :param origins: P x 2 array of object origins
+        :param unit_vectors: P x 2 array of object unit vectors
+        :param dists: Array of P object sizes
+        :return: P x K x 3 array of poses, for P object poses and K contours
+        """
+        centroids = np.array([contour['centroid'] for contour in contours]).reshape(-1, 2)
+        sizes = np.array([contour['size'] for contour in contours], dtype=np.float64)
+        scaled_positions = (centroids[np.newaxis] - origins[:, np.newaxis]) / dists[:, np.newaxis, np.newaxis]
+        poses = np.empty((len(origins), len(contours), 3))
+        poses[:, :, :2] = unit_vectors[:, np.newaxis] * scaled_positions
+        poses[:, :, 2] = sizes[np.newaxis] / dists[:, np.newaxis]
+        return poses
+
+    @staticmethod
+    def match_poses(poses, exp_poses, tolerance=POSE_TOLERANCE):
+        """
+        Checks which poses are within tolerance of any expected pose in every dimension
+        :param poses: P x K x 3 array of poses
+        :param exp_poses: N x 3 array of expected poses
+        :param tolerance: Largest difference allowed in each dimension
+        :return: P x K boolean array of matches
+        """
+        matched = np.zeros(poses.shape[:2], dtype=bool)
+        if len(exp_poses) == 0:
+            return matched
+
+        # Compare a few object poses at a time to bound the size of the broadcast
+        step = max(1, (1 << 18) // max(1, poses.shape[1] * len(exp_poses)))
+        for start in range(0, len(poses), step):
+            diff = np.abs(poses[start:start + step, :, np.newaxis] - exp_poses)
+            matched[start:start + step] = np.any(np.max(diff, axis=3) < tolerance, axis=2)
+        return matched
+
+    def match_hypotheses(self, origins, unit_vectors, dists):
+        """
+        Finds the contours matching each of several object poses
+        :param origins: P x 2 array of object origins
+        :param unit_vectors: P x 2 array of object unit vectors
+        :param dists: Array of P object sizes
+        :return: List of matching components and contours for each object pose
+        """
+        matches = [[] for _ in range(len(origins))]
+        for component in self.components.values():
+            contours = component.found_contours
+            if not contours:
+                continue
+            poses = self.get_contour_poses(contours, origins, unit_vectors, dists)
+            matched = self.match_poses(poses, component.exp_poses)
+
+            # Save the pose of the clicked contour, relative to the first object pose. It only counts for that
+            # contour and the ones after it, then for every later object pose
+            if self.save_size_flag and len(origins) > 0:
+                point, save_component = self.save_size_flag
+                if component.component_name == save_component:
+                    inside = [cv2.pointPolygonTest(contour['contour'], point, False) >= 0 for contour in contours]
+                    if any(inside):
+                        index = inside.index(True)
+                        new_pose = poses[0, index]
+                        component.add_pose(new_pose)
+                        self.save_size_flag = None
+                        new_matched = self.match_poses(poses, new_pose[np.newaxis])
+                        new_matched[0, :index] = False
+                        matched |= new_matched
+
+            for hypothesis, contour_index in zip(*np.nonzero(matched)):
+                matches[hypothesis].append((component, contours[contour_index]))
+        return matches
+
     def clear_component(self, component_name):
         """
         Clears color for a given component
@@ -75,68 +188,246 @@ class VisualObject:
         self.components[component_name].color = ColorSample(None)
         self.components[component_name].found_contours = []
 
+    def binarize_components(self, hsv_image, frame_id=None):
+        """
+        Binarizes an image for every component's color in a single pass
+        :param hsv_image: HSV image to process
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :return: Dictionary of binary images by component name, None for components without a color model
+        """
+        colors = {name: component.color for name, component in self.components.items()}
+        return self.labeler.binarize_colors(colors, hsv_image, frame_id)
+
+    def find_components(self, hsv_image, frame_id=None, offset=(0, 0)):
+        """
+        Finds the contours of every component in an image
+        :param hsv_image: HSV image to process
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :param offset: Position of the image in the frame, for images cropped to a region of interest
+        :return: Dictionary of binary images by component name, None for components without a color model
+        """
+        binaries = self.binarize_components(hsv_image, frame_id)
+        for name, component in self.components.items():
+            binaries[name] = component.find_components(hsv_image, binaries[name], frame_id, offset)
+        return binaries
+
+    def find_candidate_regions(self, hsv_image, levels, padding=16, frame_id=None):
+        """
+        Finds the regions that could hold components by thresholding a downsampled copy of an image
+        :param hsv_image: HSV image to process
+        :param levels: Pyramid levels to downsample by, each halving the resolution
+        :param padding: Pixels to pad the regions by at full resolution
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :return: List of regions as x0, y0, x1, y1 that do not overlap
+        """
+        scale = 2 ** levels
+        height, width = hsv_image.shape[:2]
+
+        # Nearest neighbor sampling keeps hues from being averaged across the wrap
+        coarse = cv2.resize(hsv_image, (max(1, width // scale), max(1, height // scale)),
+                            interpolation=cv2.INTER_NEAREST)
+        index = hsv_index(coarse)
+        coarse_id = None if frame_id is None else (frame_id, 'coarse')
+
+        regions = []
+        debug_capture.set_pyramid_level(levels)
+        for name, component in self.components.items():
+            if component.color.has_model():
+                metrics.set_component(name)
+                debug_capture.set_component(name)
+                thresholded = component.color.threshold_image(coarse, index, coarse_id)
+                regions += component.find_candidates(thresholded, scale)
+        metrics.set_component(None)
+        debug_capture.set_component(None)
+        debug_capture.set_pyramid_level(0)
+        return merge_regions(regions, hsv_image.shape, padding + scale)
+
+    def find_components_in_regions(self, hsv_image, regions, frame_id=None):
+        """
+        Finds the contours of every component, only searching some regions of an image
+        :param hsv_image: HSV image to process
+        :param regions: List of regions as x0, y0, x1, y1 that do not overlap
+        :param frame_id: Identifies the image for caching, None to skip the cache
+        :return: Dictionary of binary images by component name, empty outside the regions. None for components
+        without a color model
+        """
+        binaries = {name: np.zeros(hsv_image.shape[:2], dtype=np.uint8) if component.color.has_model() else None
+                    for name, component in self.components.items()}
+        found = {name: ([], []) for name in self.components.keys()}
+
+        for region in regions:
+            x0, y0, x1, y1 = region
+            region_id = None if frame_id is None else (frame_id, region)
+            region_binaries = self.find_components(hsv_image[y0:y1, x0:x1], region_id, (x0, y0))
+            for name, component in self.components.items():
+                if region_binaries[name] is not None:
+                    binaries[name][y0:y1, x0:x1] = region_binaries[name]
+                    found[name][0].extend(component.found_contours)
+                    found[name][1].extend(component.overlay_shapes)
+
+        # Keep the contours of all regions
+        for name, component in self.components.items():
+            component.found_contours, component.overlay_shapes = found[name]
+        return binaries
+
     def save(self):
         """
-        Stores to pickle file
+        Stores to the model file
         :return: None
         """
-        pickle.dump(self.components, open(self.data_file, "wb"))
+        write_model(self.data_file, self.components)
+
+    def find_matches(self):
+        """
+        Finds contours that match the current object pose
+        :return: List of matching components and contours
+        """
+        return self.match_hypotheses(np.array([self.origin]), np.array([self.obj_unit_vector]),
+                                     np.array([self.obj_dist]))[0]
 
     def match_components(self, img):
         """
         Draws contours that match the current object pose
         :return: Image with contours drawn on
         """
-        output = img.copy()
-        found_components = set()
-        for component in self.components.values():
-            for contour in component.found_contours:
-                invariant_pose = self.get_contour_pose(contour)
-                if self.save_size_flag:
-                    point, save_component = self.save_size_flag
-                    dist = cv2.pointPolygonTest(contour['contour'], point, False)
-                    if component.component_name == save_component and dist >= 0:  # Point clicked is in contour
-                        component.exp_poses.append(invariant_pose)
-                        self.save_size_flag = None
-                for exp_pose in component.exp_poses:
-                    if max(np.abs(exp_pose - invariant_pose)) < .2:
-                        # Match fit
-                        output = cv2.drawContours(output, [contour['contour']], -1, (0, 0, 255), 3)
-                        found_components.add(component)
-        if len(found_components) > 2:  # Several matching components
+        matches = self.find_matches()
+        if len({component.component_name for component, _ in matches}) > 2:  # Several matching components
+            output = img.copy()
+            for _, contour in matches:
+                output = cv2.drawContours(output, [contour['contour']], -1, (0, 0, 255), 3)
             return output
         else:  # Not enough matching components
             return img
 
 
 class Leprechaun (VisualObject):
-    def __init__(self):
+    def __init__(self, data_file="leprechaun.model"):
         """
         Constructor for the leprechaun
+        :param data_file: File name to read and save model data
         """
-        super().__init__("leprechaun.npy", ["Beard", "Hat", "Shirt", "Clover", "Skin"])
+        super().__init__(data_file, ["Beard", "Hat", "Shirt", "Clover", "Skin"])
+        self.min_components = 3  # Matching components needed for a detection
+        self.min_object_dist = 1  # Smallest shirt to beard distance in pixels
 
-    def find_leprechaun(self, img):
+        # Cheap checks run on every shirt and beard pairing before matching all components. Each takes the
+        # hypotheses from build_hypotheses and returns a boolean array of the ones to keep
+        self.hypothesis_filters = [self.reject_unreachable, self.reject_degenerate, self.reject_by_size]
+
+    def build_hypotheses(self):
         """
-        Finds a leprechaun in the image
-        :param img: Image to search
-        :return: Image with leprechaun overlay
+        Builds the object pose for every shirt and beard pairing
+        :return: Dictionary of arrays with the shirt and beard index, origin, unit vector and size of each
+        pairing, in shirt major order. None if there are no pairings
         """
-        output = img.copy()
         shirts = self.components["Shirt"].found_contours
         beards = self.components["Beard"].found_contours
+        if not shirts or not beards:
+            return None
 
-        for shirt in shirts:
-            for beard in beards:
-                self.obj_vect = shirt['centroid'] - beard['centroid']
-                self.obj_dist = np.linalg.norm(self.obj_vect)
-                self.obj_orientation = np.arctan2(self.obj_vect[0], self.obj_vect[1])
-                self.obj_unit_vector = self.obj_vect / self.obj_dist
-                self.origin = shirt["centroid"]
+        shirt_centroids = np.array([shirt['centroid'] for shirt in shirts])
+        beard_centroids = np.array([beard['centroid'] for beard in beards])
+        obj_vects = (shirt_centroids[:, np.newaxis] - beard_centroids[np.newaxis]).reshape(-1, 2)
+        obj_dists = np.linalg.norm(obj_vects, axis=1)
+        shirt_index, beard_index = np.divmod(np.arange(len(obj_vects)), len(beards))
+        return {'shirt': shirt_index, 'beard': beard_index, 'origins': shirt_centroids[shirt_index],
+                'unit_vectors': obj_vects / obj_dists[:, np.newaxis], 'dists': obj_dists}
+
+    def reject_unreachable(self, hypotheses):
+        """
+        Rejects every pairing if too few components could match at all
+        :param hypotheses: Hypotheses from build_hypotheses
+        :return: Boolean array of hypotheses to keep
+        """
+        possible = sum(1 for component in self.components.values()
+                       if component.found_contours and len(component.exp_poses) > 0)
+        return np.full(len(hypotheses['dists']), possible >= self.min_components)
+
+    def reject_degenerate(self, hypotheses):
+        """
+        Rejects pairings where the shirt and beard are too close to define an object pose
+        :param hypotheses: Hypotheses from build_hypotheses
+        :return: Boolean array of hypotheses to keep
+        """
+        return hypotheses['dists'] >= self.min_object_dist
+
+    def reject_by_size(self, hypotheses):
+        """
+        Rejects pairings where the shirt or beard size relative to their distance is not close to any taught pose
+        :param hypotheses: Hypotheses from build_hypotheses
+        :return: Boolean array of hypotheses to keep
+        """
+        keep = np.ones(len(hypotheses['dists']), dtype=bool)
+        for name, key in (("Shirt", 'shirt'), ("Beard", 'beard')):
+            component = self.components[name]
+            if len(component.exp_poses) == 0:  # Nothing taught to compare with
+                continue
+            sizes = np.array([contour['size'] for contour in component.found_contours])[hypotheses[key]]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rel_sizes = sizes / hypotheses['dists']
+            keep &= np.any(np.abs(rel_sizes[:, np.newaxis] - component.exp_poses[:, 2]) < POSE_TOLERANCE, axis=1)
+        return keep
 
-                output = self.match_components(output)
+    def find_leprechauns(self):
+        """
+        Finds leprechauns from the contours found for each component. Pairings of shirts and beards are checked
+        with the hypothesis filters first, and only the ones left are matched against every component
+        :return: List of detections, with the shirt and beard they were found from, the matching contours and
+        the number of matching components
+        """
+        detections = []
+        started = metrics.start()
+        hypotheses = self.build_hypotheses()
+        if hypotheses is None:
+            return detections
+
+        # Teaching a pose needs the first pairing, so only filter when not teaching
+        if not self.save_size_flag:
+            keep = np.ones(len(hypotheses['dists']), dtype=bool)
+            for hypothesis_filter in self.hypothesis_filters:
+                keep &= hypothesis_filter(hypotheses)
+                if not keep.any():
+                    metrics.stop(started, 'hypotheses')
+                    return detections
+            hypotheses = {key: values[keep] for key, values in hypotheses.items()}
+        metrics.stop(started, 'hypotheses')
+        metrics.count('hypotheses', len(hypotheses['dists']))
+
+        started = metrics.start()
+
+        shirts = self.components["Shirt"].found_contours
+        beards = self.components["Beard"].found_contours
+        all_matches = self.match_hypotheses(hypotheses['origins'], hypotheses['unit_vectors'], hypotheses['dists'])
+        for shirt, beard, matches in zip(hypotheses['shirt'], hypotheses['beard'], all_matches):
+            score = len({component.component_name for component, _ in matches})
+            if score >= self.min_components:  # Several matching components
+                detections.append({'shirt': shirts[shirt], 'beard': beards[beard], 'matches': matches,
+                                   'score': score})
+        metrics.stop(started, 'pose_match')
+        return detections
+
+    @staticmethod
+    def draw_detections(img, detections):
+        """
+        Draws the matching contours of detections
+        :param img: Image to draw on
+        :param detections: Detections from find_leprechauns
+        :return: Copy of the image with the overlay
+        """
+        output = img.copy()
+        for detection in detections:
+            for _, contour in detection['matches']:
+                output = cv2.drawContours(output, [contour['contour']], -1, (0, 0, 255), 3)
         return output
 
+    def find_leprechaun(self, img):
+        """
+        Finds a leprechaun in the image
+        :param img: Image to search
+        :return: Image with leprechaun overlay
+        """
+        return self.draw_detections(img, self.find_leprechauns())
+
     def save_debug(self, bgr_image):
         """
         Saves an image with progress for debugging